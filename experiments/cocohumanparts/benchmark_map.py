@@ -0,0 +1,211 @@
+import io
+import json
+import time
+import argparse
+import numpy as np
+from contextlib import redirect_stdout
+from typing import Dict, List, Tuple
+from od_engine.utils.coco_map import CocoEvaluator
+from od_engine.utils.synthetic import CATEGORIES, humanparts_coco, parts_coco
+
+# Image sizes of the synthetic validation set, as width and height, typical of COCO
+VAL_SIZES = ((640, 480), (480, 640), (640, 427), (500, 375), (427, 640))
+# The summary metrics of pycocotools, in the order of COCOeval.stats
+STATS_KEYS = (
+    "map",
+    "map_50",
+    "map_75",
+    "map_small",
+    "map_medium",
+    "map_large",
+    "mar_1",
+    "mar_10",
+    "mar_100",
+    "mar_small",
+    "mar_medium",
+    "mar_large",
+)
+
+
+def synthetic_val_set(
+    num_images: int, max_detections: int = 100, seed: int = 0
+) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Generates the ground truth of a COCO Human Parts validation set and detections of a
+    plausible model: jittered copies of most boxes with higher scores, and low scoring false
+    positives up to the detection limit.
+
+    Args:
+        num_images (int): The number of images.
+        max_detections (int, optional): The detections per image. Defaults to 100.
+        seed (int, optional): The random seed. Defaults to 0.
+
+    Returns:
+        Tuple[List[Dict], List[Dict]]: The detections and ground truth of every image, with
+            x_min, y_min, x_max, y_max boxes and labels from 0.
+    """
+    rng = np.random.default_rng(seed)
+    coco = parts_coco(humanparts_coco(num_images * 4, sizes=VAL_SIZES, seed=seed))
+    images = {image["id"]: image for image in coco["images"]}
+    boxes = {image_id: [] for image_id in images}
+    labels = {image_id: [] for image_id in images}
+    for anno in coco["annotations"]:
+        x, y, w, h = anno["bbox"]
+        boxes[anno["image_id"]].append([x, y, x + w, y + h])
+        labels[anno["image_id"]].append(anno["category_id"] - 1)
+
+    preds, target = [], []
+    for image_id, image in images.items():
+        gt_boxes = np.array(boxes[image_id]).reshape(-1, 4)
+        gt_labels = np.array(labels[image_id], dtype=np.int64)
+        found = rng.random(len(gt_boxes)) < 0.85
+        size = np.tile(gt_boxes[found, 2:] - gt_boxes[found, :2], 2)
+        tp_boxes = gt_boxes[found] + rng.normal(0, 0.08, (found.sum(), 4)) * size
+        num_fp = max(0, max_detections - len(tp_boxes))
+        xy = rng.random((num_fp, 2)) * (image["width"], image["height"])
+        wh = rng.uniform(4, 200, (num_fp, 2))
+        dt_boxes = np.concatenate([tp_boxes, np.concatenate([xy, xy + wh], axis=1)])
+        dt_boxes[:, 2:] = np.maximum(dt_boxes[:, 2:], dt_boxes[:, :2] + 1)
+        preds.append(
+            {
+                "boxes": dt_boxes,
+                "scores": np.concatenate(
+                    [rng.uniform(0.3, 1.0, len(tp_boxes)), rng.uniform(0.0, 0.5, num_fp)]
+                ),
+                "labels": np.concatenate(
+                    [gt_labels[found], rng.integers(0, len(CATEGORIES), num_fp)]
+                ),
+            }
+        )
+        target.append({"boxes": gt_boxes, "labels": gt_labels})
+    return preds, target
+
+
+def run_fast(preds: List[Dict], target: List[Dict], batch_size: int) -> Tuple[Dict, Dict]:
+    """Evaluates with `CocoEvaluator`, updating it batch by batch as a validation loop does."""
+    evaluator = CocoEvaluator()
+    start = time.perf_counter()
+    for i in range(0, len(preds), batch_size):
+        evaluator.update(preds[i : i + batch_size], target[i : i + batch_size])
+    updated = time.perf_counter()
+    result = evaluator.compute()
+    computed = time.perf_counter()
+    return result, {"update": updated - start, "compute": computed - updated}
+
+
+def run_pycocotools(preds: List[Dict], target: List[Dict]) -> Tuple[np.ndarray, Dict]:
+    """Evaluates with pycocotools COCOeval, from the in-memory ground truth and detections."""
+    from pycocotools.coco import COCO
+    from pycocotools.cocoeval import COCOeval
+
+    start = time.perf_counter()
+    images, annotations, detections = [], [], []
+    for image_id, (pred, gt) in enumerate(zip(preds, target)):
+        images.append({"id": image_id})
+        for box, label in zip(gt["boxes"].tolist(), gt["labels"].tolist()):
+            w, h = box[2] - box[0], box[3] - box[1]
+            annotations.append(
+                {
+                    "id": len(annotations) + 1,
+                    "image_id": image_id,
+                    "category_id": label,
+                    "bbox": [box[0], box[1], w, h],
+                    "area": w * h,
+                    "iscrowd": 0,
+                }
+            )
+        for box, score, label in zip(
+            pred["boxes"].tolist(), pred["scores"].tolist(), pred["labels"].tolist()
+        ):
+            detections.append(
+                {
+                    "image_id": image_id,
+                    "category_id": label,
+                    "bbox": [box[0], box[1], box[2] - box[0], box[3] - box[1]],
+                    "score": score,
+                }
+            )
+    labels = sorted(
+        {a["category_id"] for a in annotations} | {d["category_id"] for d in detections}
+    )
+    with redirect_stdout(io.StringIO()):
+        coco_gt = COCO()
+        coco_gt.dataset = {
+            "images": images,
+            "annotations": annotations,
+            "categories": [{"id": label} for label in labels],
+        }
+        coco_gt.createIndex()
+        coco_dt = coco_gt.loadRes(detections)
+        converted = time.perf_counter()
+        coco_eval = COCOeval(coco_gt, coco_dt, "bbox")
+        coco_eval.evaluate()
+        coco_eval.accumulate()
+        coco_eval.summarize()
+    computed = time.perf_counter()
+    return coco_eval.stats, {"convert": converted - start, "compute": computed - converted}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Time the vectorised COCO mAP evaluator on a synthetic validation set."
+    )
+    parser.add_argument(
+        "--num_images", type=int, default=5000, help="Images of the validation set"
+    )
+    parser.add_argument(
+        "--max_detections", type=int, default=100, help="Detections per image"
+    )
+    parser.add_argument(
+        "--batch_size", type=int, default=16, help="Images per update, as the val batch size"
+    )
+    parser.add_argument("--repeats", type=int, default=3, help="Timed runs, the best is kept")
+    parser.add_argument(
+        "--no_pycocotools", action="store_true", help="Skip the pycocotools comparison"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("--output", type=str, default=None, help="JSON results file")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    preds, target = synthetic_val_set(args.num_images, args.max_detections, args.seed)
+    num_gt = sum(len(t["labels"]) for t in target)
+    num_dt = sum(len(p["labels"]) for p in preds)
+    print(
+        f"Generated {args.num_images} images with {num_gt} boxes and {num_dt} detections "
+        f"in {time.perf_counter() - start:.1f}s"
+    )
+
+    runs = [run_fast(preds, target, args.batch_size) for _ in range(args.repeats)]
+    result, timings = min(runs, key=lambda run: sum(run[1].values()))
+    fast_seconds = sum(timings.values())
+    print(
+        f"CocoEvaluator: {fast_seconds:.2f}s (update {timings['update']:.2f}s, "
+        f"compute {timings['compute']:.2f}s), map {result['map']:.4f}, "
+        f"map_50 {result['map_50']:.4f}"
+    )
+    report = {
+        "num_images": args.num_images,
+        "boxes": num_gt,
+        "detections": num_dt,
+        "fast": {"seconds": timings, "stats": {k: result[k] for k in STATS_KEYS}},
+    }
+
+    if not args.no_pycocotools:
+        stats, ref_timings = run_pycocotools(preds, target)
+        ref_seconds = ref_timings["compute"]
+        diff = max(abs(result[k] - float(v)) for k, v in zip(STATS_KEYS, stats))
+        print(
+            f"pycocotools: {ref_seconds:.2f}s (plus {ref_timings['convert']:.2f}s to build the "
+            f"COCO objects), speedup {ref_seconds / fast_seconds:.1f}x, "
+            f"largest metric difference {diff:.2e}"
+        )
+        report["pycocotools"] = {
+            "seconds": ref_timings,
+            "stats": dict(zip(STATS_KEYS, map(float, stats))),
+            "max_abs_diff": diff,
+        }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,202 @@
+import os
+import json
+import glob
+import argparse
+import tempfile
+import threading
+import itertools
+import numpy as np
+from typing import Dict, List, Sequence
+from od_engine.utils.imcache import read_image
+from od_engine.utils.serving import InferenceServer, load_model
+from od_engine.utils.synthetic import CATEGORIES
+
+# Image sizes of the synthetic requests, as width and height, typical of COCO
+VAL_SIZES = ((640, 480), (480, 640), (640, 427), (500, 375), (427, 640))
+
+
+def tiny_detector(
+    path: str, input_size: Sequence[int] = (320, 320), num_detections: int = 100, seed: int = 0
+) -> str:
+    """
+    Saves a tiny OpenVINO IR with the interface of an OTX YOLOX export, to test the serving
+    stack without a trained model: a dynamic batch "image" input, N x K x 5 "boxes" with the
+    score last and N x K "labels", and the ``model_info`` metadata of a letterboxed model.
+
+    A few strided convolutions with random weights stand for the backbone, so the cost grows
+    with the batch like a real model's, and a linear head turns their pooled features into boxes
+    spread over the input.
+
+    Args:
+        path (str): The .xml file to write, with its .bin next to it.
+        input_size (Sequence[int], optional): The height and width of the input. Defaults to
+            (320, 320).
+        num_detections (int, optional): The K detections per image. Defaults to 100.
+        seed (int, optional): The random seed of the weights. Defaults to 0.
+
+    Returns:
+        str: The path.
+    """
+    import openvino as ov
+    from openvino import opset13 as ops
+
+    rng = np.random.default_rng(seed)
+    height, width = input_size
+    image = ops.parameter([-1, 3, height, width], np.float32, name="image")
+    features, channels = image, 3
+    for out_channels in (16, 32, 64, 64):
+        weights = rng.normal(0, (2 / (9 * channels)) ** 0.5, (out_channels, channels, 3, 3))
+        features = ops.relu(
+            ops.convolution(
+                features, ops.constant(weights.astype(np.float32)), [2, 2], [1, 1], [1, 1], [1, 1]
+            )
+        )
+        channels = out_channels
+    pooled = ops.reduce_mean(features, ops.constant(np.int64([2, 3])), keep_dims=False)
+    head = rng.normal(0, 1, (channels, num_detections * 6)).astype(np.float32)
+    logits = ops.matmul(pooled, ops.constant(head), False, False)
+    raw = ops.sigmoid(ops.reshape(logits, [-1, num_detections, 6], True))
+
+    def channel(start, stop):
+        return ops.slice(raw, np.int64([start]), np.int64([stop]), np.int64([1]), np.int64([2]))
+
+    size = np.float32([width, height])
+    top_left = ops.multiply(channel(0, 2), ops.constant(size * 0.8))
+    bottom_right = ops.add(top_left, ops.multiply(channel(2, 4), ops.constant(size * 0.2)))
+    boxes = ops.concat([top_left, bottom_right, channel(4, 5)], axis=2)
+    labels = ops.convert(
+        ops.floor(ops.multiply(channel(5, 6), ops.constant(np.float32(len(CATEGORIES) - 0.01)))),
+        "i64",
+    )
+    labels = ops.reshape(labels, [0, num_detections], True)
+    boxes.output(0).get_tensor().set_names({"boxes"})
+    labels.output(0).get_tensor().set_names({"labels"})
+
+    model = ov.Model([boxes, labels], [image], "tiny_detector")
+    model_info = {
+        "model_type": "ssd",
+        "mean_values": "0.0 0.0 0.0",
+        "scale_values": "1.0 1.0 1.0",
+        "resize_type": "fit_to_window_letterbox",
+        "pad_value": "114",
+        "reverse_input_channels": "True",
+        "labels": " ".join(category["name"] for category in CATEGORIES),
+        "confidence_threshold": "0.3",
+        "iou_threshold": "0.65",
+    }
+    for key, value in model_info.items():
+        model.set_rt_info(value, ["model_info", key])
+    ov.save_model(model, path)
+    return path
+
+
+def request_images(image_dir: str, num_images: int, seed: int = 0) -> List[np.ndarray]:
+    """Reads the images of a directory, or generates noise images of COCO sizes."""
+    if image_dir:
+        files = sorted(glob.glob(os.path.join(image_dir, "*.jpg")))[:num_images]
+        return [read_image(f) for f in files]
+    rng = np.random.default_rng(seed)
+    return [
+        rng.integers(0, 256, (h, w, 3), dtype=np.uint8)
+        for w, h in itertools.islice(itertools.cycle(VAL_SIZES), num_images)
+    ]
+
+
+def run_load(
+    server: InferenceServer, images: List[np.ndarray], num_requests: int, concurrency: int
+) -> Dict:
+    """
+    Sends requests from concurrent clients, each waiting for its result before sending the
+    next one, and returns the server stats of the run.
+    """
+    counter = itertools.count()
+
+    def client():
+        for i in iter(lambda: next(counter), None):
+            if i >= num_requests:
+                return
+            server.detect(images[i % len(images)])
+
+    server.reset_stats()
+    clients = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    return server.stats()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measure the latency and throughput of the inference server by batching."
+    )
+    parser.add_argument(
+        "--model",
+        type=str,
+        default=None,
+        help="OpenVINO .xml or .onnx file, a tiny random detector if unset",
+    )
+    parser.add_argument(
+        "--input_size", type=int, default=320, help="Input size of the tiny detector"
+    )
+    parser.add_argument(
+        "--images", type=str, default=None, help="Directory of .jpg requests, noise if unset"
+    )
+    parser.add_argument("--num_images", type=int, default=32, help="Distinct request images")
+    parser.add_argument("--requests", type=int, default=400, help="Requests per setting")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent clients")
+    parser.add_argument(
+        "--batch_sizes", type=int, nargs="+", default=[1, 2, 4, 8], help="Max batch sizes"
+    )
+    parser.add_argument(
+        "--wait_ms", type=float, nargs="+", default=[0.0, 2.0, 10.0], help="Max wait times"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=min(4, os.cpu_count()), help="Preprocessing threads"
+    )
+    parser.add_argument(
+        "--num_threads", type=int, default=None, help="Inference threads, all cores if unset"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("--output", type=str, default=None, help="JSON results file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        model_path = args.model or tiny_detector(
+            os.path.join(tmp_dir, "tiny_detector.xml"),
+            (args.input_size, args.input_size),
+            seed=args.seed,
+        )
+        model = load_model(model_path, args.num_threads)
+    images = request_images(args.images, args.num_images, args.seed)
+    print(
+        f"{model_path}, input {model.input_size}, {len(images)} images, "
+        f"{args.concurrency} clients, {args.requests} requests per setting"
+    )
+
+    results = []
+    print(
+        f"  {'batch':>5} {'wait':>6} {'p50':>8} {'p90':>8} {'p99':>8} {'img/s':>8} "
+        f"{'mean batch':>10} {'busy':>5}"
+    )
+    for max_batch_size, max_wait_ms in itertools.product(args.batch_sizes, args.wait_ms):
+        with InferenceServer(
+            model,
+            max_batch_size=max_batch_size,
+            max_wait_ms=max_wait_ms,
+            preprocess_workers=args.workers,
+        ) as server:
+            run_load(server, images, 2 * args.concurrency, args.concurrency)  # Warm up
+            stats = run_load(server, images, args.requests, args.concurrency)
+        results.append({"max_batch_size": max_batch_size, "max_wait_ms": max_wait_ms, **stats})
+        print(
+            f"  {max_batch_size:>5} {max_wait_ms:>4.1f}ms {stats['p50_ms']:>6.1f}ms "
+            f"{stats['p90_ms']:>6.1f}ms {stats['p99_ms']:>6.1f}ms {stats['throughput']:>8.1f} "
+            f"{stats['mean_batch_size']:>10.2f} {stats['model_busy']:>5.0%}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {"model": args.model, "concurrency": args.concurrency, "runs": results}, f, indent=2
+            )
@@ -0,0 +1,247 @@
+import os
+import json
+import time
+import argparse
+import numpy as np
+from collections import defaultdict
+from itertools import islice
+from multiprocessing import get_context
+from queue import Empty
+from typing import Dict, List, Optional, Tuple
+from od_engine.utils.coco_stream import iter_coco_array
+from od_engine.utils.otx_data import SUBSETS, build_transforms, load_config, make_det_entity
+
+# Image sizes of the synthetic samples, as width and height, typical of COCO
+SYNTHETIC_SIZES = ((640, 480), (480, 640), (640, 427), (500, 375), (427, 640))
+SYNTHETIC_BOXES = 12  # Boxes per synthetic sample, about a COCO Human Parts image
+
+
+def synthetic_samples(
+    count: int, num_classes: int, seed: int = 0
+) -> List[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Generates noise images of COCO sizes with random boxes.
+
+    Args:
+        count (int): The number of samples.
+        num_classes (int): The number of classes of the labels.
+        seed (int, optional): The random seed. Defaults to 0.
+
+    Returns:
+        List[Tuple[np.ndarray, np.ndarray, np.ndarray]]: The images, xyxy boxes and labels.
+    """
+    rng = np.random.default_rng(seed)
+    samples = []
+    for i in range(count):
+        width, height = SYNTHETIC_SIZES[i % len(SYNTHETIC_SIZES)]
+        image = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+        xy = rng.random((SYNTHETIC_BOXES, 2)) * (width * 0.8, height * 0.8)
+        wh = rng.uniform(0.05, 0.2, (SYNTHETIC_BOXES, 2)) * (width, height)
+        boxes = np.concatenate([xy, xy + wh], axis=1).astype(np.float32)
+        samples.append((image, boxes, rng.integers(0, num_classes, SYNTHETIC_BOXES)))
+    return samples
+
+
+def real_samples(
+    data_root: str, subset_name: str, count: int
+) -> List[Tuple[str, np.ndarray, np.ndarray]]:
+    """
+    Reads the first images of a COCO format subset with their boxes, leaving the decoding to the
+    benchmark.
+
+    Args:
+        data_root (str): The dataset directory with images/<subset> and annotations.
+        subset_name (str): The subset, e.g. train.
+        count (int): The number of samples.
+
+    Returns:
+        List[Tuple[str, np.ndarray, np.ndarray]]: The image paths, xyxy boxes and labels.
+    """
+    anno_file = os.path.join(data_root, "annotations", f"instances_{subset_name}.json")
+    images = list(islice(iter_coco_array(anno_file, "images"), count))
+    labels = {c["id"]: i for i, c in enumerate(iter_coco_array(anno_file, "categories"))}
+    annos = defaultdict(list)
+    ids = {image["id"] for image in images}
+    for anno in iter_coco_array(anno_file, "annotations"):
+        if anno["image_id"] in ids:
+            annos[anno["image_id"]].append(anno)
+    samples = []
+    for image in images:
+        boxes = np.array([a["bbox"] for a in annos[image["id"]]], dtype=np.float32)
+        boxes = boxes.reshape(-1, 4)
+        boxes[:, 2:] += boxes[:, :2]
+        samples.append(
+            (
+                os.path.join(data_root, "images", subset_name, image["file_name"]),
+                boxes,
+                np.array([labels[a["category_id"]] for a in annos[image["id"]]]),
+            )
+        )
+    return samples
+
+
+def _worker(args, worker_id, barrier, queue):
+    """Runs the pipeline on samples in one process and sends the timings of every stage."""
+    import cv2
+    import torch
+
+    # Dataloader workers run single threaded
+    torch.set_num_threads(1)
+    config = load_config(args.config)
+    data = config["data"]
+    subset = data[args.subset]
+    transforms = build_transforms(config, args.subset).transforms
+    names = [f"{i:02d} {type(t).__name__}" for i, t in enumerate(transforms)]
+    color = data.get("image_color_channel", "BGR")
+    if args.real:
+        samples = real_samples(args.data_root or config["data_root"], subset["subset_name"], 64)
+    else:
+        samples = synthetic_samples(32, args.num_classes, seed=worker_id)
+
+    timings = defaultdict(list)
+
+    def run(index):
+        image, boxes, labels = samples[index % len(samples)]
+        if isinstance(image, np.ndarray):
+            # Transforms may change the image in place
+            image = image.copy()
+        start = time.perf_counter()
+        if isinstance(image, str):
+            image = cv2.imread(image, cv2.IMREAD_COLOR)
+            if color == "RGB":
+                image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+            timings["decode"].append(time.perf_counter() - start)
+            start = time.perf_counter()
+        entity = make_det_entity(image, boxes, labels, index, color, subset.get("to_tv_image"))
+        timings["entity"].append(time.perf_counter() - start)
+        for name, transform in zip(names, transforms):
+            start = time.perf_counter()
+            entity = transform(entity)
+            timings[name].append(time.perf_counter() - start)
+            if entity is None:
+                break
+
+    for i in range(args.warmup):
+        run(i)
+    timings.clear()
+    barrier.wait()
+    start = time.time()
+    for i in range(args.num_samples):
+        run(i)
+    queue.put({"start": start, "end": time.time(), "timings": dict(timings)})
+
+
+def benchmark(args, workers: int) -> Dict:
+    """
+    Runs the pipeline in parallel worker processes, as a dataloader with that many workers does.
+
+    Args:
+        args (argparse.Namespace): The command line arguments.
+        workers (int): The number of worker processes.
+
+    Returns:
+        Dict: The samples/s of all workers and the latency percentiles of every stage in ms.
+    """
+    ctx = get_context("spawn")
+    barrier, queue = ctx.Barrier(workers), ctx.Queue()
+    processes = [
+        ctx.Process(target=_worker, args=(args, i, barrier, queue)) for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    results = []
+    try:
+        while len(results) < workers:
+            try:
+                results.append(queue.get(timeout=1))
+            except Empty:
+                failed = [p.exitcode for p in processes if p.exitcode not in (None, 0)]
+                if failed:
+                    raise RuntimeError(f"A benchmark worker exited with code {failed[0]}")
+    finally:
+        for process in processes:
+            if len(results) < workers:
+                process.terminate()
+            process.join()
+
+    seconds = max(r["end"] for r in results) - min(r["start"] for r in results)
+    stages = {}
+    names = dict.fromkeys(name for r in results for name in r["timings"])
+    for name in names:
+        values = np.concatenate([r["timings"].get(name, []) for r in results]) * 1000
+        stages[name] = {
+            "mean_ms": float(values.mean()),
+            "p50_ms": float(np.percentile(values, 50)),
+            "p90_ms": float(np.percentile(values, 90)),
+            "p99_ms": float(np.percentile(values, 99)),
+        }
+    return {
+        "workers": workers,
+        "samples_per_second": workers * args.num_samples / seconds,
+        "stages": stages,
+    }
+
+
+def print_result(result: Dict, gpu_samples_per_second: Optional[float]) -> None:
+    """Prints the throughput and the stage latencies of a benchmark run."""
+    rate = result["samples_per_second"]
+    line = f"{result['workers']} workers: {rate:.1f} samples/s"
+    if gpu_samples_per_second:
+        starved = "GPU starved" if rate < gpu_samples_per_second else "keeps up"
+        line += f" ({starved}, GPU needs {gpu_samples_per_second:.1f})"
+    print(line)
+    total = sum(stage["mean_ms"] for stage in result["stages"].values())
+    for name, stage in result["stages"].items():
+        print(
+            f"  {name:<36} p50 {stage['p50_ms']:8.2f} p90 {stage['p90_ms']:8.2f} "
+            f"p99 {stage['p99_ms']:8.2f} ms {100 * stage['mean_ms'] / total:5.1f}%"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measure the CPU throughput of the transform pipeline of an experiment config."
+    )
+    parser.add_argument("--config", type=str, required=True, help="Experiment YAML file")
+    parser.add_argument("--subset", type=str, choices=SUBSETS, default="train_subset")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        nargs="+",
+        default=None,
+        help="Worker counts to measure, defaults to 1 and the num_workers of the config",
+    )
+    parser.add_argument(
+        "--num_samples", type=int, default=200, help="Samples measured per worker"
+    )
+    parser.add_argument("--warmup", type=int, default=20, help="Samples run before measuring")
+    parser.add_argument(
+        "--real",
+        action="store_true",
+        help="Decode images of data_root instead of using synthetic in-memory images",
+    )
+    parser.add_argument("--data_root", type=str, default=None, help="Overrides data_root")
+    parser.add_argument(
+        "--num_classes", type=int, default=7, help="Classes of the synthetic labels"
+    )
+    parser.add_argument(
+        "--gpu_samples_per_second",
+        type=float,
+        default=None,
+        help="Samples/s the training step consumes, to tell whether the workers keep up",
+    )
+    parser.add_argument("--output", type=str, default=None, help="JSON results file")
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    workers = args.workers or sorted({1, config["data"][args.subset].get("num_workers", 1)})
+    results = []
+    for count in workers:
+        result = benchmark(args, count)
+        print_result(result, args.gpu_samples_per_second)
+        results.append(result)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {"config": args.config, "subset": args.subset, "results": results}, f, indent=2
+            )
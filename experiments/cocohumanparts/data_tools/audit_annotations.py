@@ -0,0 +1,115 @@
+import os
+import json
+import time
+import argparse
+from collections import Counter
+from od_engine.utils.annostore import open_store
+from od_engine.utils.audit import (
+    DEGENERATE_REASONS,
+    audit_store,
+    dropped_boxes,
+    issue_records,
+    write_deduplicated,
+)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Find duplicate, outside parent and degenerate boxes of COCO annotations."
+    )
+    parser.add_argument(
+        "--anno_file",
+        type=str,
+        required=True,
+        help="COCO annotation file, raw COCO Human Parts with hier or the prepared layout",
+    )
+    parser.add_argument(
+        "--store",
+        type=str,
+        default=None,
+        help="Annotation store directory, defaults to <anno_file>.annstore, built if outdated",
+    )
+    parser.add_argument(
+        "--iou_threshold",
+        type=float,
+        default=0.7,
+        help="IoU over which two boxes of the same image and category are duplicates",
+    )
+    parser.add_argument(
+        "--min_inside",
+        type=float,
+        default=0.5,
+        help="Smallest ratio of a part area inside its person box",
+    )
+    parser.add_argument(
+        "--min_size", type=float, default=1.0, help="Smallest box width and height in pixels"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=os.cpu_count(), help="Number of worker processes"
+    )
+    parser.add_argument("--report", type=str, default=None, help="JSON report of every issue")
+    parser.add_argument(
+        "--output",
+        type=str,
+        default=None,
+        help="COCO annotation file to write without the duplicates",
+    )
+    parser.add_argument(
+        "--drop_degenerate",
+        action="store_true",
+        help="Also drop the degenerate boxes from --output",
+    )
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    store = open_store(
+        args.store or os.path.splitext(args.anno_file)[0] + ".annstore", args.anno_file
+    )
+    loaded = time.perf_counter()
+    issues = audit_store(
+        store,
+        iou_threshold=args.iou_threshold,
+        min_inside=args.min_inside,
+        min_size=args.min_size,
+        workers=args.workers,
+    )
+    audited = time.perf_counter()
+    records = issue_records(store, issues)
+
+    print(f"{store.num_images} images, {len(store)} annotations")
+    duplicates = Counter(r["boxes"][0]["category"] for r in records["duplicates"])
+    print(f"Duplicate pairs over IoU {args.iou_threshold}: {len(records['duplicates'])}")
+    for category, count in duplicates.most_common():
+        print(f"  {category:<16} {count:>8}")
+    outside = Counter(r["category"] for r in records["outside_parent"])
+    print(
+        f"Parts less than {args.min_inside:.0%} inside their person: "
+        f"{len(records['outside_parent'])}"
+    )
+    for category, count in outside.most_common():
+        print(f"  {category:<16} {count:>8}")
+    reasons = Counter(r["reason"] for r in records["degenerate"])
+    print(f"Degenerate boxes: {len(records['degenerate'])}")
+    for reason in DEGENERATE_REASONS:
+        if reasons[reason]:
+            print(f"  {reason:<16} {reasons[reason]:>8}")
+    print(
+        f"Opened the store in {loaded - start:.2f}s, audited in {audited - loaded:.2f}s "
+        f"with {args.workers} workers"
+    )
+
+    if args.report:
+        tmp_report = args.report + ".tmp"
+        with open(tmp_report, "w") as f:
+            json.dump({"anno_file": args.anno_file, **records}, f, indent=2)
+        os.replace(tmp_report, args.report)
+        print(f"Report saved to {args.report}")
+
+    if args.output:
+        dropped = dropped_boxes(issues, drop_degenerate=args.drop_degenerate)
+        tmp_output = args.output + ".tmp"
+        removed, hidden = write_deduplicated(store, dropped, tmp_output)
+        os.replace(tmp_output, args.output)
+        print(
+            f"Wrote {args.output} without {removed} annotations and with {hidden} hier parts "
+            "hidden"
+        )
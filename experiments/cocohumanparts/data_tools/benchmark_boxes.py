@@ -0,0 +1,154 @@
+import sys
+import copy
+import json
+import time
+import argparse
+import numpy as np
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+from od_engine.utils.boxes import box_iou, convert_boxes, nms, normalize_boxes
+from od_engine.utils.synthetic import humanparts_coco
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "prepare_dataset"))
+import rfdter_data_prep
+import yoloformat_hp_data_prep
+
+
+def best_time(fn: Callable[[], object], repeats: int) -> Tuple[float, object]:
+    """Returns the best wall time of repeated calls and the result of the last one."""
+    seconds = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        seconds.append(time.perf_counter() - start)
+    return min(seconds), result
+
+
+def label_items(num_annotations: int, seed: int) -> List[Tuple[Dict, List[Dict]]]:
+    """Generates the image entries of a raw COCO Human Parts split with their persons."""
+    coco = humanparts_coco(num_annotations, seed=seed)
+    persons = {image["id"]: [] for image in coco["images"]}
+    for anno in coco["annotations"]:
+        persons[anno["image_id"]].append(anno)
+    return [(image, persons[image["id"]]) for image in coco["images"]]
+
+
+def bench_yolo_labels(items, repeats):
+    """Times the YOLO label files of all images, box by box and with the array kernels."""
+    # The scalar converters correct the boxes in place, so every run gets its own copy
+    copies = [copy.deepcopy(items) for _ in range(repeats)]
+    loop_seconds, loop_texts = best_time(
+        lambda: [
+            yoloformat_hp_data_prep.image_label_text_loop(info, annos)
+            for info, annos in copies.pop()
+        ],
+        repeats,
+    )
+    seconds, texts = best_time(lambda: yoloformat_hp_data_prep.label_texts(items), repeats)
+    return loop_seconds, seconds, loop_texts == texts
+
+
+def bench_yolo_boxes(items, repeats):
+    """Times the correction and normalisation of the person boxes, without the label text."""
+    boxes = [anno["bbox"] for _, annos in items for anno in annos]
+    sizes = [(info["width"], info["height"]) for info, annos in items for _ in annos]
+    loop_seconds, loop_boxes = best_time(
+        lambda: [
+            yoloformat_hp_data_prep.convert_pbbox_to_yolo(list(box), w, h)
+            for box, (w, h) in zip(boxes, sizes)
+        ],
+        repeats,
+    )
+
+    def kernels():
+        array = np.array(boxes, dtype=np.float64)
+        img_wh = np.array(sizes, dtype=np.float64)
+        yoloformat_hp_data_prep.fix_yolo_boxes(array, img_wh)
+        convert_boxes(array, "xywh", "cxcywh", out=array)
+        return normalize_boxes(array, img_wh[:, 0], img_wh[:, 1], out=array)
+
+    seconds, array = best_time(kernels, repeats)
+    return loop_seconds, seconds, [list(box) for box in loop_boxes] == array.tolist()
+
+
+def bench_yolo_to_coco(items, repeats):
+    """Times the conversion of YOLO label rows back to COCO boxes, as the RF-DETR converter."""
+    rows, sizes = [], []
+    for text, (info, _) in zip(yoloformat_hp_data_prep.label_texts(items), items):
+        for line in text.splitlines():
+            rows.append(line.split()[1:])
+            sizes.append((info["width"], info["height"]))
+    loop_seconds, loop_boxes = best_time(
+        lambda: [
+            rfdter_data_prep.yolo_to_coco_bbox(row, w, h) for row, (w, h) in zip(rows, sizes)
+        ],
+        repeats,
+    )
+
+    def kernels():
+        img_wh = np.array(sizes, dtype=np.int64)
+        yolo_bboxes = np.array(rows, dtype=np.float64)
+        return rfdter_data_prep.yolo_to_coco_bboxes(yolo_bboxes, img_wh[:, 0], img_wh[:, 1])
+
+    seconds, array = best_time(kernels, repeats)
+    return loop_seconds, seconds, loop_boxes == array.tolist()
+
+
+# Every case compares a scalar converter kept as the baseline with its array version, and
+# returns both times and whether their results are the same
+CASES = {
+    "yolo_labels": bench_yolo_labels,
+    "yolo_boxes": bench_yolo_boxes,
+    "yolo_to_coco": bench_yolo_to_coco,
+}
+
+
+def random_boxes(count: int, seed: int = 0) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Generates xyxy boxes on a 640 x 640 image, with scores and 7 class labels."""
+    rng = np.random.default_rng(seed)
+    xy = rng.uniform(0, 600, (count, 2))
+    boxes = np.concatenate([xy, xy + rng.uniform(4, 120, (count, 2))], axis=1)
+    return boxes, rng.random(count), rng.integers(0, 7, count)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Time the scalar box converters against the od_engine.utils.boxes kernels."
+    )
+    parser.add_argument(
+        "--num_annotations", type=int, default=100000, help="Person annotations of the split"
+    )
+    parser.add_argument(
+        "--num_boxes", type=int, default=5000, help="Boxes of the IoU and NMS timings"
+    )
+    parser.add_argument("--repeats", type=int, default=3, help="Timed runs, the best is kept")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("--output", type=str, default=None, help="JSON results file")
+    args = parser.parse_args()
+
+    items = label_items(args.num_annotations, args.seed)
+    num_boxes = sum(len(annos) for _, annos in items)
+    print(f"Generated {len(items)} images with {num_boxes} persons")
+    results = {}
+    for name, case in CASES.items():
+        loop_seconds, seconds, same = case(items, args.repeats)
+        results[name] = {"loop": loop_seconds, "kernels": seconds, "same": same}
+        print(
+            f"  {name:<14} loop {loop_seconds:7.3f}s kernels {seconds:7.3f}s "
+            f"speedup {loop_seconds / seconds:6.1f}x, same results {same}"
+        )
+
+    boxes, scores, labels = random_boxes(args.num_boxes, args.seed)
+    out = np.empty((len(boxes), len(boxes)))
+    iou_seconds, _ = best_time(lambda: box_iou(boxes, boxes, out=out), args.repeats)
+    nms_seconds, kept = best_time(lambda: nms(boxes, scores, 0.5, labels), args.repeats)
+    results["box_iou"] = {"pairs": len(boxes) ** 2, "seconds": iou_seconds}
+    results["nms"] = {"boxes": len(boxes), "kept": len(kept), "seconds": nms_seconds}
+    print(
+        f"  box_iou        {len(boxes) ** 2 / iou_seconds / 1e6:7.1f}M pairs/s, "
+        f"class-aware nms of {len(boxes)} boxes in {nms_seconds * 1000:.1f}ms"
+    )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,326 @@
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import resource
+import argparse
+import tempfile
+import subprocess
+import importlib
+from glob import glob
+from contextlib import redirect_stderr, redirect_stdout
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+from od_engine.utils.atomic import snapshot_dir
+from od_engine.utils.synthetic import make_humanparts_dataset
+
+DATA_TOOLS_DIR = Path(__file__).resolve().parent
+SPLITS = ("train", "val")
+
+
+def _load(script: str):
+    """Imports a data tools script as a module, which its worker processes can import too."""
+    path = DATA_TOOLS_DIR / script
+    if str(path.parent) not in sys.path:
+        sys.path.insert(0, str(path.parent))
+    return importlib.import_module(path.stem)
+
+
+def _count_files(*patterns: str) -> int:
+    """Counts the files matching glob patterns."""
+    return sum(len(glob(pattern)) for pattern in patterns)
+
+
+def cocoformat_hp_data_prep(data: Dict[str, str], out: str, workers: Optional[int]) -> None:
+    """
+    Converts the raw annotations of every split to the seven category COCO layout. It writes one
+    file per split, so it has no files per second.
+    """
+    module = _load("prepare_dataset/cocoformat_hp_data_prep.py")
+    os.makedirs(out, exist_ok=True)
+    for split in SPLITS:
+        module.process_coco_human_parts(
+            os.path.join(data["raw"], f"person_humanparts_{split}.json"),
+            os.path.join(out, f"instances_{split}.json"),
+        )
+
+
+def _yolo_splits(data, out):
+    """Returns the (anno_data_file, images_dir, dst_images_dir, dst_labels_dir) of every split."""
+    return [
+        (
+            os.path.join(data["raw"], f"person_humanparts_{split}.json"),
+            os.path.join(data["raw"], "images", split),
+            os.path.join(out, "images", split),
+            os.path.join(out, "labels", split),
+        )
+        for split in SPLITS
+    ]
+
+
+def yoloformat_hp_data_prep(data: Dict[str, str], out: str, workers: Optional[int]) -> int:
+    """Exports every split to YOLO labels and hardlinked images, one split after the other."""
+    module = _load("prepare_dataset/yoloformat_hp_data_prep.py")
+    for split in _yolo_splits(data, out):
+        module.process_coco_human_parts(*split, link_mode="hardlink")
+    return _count_files(os.path.join(out, "*", "*", "*"))
+
+
+def yoloformat_hp_data_prep_sharded(
+    data: Dict[str, str], out: str, workers: Optional[int]
+) -> int:
+    """Exports all splits to YOLO labels and hardlinked images with a process pool."""
+    module = _load("prepare_dataset/yoloformat_hp_data_prep.py")
+    module.process_coco_human_parts_sharded(
+        _yolo_splits(data, out), workers=workers, link_mode="hardlink"
+    )
+    return _count_files(os.path.join(out, "*", "*", "*"))
+
+
+def rfdter_data_prep(data: Dict[str, str], out: str, workers: Optional[int]) -> int:
+    """Converts the YOLO dataset to the RF-DETR COCO layout with hardlinked images."""
+    module = _load("prepare_dataset/rfdter_data_prep.py")
+    # A fresh size index, so image headers are read as on a first run
+    size_index_file = os.path.join(out, "image_sizes.json")
+    module.convert_dataset(
+        data["yolo"], out, link_mode="hardlink", size_index_file=size_index_file
+    )
+    return _count_files(os.path.join(out, "*", "*"))
+
+
+def _transform(script, data, out, workers, format_type):
+    """
+    Runs a label transform on a hardlinked snapshot of the COCO or YOLO dataset, without the
+    backups the scripts keep by default so only the transform is timed. The COCO datasets have
+    one file per split, so they have no files per second.
+    """
+    module = _load(script)
+    snapshot_dir(data[format_type], out)
+    if format_type == "coco":
+        files = glob(os.path.join(out, "*", "*.json"))
+        for file in files:
+            module.process_coco_human_parts(file, backup=False)
+        return None
+    module.update_data_yaml(out, backup=False)
+    folders = [f for f in glob(os.path.join(out, "labels", "*")) if os.path.isdir(f)]
+    module.yoloformat_process_dirs(folders, workers=workers, backup=False)
+    return _count_files(os.path.join(out, "labels", "*", "*.txt"))
+
+
+def fuse_hands_legs_coco(data: Dict[str, str], out: str, workers: Optional[int]) -> None:
+    """Fuses the hand and foot categories of the COCO dataset."""
+    return _transform("fuse_hands_legs.py", data, out, workers, "coco")
+
+
+def fuse_hands_legs_yolo(data: Dict[str, str], out: str, workers: Optional[int]) -> int:
+    """Fuses the hand and foot classes of the YOLO dataset."""
+    return _transform("fuse_hands_legs.py", data, out, workers, "yolo")
+
+
+def remove_hands_legs_coco(data: Dict[str, str], out: str, workers: Optional[int]) -> None:
+    """Removes the hand and foot categories of the COCO dataset."""
+    return _transform("remove_hands_legs.py", data, out, workers, "coco")
+
+
+def remove_hands_legs_yolo(data: Dict[str, str], out: str, workers: Optional[int]) -> int:
+    """Removes the hand and foot classes of the YOLO dataset."""
+    return _transform("remove_hands_legs.py", data, out, workers, "yolo")
+
+
+# Every case takes the synthetic dataset directories, an output directory and the worker count,
+# and returns the number of files it wrote or rewrote, None if that says nothing of its speed
+CASES: Dict[str, Callable[[Dict[str, str], str, Optional[int]], Optional[int]]] = {
+    case.__name__: case
+    for case in (
+        cocoformat_hp_data_prep,
+        yoloformat_hp_data_prep,
+        yoloformat_hp_data_prep_sharded,
+        rfdter_data_prep,
+        fuse_hands_legs_coco,
+        fuse_hands_legs_yolo,
+        remove_hands_legs_coco,
+        remove_hands_legs_yolo,
+    )
+}
+
+
+def _peak_rss_mb() -> float:
+    """Returns the peak RSS of this process and of its finished child processes in MB."""
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    unit = 1024 * 1024 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit
+    # On Linux ru_maxrss also covers the parent before exec, VmHWM only this process
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    own = int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return max(own, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / unit)
+
+
+def _run_case(name: str, data: Dict[str, str], out: str, workers: Optional[int]) -> Dict:
+    """Runs a case in a fresh process and measures it, silencing its prints and progress bars."""
+    # Also disables the progress bars of the worker processes the case starts
+    os.environ["TQDM_DISABLE"] = "1"
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull), redirect_stderr(devnull):
+        start = time.perf_counter()
+        files = CASES[name](data, out, workers)
+        seconds = time.perf_counter() - start
+    return {"seconds": seconds, "peak_rss_mb": _peak_rss_mb(), "files": files}
+
+
+def run_case(name: str, data: Dict[str, str], out: str, workers: Optional[int]) -> Dict:
+    """
+    Runs a case end to end in a new process, so its peak RSS is its own.
+
+    Args:
+        name (str): The name of the case in `CASES`.
+        data (Dict[str, str]): The directories of the synthetic dataset.
+        out (str): The output directory, which is removed first.
+        workers (int, optional): The number of worker processes of the parallel converters.
+
+    Returns:
+        Dict: The wall time, the peak RSS in MB and the number of files written, None for the
+            cases without a meaningful file count.
+    """
+    shutil.rmtree(out, ignore_errors=True)
+    with ProcessPoolExecutor(1, mp_context=get_context("spawn")) as executor:
+        return executor.submit(_run_case, name, data, out, workers).result()
+
+
+def parse_scale(text: str) -> int:
+    """Parses an annotation count such as 10k or 1M."""
+    units = {"k": 1000, "m": 1000000}
+    if text[-1].lower() in units:
+        return int(float(text[:-1]) * units[text[-1].lower()])
+    return int(text)
+
+
+def _git_commit() -> Optional[str]:
+    """Returns the commit of the working tree, if it is a git checkout."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=DATA_TOOLS_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: List[Dict], baseline_file: str) -> None:
+    """
+    Prints the speedup of every case over an earlier results file.
+
+    Args:
+        results (List[Dict]): The results of this run.
+        baseline_file (str): The results file of an earlier run.
+    """
+    with open(baseline_file, "r") as f:
+        baseline = json.load(f)
+    previous = {(r["case"], r["annotations"]): r for r in baseline["results"]}
+    print(f"Compared to {baseline_file} (commit {baseline.get('commit')}):")
+    for result in results:
+        before = previous.get((result["case"], result["annotations"]))
+        if before is not None:
+            print(
+                f"  {result['case']:<34} {result['annotations']:>9} "
+                f"speedup {before['seconds'] / result['seconds']:5.2f}x, peak RSS "
+                f"{result['peak_rss_mb'] - before['peak_rss_mb']:+8.1f} MB"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Time the data tools converters end to end on synthetic datasets."
+    )
+    parser.add_argument(
+        "--scales",
+        type=str,
+        nargs="+",
+        default=["10k", "100k"],
+        help="Numbers of person annotations, e.g. 10k 100k 1M",
+    )
+    parser.add_argument(
+        "--cases", type=str, nargs="+", choices=list(CASES), default=list(CASES), help="Cases"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=None, help="Worker processes of the parallel converters"
+    )
+    parser.add_argument(
+        "--work_dir",
+        type=str,
+        default=None,
+        help="Directory of the synthetic datasets and outputs, defaults to a temporary one",
+    )
+    parser.add_argument(
+        "--output", type=str, default="converter_benchmark.json", help="Results file"
+    )
+    parser.add_argument(
+        "--baseline", type=str, default=None, help="Results file of an earlier run to compare"
+    )
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="converter_benchmark_")
+    results = []
+    try:
+        for scale in map(parse_scale, args.scales):
+            root = os.path.join(work_dir, f"scale_{scale}")
+            start = time.perf_counter()
+            data = make_humanparts_dataset(os.path.join(root, "data"), scale, SPLITS)
+            num_images = _count_files(os.path.join(data["raw"], "images", "*", "*"))
+            print(
+                f"Generated {scale} annotations on {num_images} images "
+                f"in {time.perf_counter() - start:.1f}s"
+            )
+            for name in args.cases:
+                out = os.path.join(root, name)
+                result = run_case(name, data, out, args.workers)
+                shutil.rmtree(out, ignore_errors=True)
+                result = {
+                    "case": name,
+                    "annotations": scale,
+                    "images": num_images,
+                    **result,
+                    "files_per_second": (
+                        None if result["files"] is None else result["files"] / result["seconds"]
+                    ),
+                    "annotations_per_second": scale / result["seconds"],
+                }
+                results.append(result)
+                line = (
+                    f"  {name:<34} {result['seconds']:8.2f}s {result['peak_rss_mb']:8.1f} MB "
+                    f"{result['annotations_per_second']:10.0f} annotations/s"
+                )
+                if result["files_per_second"] is not None:
+                    line += f" {result['files_per_second']:8.0f} files/s"
+                print(line)
+            shutil.rmtree(root, ignore_errors=True)
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "commit": _git_commit(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "workers": args.workers,
+        "results": results,
+    }
+    tmp_output = args.output + ".tmp"
+    with open(tmp_output, "w") as f:
+        json.dump(report, f, indent=2)
+    os.replace(tmp_output, args.output)
+    print(f"Results saved to {args.output}")
+    if args.baseline:
+        compare(results, args.baseline)
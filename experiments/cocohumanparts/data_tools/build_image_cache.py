@@ -0,0 +1,133 @@
+import os
+import sys
+import time
+import random
+import argparse
+import yaml
+import numpy as np
+from od_engine.utils.coco_stream import iter_coco_array
+from od_engine.utils.imcache import ImageCache, letterbox, read_image
+
+
+def subset_paths(data_root: str, subset: str):
+    """
+    Returns the images directory and annotation file of a subset of the COCO format dataset.
+
+    Args:
+        data_root (str): The dataset directory.
+        subset (str): The subset, e.g. train or val.
+
+    Returns:
+        Tuple[str, str]: The images directory and the annotation file.
+    """
+    images_dir = os.path.join(data_root, "images", subset)
+    anno_file = os.path.join(data_root, "annotations", f"instances_{subset}.json")
+    return images_dir, anno_file
+
+
+def measure_decode_cpu(cache: ImageCache, images_dir: str, num_samples: int) -> None:
+    """
+    Measures the CPU time of decoding and letterboxing images against copying them out of the
+    cache, and prints the CPU time saved per epoch.
+
+    Args:
+        cache (ImageCache): The cache.
+        images_dir (str): The images directory.
+        num_samples (int): The number of images measured.
+    """
+    indices = random.Random(0).sample(range(len(cache)), min(num_samples, len(cache)))
+    if not indices:
+        return
+
+    start = time.process_time()
+    for i in indices:
+        letterbox(read_image(os.path.join(images_dir, cache.files[i])), cache.input_size)
+    decode = (time.process_time() - start) / len(indices)
+
+    start = time.process_time()
+    for i in indices:
+        np.array(cache.get(i))
+    cached = (time.process_time() - start) / len(indices)
+
+    saved = (decode - cached) * len(cache)
+    print(
+        f"  decode + resize {decode * 1e3:.2f} ms/image, cache {cached * 1e3:.2f} ms/image, "
+        f"{saved:.1f} CPU seconds saved per epoch of {len(cache)} images"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Decode the images once and cache them letterboxed to the input size."
+    )
+    parser.add_argument(
+        "--config", type=str, default=None, help="Training config with data_root and input_size"
+    )
+    parser.add_argument("--data_root", type=str, default=None, help="COCO format dataset directory")
+    parser.add_argument(
+        "--input_size", type=int, nargs=2, default=None, help="Height and width of the cache"
+    )
+    parser.add_argument(
+        "--subsets", type=str, nargs="+", default=["train", "val"], help="Subsets to cache"
+    )
+    parser.add_argument(
+        "--cache_dir",
+        type=str,
+        default=None,
+        help="Cache directory, defaults to image_cache in the dataset directory",
+    )
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes")
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="Only check that the caches match the images and input size, exit 1 if not",
+    )
+    parser.add_argument(
+        "--measure",
+        type=int,
+        default=0,
+        help="Number of images to measure the decode CPU time saved per epoch on",
+    )
+    args = parser.parse_args()
+
+    data_root, input_size = args.data_root, args.input_size
+    if args.config:
+        with open(args.config, "r") as f:
+            config = yaml.safe_load(f)
+        data_root = data_root or config["data_root"]
+        input_size = input_size or config["data"]["input_size"]
+    if data_root is None or input_size is None:
+        parser.error("Set --config, or --data_root and --input_size")
+    cache_dir = args.cache_dir or os.path.join(data_root, "image_cache")
+
+    outdated = False
+    for subset in args.subsets:
+        images_dir, anno_file = subset_paths(data_root, subset)
+        path = os.path.join(cache_dir, subset)
+        if args.check:
+            if not os.path.exists(os.path.join(path, "meta.json")):
+                print(f"{subset}: no cache at {path}")
+                outdated = True
+                continue
+            cache = ImageCache(path)
+            file_names = [image["file_name"] for image in iter_coco_array(anno_file, "images")]
+            stale = cache.stale(images_dir, input_size)
+            if file_names != cache.files:
+                print(f"{subset}: the images of {anno_file} changed")
+                outdated = True
+            elif stale:
+                print(f"{subset}: {len(stale)} of {len(cache)} images changed, e.g. {stale[0]}")
+                outdated = True
+            else:
+                print(f"{subset}: {len(cache)} images up to date")
+        else:
+            start = time.perf_counter()
+            file_names = [image["file_name"] for image in iter_coco_array(anno_file, "images")]
+            cache = ImageCache.build(images_dir, file_names, path, input_size, workers=args.workers)
+            print(
+                f"{subset}: cached {len(cache)} images ({cache.images.nbytes / 1e9:.2f} GB) "
+                f"in {time.perf_counter() - start:.1f}s"
+            )
+        if args.measure:
+            measure_decode_cpu(cache, images_dir, args.measure)
+    sys.exit(1 if outdated else 0)
@@ -0,0 +1,33 @@
+import time
+import argparse
+from od_engine.utils.sampler_weights import (
+    coco_anno_file,
+    load_sampler_weights,
+    sidecar_path,
+    write_sampler_weights,
+)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Precompute the class counts and sampler weights of the COCO annotations."
+    )
+    parser.add_argument(
+        "--data_root", type=str, required=True, help="COCO format dataset directory"
+    )
+    parser.add_argument(
+        "--subsets", type=str, nargs="+", default=["train"], help="Subsets to precompute"
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="Rewrite the files that are up to date"
+    )
+    args = parser.parse_args()
+
+    for subset in args.subsets:
+        anno_file = coco_anno_file(args.data_root, subset)
+        path = sidecar_path(anno_file)
+        if not args.force and load_sampler_weights(path) is not None:
+            print(f"{path} is up to date")
+            continue
+        start = time.perf_counter()
+        write_sampler_weights(anno_file, path)
+        print(f"Wrote {path} in {time.perf_counter() - start:.1f}s")
@@ -2,17 +2,19 @@ import os
 import argparse
 import yaml
 from pathlib import Path
-import shutil
-from od_engine.utils.download import download
+from od_engine.utils.atomic import snapshot_file
+from od_engine.utils.scheduler import DownloadTask, schedule_downloads
 
 
-def main(local_dataset_dir):
+def main(local_dataset_dir, cache_dir=None):
     """
     This function downloads the COCO Human Parts dataset and its corresponding data.yaml file
     from a remote URL to a local directory.
 
     Args:
         local_dataset_dir (str): The local directory to store the downloaded dataset. Defaults to the current directory.
+        cache_dir (str, optional): The download cache directory; files already in it are
+            hardlinked instead of downloaded. Defaults to None.
     """
     # Remote URL for the dataset and data.yaml file
     remote_dataset_url = (
@@ -31,9 +33,6 @@ def main(local_dataset_dir):
     images_train_url = remote_dataset_url + "/images/train.zip"
     images_val_url = remote_dataset_url + "/images/val.zip"
 
-    # Download images in parallel using 2 threads
-    download([images_train_url, images_val_url], local_images_dir, threads=2)
-
     # URLs for the training and validation labels (COCO format)
     labels_train_url = (
         remote_dataset_url + "/annotations/person_humanparts_train2017_coco_format.json"
@@ -42,8 +41,21 @@ def main(local_dataset_dir):
         remote_dataset_url + "/annotations/person_humanparts_val2017_coco_format.json"
     )
 
-    # Download labels in parallel using 2 threads
-    download([labels_train_url, labels_val_url], local_annotations_dir, threads=2)
+    # Download images and labels in one manifest
+    results = schedule_downloads(
+        [
+            DownloadTask(images_train_url, local_images_dir),
+            DownloadTask(images_val_url, local_images_dir),
+            DownloadTask(labels_train_url, local_annotations_dir),
+            DownloadTask(labels_val_url, local_annotations_dir),
+        ],
+        cache_dir=cache_dir,
+    )
+    failed = [r for r in results if not r.ok]
+    if failed:
+        raise RuntimeError(
+            "Failed to download " + ", ".join(f"{r.url} ({r.error})" for r in failed)
+        )
 
     # Rename the files to train.json and valid.json
     os.rename(
@@ -58,8 +70,8 @@ def main(local_dataset_dir):
         ),
         os.path.join(local_annotations_dir, "instances_val.json"),
     )
-    # Copy validation to test
-    shutil.copyfile(
+    # Use validation as test, a hardlink is enough since transforms replace the files
+    snapshot_file(
         os.path.join(local_annotations_dir, "instances_val.json"),
         os.path.join(local_annotations_dir, "instances_test.json"),
     )
@@ -74,10 +86,16 @@ if __name__ == "__main__":
         default=".",
         help="The local directory to store the downloaded dataset.",
     )
+    parser.add_argument(
+        "--cache_dir",
+        type=str,
+        default=None,
+        help="The download cache directory, reused across datasets and runs.",
+    )
 
     # Parse the argument and get the local dataset directory
     args = parser.parse_args()
     local_dataset_dir = args.local_dataset_dir
 
     # Call the main function with the specified local dataset directory
-    main(local_dataset_dir)
+    main(local_dataset_dir, cache_dir=args.cache_dir)
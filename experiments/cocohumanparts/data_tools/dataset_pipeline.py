@@ -0,0 +1,170 @@
+import os
+import sys
+import argparse
+from pathlib import Path
+from typing import Optional
+from od_engine.utils.pipeline import Pipeline, command_step
+from od_engine.utils.sampler_weights import coco_anno_file, sidecar_path
+
+DATA_TOOLS_DIR = Path(__file__).resolve().parent
+
+# Label transforms applied after the download, by name
+TRANSFORMS = {
+    "fuse_hands_legs": DATA_TOOLS_DIR / "fuse_hands_legs.py",
+    "remove_hands_legs": DATA_TOOLS_DIR / "remove_hands_legs.py",
+}
+
+
+def build_pipeline(
+    local_dataset_dir: Optional[str] = None,
+    yolo_dataset_dir: Optional[str] = None,
+    cache_dir: Optional[str] = None,
+    transform: Optional[str] = "fuse_hands_legs",
+    state_file: Optional[str] = None,
+    workers: int = 4,
+    mode: str = "mtime",
+) -> Pipeline:
+    """
+    This function declares the COCO Human Parts preparation steps. The COCO and YOLO formats are
+    independent branches, each a download followed by the label transform. The COCO branch then
+    precomputes the sampler weights of the train annotations.
+
+    Args:
+        local_dataset_dir (str, optional): The COCO format dataset directory. Defaults to None (no
+            COCO branch).
+        yolo_dataset_dir (str, optional): The YOLO format dataset directory. Defaults to None (no
+            YOLO branch).
+        cache_dir (str, optional): The download cache directory. Defaults to None.
+        transform (str, optional): The label transform, one of `TRANSFORMS` or None. Defaults to
+            "fuse_hands_legs".
+        state_file (str, optional): The pipeline state file. Defaults to .pipeline_state.json in
+            the first dataset directory.
+        workers (int, optional): The number of steps run at once. Defaults to 4.
+        mode (str, optional): The fingerprint mode, "mtime" or "content". Defaults to "mtime".
+
+    Returns:
+        Pipeline: The pipeline.
+    """
+    dataset_dir = local_dataset_dir or yolo_dataset_dir
+    if dataset_dir is None:
+        raise ValueError("Set local_dataset_dir, yolo_dataset_dir or both")
+    if state_file is None:
+        state_file = os.path.join(dataset_dir, ".pipeline_state.json")
+    cache_args = ["--cache_dir", cache_dir] if cache_dir else []
+    pipeline = Pipeline(state_file, workers=workers, mode=mode)
+
+    branches = []
+    if local_dataset_dir:
+        branches.append(
+            (
+                "coco",
+                local_dataset_dir,
+                DATA_TOOLS_DIR / "cocoformat_download_dataset.py",
+                ["images", "annotations"],
+                ["annotations"],
+            )
+        )
+    if yolo_dataset_dir:
+        branches.append(
+            (
+                "yolo",
+                yolo_dataset_dir,
+                DATA_TOOLS_DIR / "yoloformat_download_dataset.py",
+                ["images", "labels", "data.yaml"],
+                ["labels", "data.yaml"],
+            )
+        )
+
+    for format_type, root, download_script, downloaded, transformed in branches:
+        # The transform rewrites the download in place, so another transform needs a new download
+        pipeline.add(
+            command_step(
+                f"download_{format_type}",
+                [sys.executable, download_script, "--local_dataset_dir", root] + cache_args,
+                outputs=[os.path.join(root, p) for p in downloaded],
+                params={"transform": transform},
+            )
+        )
+        if transform is not None:
+            pipeline.add(
+                command_step(
+                    f"transform_{format_type}",
+                    [
+                        sys.executable,
+                        TRANSFORMS[transform],
+                        "--datafolder",
+                        root,
+                        "--format_type",
+                        format_type,
+                        "--no_backup",
+                    ],
+                    outputs=[os.path.join(root, p) for p in transformed],
+                    deps=[f"download_{format_type}"],
+                )
+            )
+        if format_type == "coco":
+            # The train sampler reads the class counts of the final annotations
+            pipeline.add(
+                command_step(
+                    "sampler_weights_coco",
+                    [
+                        sys.executable,
+                        DATA_TOOLS_DIR / "build_sampler_weights.py",
+                        "--data_root",
+                        root,
+                        "--subsets",
+                        "train",
+                        "--force",
+                    ],
+                    outputs=[sidecar_path(coco_anno_file(root, "train"))],
+                    deps=["download_coco" if transform is None else "transform_coco"],
+                )
+            )
+    return pipeline
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Download and prepare COCO Human Parts, skipping the steps that are up to date."
+    )
+    parser.add_argument(
+        "--local_dataset_dir", type=str, default=None, help="COCO format dataset directory"
+    )
+    parser.add_argument(
+        "--yolo_dataset_dir", type=str, default=None, help="YOLO format dataset directory"
+    )
+    parser.add_argument("--cache_dir", type=str, default=None, help="Download cache directory")
+    parser.add_argument(
+        "--transform",
+        type=str,
+        choices=list(TRANSFORMS) + ["none"],
+        default="fuse_hands_legs",
+        help="Label transform applied after the download",
+    )
+    parser.add_argument(
+        "--state_file",
+        type=str,
+        default=None,
+        help="Pipeline state file, defaults to .pipeline_state.json in the dataset directory",
+    )
+    parser.add_argument(
+        "--mode",
+        type=str,
+        choices=["mtime", "content"],
+        default="mtime",
+        help="Fingerprint files by size and mtime, or by content hash",
+    )
+    parser.add_argument("--workers", type=int, default=4, help="Number of steps run at once")
+    parser.add_argument("--force", action="store_true", help="Run every step")
+    args = parser.parse_args()
+
+    pipeline = build_pipeline(
+        args.local_dataset_dir,
+        args.yolo_dataset_dir,
+        args.cache_dir,
+        None if args.transform == "none" else args.transform,
+        args.state_file,
+        args.workers,
+        args.mode,
+    )
+    pipeline.run(force=args.force)
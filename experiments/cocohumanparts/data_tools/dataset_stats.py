@@ -0,0 +1,168 @@
+import os
+import json
+import time
+import argparse
+import yaml
+from typing import Dict
+from od_engine.utils.annostore import open_store
+from od_engine.utils.dataset_stats import (
+    INPUT_SIZES,
+    SMALL_SIZE,
+    TINY_SIZE,
+    compute_stats,
+    suggest_input_size,
+    suggest_tiling,
+)
+
+BAR_WIDTH = 40
+
+
+def print_histogram(title: str, histogram: Dict) -> None:
+    """Prints a histogram as text bars, skipping the empty bins at both ends."""
+    counts, edges = histogram["counts"], histogram["edges"]
+    used = [i for i, count in enumerate(counts) if count]
+    if not used:
+        return
+    print(title)
+    peak = max(counts)
+    for i in range(used[0], used[-1] + 1):
+        bar = "#" * round(BAR_WIDTH * counts[i] / peak)
+        print(f"  {edges[i]:8.4g} - {edges[i + 1]:<8.4g} {counts[i]:>10} {bar}")
+
+
+def print_report(stats: Dict, input_size: Dict, tiling: Dict) -> None:
+    """Prints the statistics and the suggested settings."""
+    images, boxes, per_image = stats["images"], stats["boxes"], stats["boxes_per_image"]
+    print(f"{images['count']} images, {boxes['count']} boxes")
+    if images["height"]:
+        print(
+            f"Image size: height {images['height']['avg']:.0f} "
+            f"(max {images['height']['robust_max']:.0f}), width {images['width']['avg']:.0f} "
+            f"(max {images['width']['robust_max']:.0f})"
+        )
+    if per_image:
+        print(
+            f"Boxes per image: mean {per_image['avg']:.1f}, p50 {per_image['p50']:.0f}, "
+            f"p99 {per_image['p99']:.0f}, max {per_image['max']:.0f}"
+        )
+    print(f"{'class':<16} {'boxes':>10} {'images':>9} {'median px':>10}")
+    for name, c in stats["classes"].items():
+        median = f"{c['median_size']:10.1f}" if c["median_size"] is not None else f"{'-':>10}"
+        print(f"{name:<16} {c['boxes']:>10} {c['images']:>9} {median}")
+    print_histogram("Box size, sqrt(area) in pixels:", boxes["size"]["histogram"])
+    print_histogram("Box aspect ratio, width / height:", boxes["aspect_ratio"]["histogram"])
+    print_histogram("Boxes per image:", per_image["histogram"])
+
+    names = list(stats["classes"])
+    print(f"Boxes under {SMALL_SIZE} px (and {TINY_SIZE} px) after resizing to the input size:")
+    print(f"  {'input':>5} {'small':>7} {'tiny':>7} " + " ".join(f"{n[:9]:>9}" for n in names))
+    for size, ratios in stats["input_sizes"].items():
+        per_class = " ".join(f"{ratios['small_ratio_per_class'][n]:9.1%}" for n in names)
+        print(
+            f"  {size:>5} {ratios['small_ratio']:7.1%} {ratios['tiny_ratio']:7.1%} {per_class}"
+        )
+
+    print(
+        f"Suggested input_size: {input_size['input_size']} "
+        f"({input_size['small_ratio']:.1%} small boxes"
+        + ("" if input_size["meets_ratio"] else ", the largest candidate")
+        + (
+            f", {input_size['current_small_ratio']:.1%} at the current size)"
+            if "current_small_ratio" in input_size
+            else ")"
+        )
+    )
+    print("Suggested tile_config:")
+    print(yaml.safe_dump({"tile_config": tiling}, sort_keys=False, default_flow_style=None))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compute box statistics of COCO annotations and suggest input size and tiling."
+    )
+    parser.add_argument(
+        "--anno_file",
+        type=str,
+        default=None,
+        help="COCO annotation file, defaults to the train annotations of --config",
+    )
+    parser.add_argument(
+        "--config",
+        type=str,
+        default=None,
+        help="Experiment YAML file, for the current input size and object_tile_ratio",
+    )
+    parser.add_argument(
+        "--store",
+        type=str,
+        default=None,
+        help="Annotation store directory, defaults to <anno_file>.annstore, built if outdated",
+    )
+    parser.add_argument(
+        "--input_sizes",
+        type=int,
+        nargs="+",
+        default=list(INPUT_SIZES),
+        help="Candidate square input sizes",
+    )
+    parser.add_argument(
+        "--max_small_ratio",
+        type=float,
+        default=0.1,
+        help=f"Largest acceptable ratio of boxes under {SMALL_SIZE} px at the input size",
+    )
+    parser.add_argument(
+        "--object_tile_ratio",
+        type=float,
+        default=None,
+        help="Average box size over tile size, defaults to the config value or 0.03",
+    )
+    parser.add_argument("--include_crowd", action="store_true", help="Count crowd boxes")
+    parser.add_argument("--output", type=str, default=None, help="JSON statistics file")
+    args = parser.parse_args()
+
+    data = {}
+    if args.config:
+        with open(args.config, "r") as f:
+            config = yaml.safe_load(f)
+        data = config["data"]
+    anno_file = args.anno_file
+    if anno_file is None:
+        if not args.config:
+            parser.error("Set --anno_file or --config")
+        subset = data["train_subset"]["subset_name"]
+        anno_file = os.path.join(config["data_root"], "annotations", f"instances_{subset}.json")
+    current = data.get("input_size")
+    current = max(current) if isinstance(current, list) else current
+    multiplier = max(32, data.get("input_size_multiplier", 1))
+    object_tile_ratio = args.object_tile_ratio or data.get("tile_config", {}).get(
+        "object_tile_ratio", 0.03
+    )
+    input_sizes = sorted(set(args.input_sizes) | ({current} if current else set()))
+
+    start = time.perf_counter()
+    store = open_store(args.store or os.path.splitext(anno_file)[0] + ".annstore", anno_file)
+    loaded = time.perf_counter()
+    stats = compute_stats(store, input_sizes, include_crowd=args.include_crowd)
+    computed = time.perf_counter()
+    input_size = suggest_input_size(stats, args.max_small_ratio, multiplier, current)
+    tiling = suggest_tiling(
+        stats, input_size["input_size"], object_tile_ratio, args.max_small_ratio
+    )
+    print_report(stats, input_size, tiling)
+    print(
+        f"Opened the store in {loaded - start:.2f}s, computed the statistics of "
+        f"{stats['boxes']['count']} boxes in {computed - loaded:.2f}s"
+    )
+
+    if args.output:
+        report = {
+            "anno_file": anno_file,
+            "stats": stats,
+            "suggestions": {"input_size": input_size, "tile_config": tiling},
+        }
+        tmp_output = args.output + ".tmp"
+        with open(tmp_output, "w") as f:
+            json.dump(report, f, indent=2)
+        os.replace(tmp_output, args.output)
+        print(f"Statistics saved to {args.output}")
@@ -0,0 +1,157 @@
+import os
+import time
+import random
+import argparse
+from glob import glob
+from itertools import zip_longest
+from typing import Callable, Iterable, List
+from od_engine.utils.coco_stream import iter_coco_array
+from od_engine.utils.shards import ShardReader, iter_coco_samples, pack_coco_shards
+
+
+def evict_from_page_cache(files: Iterable[str]) -> None:
+    """
+    Ask the kernel to drop files from the page cache, so reads come from the disk.
+
+    Args:
+        files (Iterable[str]): The files to evict.
+    """
+    if not hasattr(os, "posix_fadvise"):
+        return
+    for file in files:
+        fd = os.open(file, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+
+def measure(name: str, read: Callable[[], Iterable], cold_files: List[str]) -> None:
+    """
+    Time one way of reading the samples and print its throughput.
+
+    Args:
+        name (str): The name of the layout and access pattern.
+        read (Callable[[], Iterable]): Returns an iterable of (key, image, meta) samples.
+        cold_files (List[str]): The files evicted from the page cache before reading, if any.
+    """
+    evict_from_page_cache(cold_files)
+    start = time.perf_counter()
+    samples = nbytes = 0
+    for _, data, _ in read():
+        samples += 1
+        nbytes += len(data)
+    seconds = time.perf_counter() - start
+    print(
+        f"{name:<32} {samples / seconds:10.0f} samples/s {nbytes / 1e6 / seconds:8.1f} MB/s "
+        f"({samples} samples in {seconds:.2f}s)"
+    )
+
+
+def benchmark(
+    anno_file: str, images_dir: str, out_dir: str, num_samples: int, cold: bool
+) -> None:
+    """
+    Compare reading the samples from the directory layout and from the shards, in random order as
+    a dataloader with a random sampler does, and sequentially with shard-level shuffling.
+
+    Args:
+        anno_file (str): Path to the COCO annotation file.
+        images_dir (str): Directory containing the image files.
+        out_dir (str): The shard directory.
+        num_samples (int): The number of samples read at random.
+        cold (bool): Whether to evict the files from the page cache before every measurement.
+    """
+    reader = ShardReader(out_dir)
+    image_files = {
+        os.path.splitext(image["file_name"])[0]: os.path.join(images_dir, image["file_name"])
+        for image in iter_coco_array(anno_file, "images")
+    }
+    keys = random.Random(0).sample(list(image_files), min(num_samples, len(image_files)))
+    image_cold = list(image_files.values()) if cold else []
+    shard_cold = glob(os.path.join(out_dir, "shard-*.tar")) if cold else []
+
+    def read_dir_random():
+        for key in keys:
+            with open(image_files[key], "rb") as f:
+                yield key, f.read(), None
+
+    def read_shards_random():
+        return (reader[key] for key in keys)
+
+    measure("directory, random order", read_dir_random, image_cold)
+    measure("shards, random order", read_shards_random, shard_cold)
+    measure("directory, all in order", lambda: iter_coco_samples(anno_file, images_dir), image_cold)
+    measure(
+        "shards, all shuffled", lambda: reader.iter_samples(shuffle=True, seed=0), shard_cold
+    )
+
+
+def verify(anno_file: str, images_dir: str, out_dir: str) -> None:
+    """
+    Check that the shards yield the same samples as the directory layout, in the same order.
+
+    Args:
+        anno_file (str): Path to the COCO annotation file.
+        images_dir (str): Directory containing the image files.
+        out_dir (str): The shard directory.
+    """
+    reader = ShardReader(out_dir)
+    count = 0
+    samples = zip_longest(iter_coco_samples(anno_file, images_dir), reader.iter_samples())
+    for expected, packed in samples:
+        if expected is None or packed is None:
+            raise ValueError(f"The shards have {len(reader)} samples, the directory layout differs")
+        if expected != packed:
+            raise ValueError(f"Sample {expected[0]} differs from the packed sample {packed[0]}")
+        count += 1
+    print(f"Verified {count} samples")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Pack a COCO format dataset split into tar shards with an offset index."
+    )
+    parser.add_argument("--anno_file", type=str, required=True, help="COCO annotation file")
+    parser.add_argument("--images_dir", type=str, required=True, help="Image directory")
+    parser.add_argument("--out_dir", type=str, required=True, help="Shard directory")
+    parser.add_argument(
+        "--shard_size_mb", type=int, default=1024, help="Size of a shard in megabytes"
+    )
+    parser.add_argument(
+        "--skip_pack", action="store_true", help="Use the existing shards in out_dir"
+    )
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="Check that the shards yield the same samples as the directory layout",
+    )
+    parser.add_argument(
+        "--benchmark",
+        action="store_true",
+        help="Compare the read throughput of the shards and the directory layout",
+    )
+    parser.add_argument(
+        "--num_samples", type=int, default=5000, help="Samples read at random in the benchmark"
+    )
+    parser.add_argument(
+        "--cold",
+        action="store_true",
+        help="Evict the files from the page cache before every benchmark measurement",
+    )
+    args = parser.parse_args()
+
+    if not args.skip_pack:
+        start = time.perf_counter()
+        index = pack_coco_shards(
+            args.anno_file, args.images_dir, args.out_dir, args.shard_size_mb * 1024 * 1024
+        )
+        count = sum(len(shard["samples"]) for shard in index["shards"])
+        print(
+            f"Packed {count} samples into {len(index['shards'])} shards "
+            f"in {time.perf_counter() - start:.1f}s"
+        )
+    if args.verify:
+        verify(args.anno_file, args.images_dir, args.out_dir)
+    if args.benchmark:
+        benchmark(args.anno_file, args.images_dir, args.out_dir, args.num_samples, args.cold)
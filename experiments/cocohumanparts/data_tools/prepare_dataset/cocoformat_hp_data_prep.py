@@ -1,9 +1,16 @@
+import gc
 import os
+import re
 import json
+import time
+import argparse
 import numpy as np
 from tqdm import tqdm
 import shutil
-from typing import Dict, List, Tuple
+from itertools import chain, repeat
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from od_engine.utils.boxes import box_area, convert_boxes
+from od_engine.utils.coco_stream import CocoStreamWriter, batched, iter_coco_array
 
 
 categories = [
@@ -17,19 +24,21 @@ categories = [
 ]
 
 
-def process_coco_human_parts(anno_data_file: str, dest_anno_file: str) -> None:
-    with open(anno_data_file, "r") as f:
-        anno_data = json.load(f)
+def convert_annotations_loop(annos: List[Dict]) -> List[Dict]:
+    """
+    This function converts person annotations with "hier" part boxes to COCO annotations, one
+    annotation at a time. It is kept as the reference for `convert_annotations`.
 
-    new_anno_data = {
-        "categories": categories,
-        "annotations": [],
-        "images": anno_data["images"],
-    }
+    Args:
+        annos (List[Dict]): Person annotations with a 30 value "hier" list, modified in place.
 
+    Returns:
+        List[Dict]: The person annotations followed by their part annotations, with new ids.
+
+    """
     new_annos = []
     new_anno_count = 1
-    for anno in tqdm(anno_data["annotations"]):
+    for anno in tqdm(annos):
         anno_hier = anno["hier"]
         del anno["hier"]
         anno["id"] = new_anno_count
@@ -53,20 +62,291 @@ def process_coco_human_parts(anno_data_file: str, dest_anno_file: str) -> None:
                 part_anno["id"] = new_anno_count
                 new_anno_count += 1
                 new_annos.append(part_anno)
+    return new_annos
+
+
+def _part_bboxes(parts: np.ndarray, is_int: Optional[np.ndarray]) -> List[List[float]]:
+    """
+    This function converts part boxes from xyxy to xywh lists with the number types Python
+    arithmetic on the original JSON values would give.
+
+    Args:
+        parts (np.ndarray): An (M, 5) array of [x_min, y_min, x_max, y_max, visible] rows.
+        is_int (Optional[np.ndarray]): An (M, 5) mask of values that were ints in the JSON, or None
+            if all values have the dtype of `parts`.
+
+    Returns:
+        List[List[float]]: A list of [x, y, w, h] boxes.
+
+    """
+    xywh = convert_boxes(parts[:, :4], "xyxy", "xywh", out=np.empty((len(parts), 4), parts.dtype))
+    if is_int is None:
+        return xywh.tolist()
+
+    # A coordinate stays an int if it was one, a width or height if both of its ends were
+    int_xywh = np.concatenate([is_int[:, :2], is_int[:, 2:4] & is_int[:, :2]], axis=1)
+    out = xywh.astype(object)
+    out[int_xywh] = xywh[int_xywh].astype(np.int64).astype(object)
+    return out.tolist()
+
+
+def _hier_parts(annos: List[Dict], start_id: int = 1) -> List[Tuple]:
+    """
+    This function computes the new ids and the part annotations of all person annotations with
+    array operations over their stacked "hier" vectors.
+
+    Args:
+        annos (List[Dict]): Person annotations with a 30 value "hier" list. The "hier" lists are
+            removed and the "id" and "category_id" of every person are updated in place.
+        start_id (int, optional): The id of the first annotation. Defaults to 1.
+
+    Returns:
+        List[Tuple]: One (person index, bbox, area, category_id, id) tuple per visible part, in
+            output order.
+
+    """
+    hiers = [anno.pop("hier") for anno in annos]
+    hier = np.array(hiers).reshape(-1, 6, 5)
+
+    # Track which values were ints when the JSON mixes ints and floats
+    is_int = None
+    if hier.dtype.kind == "f":
+        is_int = np.fromiter(
+            map(isinstance, chain.from_iterable(hiers), repeat(int)),
+            dtype=bool,
+            count=hier.size,
+        ).reshape(hier.shape)
+        if not is_int.any():
+            is_int = None
+
+    # New ids: every person is followed by its visible parts
+    mask = hier[:, :, 4] != 0
+    counts = 1 + mask.sum(axis=1)
+    person_ids = np.cumsum(counts) - counts + start_id
+    person_idx, part_idx = np.nonzero(mask)
+    part_ids = person_ids[person_idx] + np.cumsum(mask, axis=1)[person_idx, part_idx]
+
+    parts = hier[person_idx, part_idx]
+    part_areas = np.abs(box_area(parts[:, :4].astype(np.float64))).astype(np.int64)
+    part_bboxes = _part_bboxes(
+        parts, None if is_int is None else is_int[person_idx, part_idx]
+    )
+
+    for anno, anno_id in zip(annos, person_ids.tolist()):
+        anno["id"] = anno_id
+        anno["category_id"] = 1
+    return list(
+        zip(
+            person_idx.tolist(),
+            part_bboxes,
+            part_areas.tolist(),
+            (part_idx + 2).tolist(),
+            part_ids.tolist(),
+        )
+    )
+
+
+def convert_annotations(annos: List[Dict]) -> List[Dict]:
+    """
+    This function converts person annotations with "hier" part boxes to COCO annotations with
+    array operations over all annotations at once. The result is identical to
+    `convert_annotations_loop`.
+
+    Args:
+        annos (List[Dict]): Person annotations with a 30 value "hier" list, modified in place.
+
+    Returns:
+        List[Dict]: The person annotations followed by their part annotations, with new ids.
+
+    """
+    part_rows = _hier_parts(annos)
+    new_annos: List[Dict] = []
+    rows = iter(part_rows)
+    row = next(rows, None)
+    for i, anno in enumerate(annos):
+        new_annos.append(anno)
+        while row is not None and row[0] == i:
+            _, bbox, area, category_id, anno_id = row
+            new_annos.append(
+                dict(anno, bbox=bbox, area=area, category_id=category_id, id=anno_id)
+            )
+            row = next(rows, None)
+    return new_annos
+
+
+# Placeholders for the values that differ between a person and its part annotations
+_FIELDS = ("bbox", "area", "category_id", "id")
+_MARKERS = {field: f"\0{field}\0" for field in _FIELDS}
+_MARKER_FIELDS = {json.dumps(marker): field for field, marker in _MARKERS.items()}
+_MARKER_RE = re.compile("|".join(map(re.escape, _MARKER_FIELDS)))
+
 
-    new_anno_data["annotations"] = new_annos
+def encode_annotations(annos: List[Dict], start_id: int = 1) -> List[str]:
+    """
+    This function converts person annotations with "hier" part boxes to JSON encoded COCO
+    annotations. The fields shared by a person and its parts, such as keypoints and segmentation,
+    are encoded once per person and the part annotations are spliced from that template. The texts
+    are identical to encoding the annotations of `convert_annotations_loop` with `json.dumps`.
+
+    Args:
+        annos (List[Dict]): Person annotations with a 30 value "hier" list, modified in place.
+        start_id (int, optional): The id of the first annotation. Defaults to 1.
+
+    Returns:
+        List[str]: The JSON text of the person annotations followed by their part annotations.
+
+    """
+    part_rows = _hier_parts(annos, start_id)
+
+    # Encode all part boxes in one call, a box is a flat list of numbers
+    bbox_texts = []
+    if part_rows:
+        bbox_texts = json.dumps([row[1] for row in part_rows])[2:-2].split("], [")
+
+    texts: List[str] = []
+    j = 0
+    for i, anno in enumerate(annos):
+        texts.append(json.dumps(anno))
+        if j == len(part_rows) or part_rows[j][0] != i:
+            continue
+
+        # Encode the person once with placeholders, in the key order the parts will have
+        template = json.dumps(dict(anno, **_MARKERS))
+        pieces = _MARKER_RE.split(template)
+        fields = [_MARKER_FIELDS[m] for m in _MARKER_RE.findall(template)]
+        while j < len(part_rows) and part_rows[j][0] == i:
+            _, _, area, category_id, anno_id = part_rows[j]
+            values = {
+                "bbox": "[" + bbox_texts[j] + "]",
+                "area": str(area),
+                "category_id": str(category_id),
+                "id": str(anno_id),
+            }
+            texts.append(_splice(pieces, fields, values))
+            j += 1
+    return texts
+
+
+def _splice(pieces: List[str], fields: List[str], values: Dict[str, str]) -> str:
+    """
+    This function fills the placeholders of an encoded template with encoded values.
+
+    Args:
+        pieces (List[str]): The template text split at its placeholders.
+        fields (List[str]): The field of every placeholder, in order.
+        values (Dict[str, str]): The encoded value of every field.
+
+    Returns:
+        str: The filled in JSON text.
+
+    """
+    out = [pieces[0]]
+    for field, piece in zip(fields, pieces[1:]):
+        out.append(values[field])
+        out.append(piece)
+    return "".join(out)
+
+
+def process_coco_human_parts_loop(anno_data_file: str, dest_anno_file: str) -> None:
+    """
+    This function converts a COCO human parts annotation file with the per-annotation loop and
+    `json.dump`. It is kept as the baseline for `process_coco_human_parts`.
+
+    Args:
+        anno_data_file (str): Path to COCO human parts annotation file.
+        dest_anno_file (str): Path to the converted annotation file.
+
+    """
+    with open(anno_data_file, "r") as f:
+        anno_data = json.load(f)
+
+    new_anno_data = {
+        "categories": categories,
+        "annotations": convert_annotations_loop(anno_data["annotations"]),
+        "images": anno_data["images"],
+    }
 
     with open(dest_anno_file, "w") as f:
         json.dump(new_anno_data, f)
 
 
-if __name__ == "__main__":
-    anno_file = "/Users/narsi/Downloads/person_humanparts_train2017.json"
-    dest_anno_file = "/Users/narsi/projects/datasets/cocohumanparts/person_humanparts_train2017_coco_format.json"
+def _encode_batches(annos: Iterable[Dict], batch_size: int) -> Iterator[str]:
+    """
+    This function runs `encode_annotations` over batches of a stream of person annotations.
+
+    Args:
+        annos (Iterable[Dict]): Person annotations with a 30 value "hier" list.
+        batch_size (int): The number of person annotations converted at once.
 
-    process_coco_human_parts(anno_file, dest_anno_file)
+    Yields:
+        str: The JSON text of the person annotations followed by their part annotations.
+
+    """
+    next_id = 1
+    for batch in batched(annos, batch_size):
+        texts = encode_annotations(batch, start_id=next_id)
+        next_id += len(texts)
+        yield from texts
+
+
+def process_coco_human_parts(
+    anno_data_file: str, dest_anno_file: str, batch_size: int = 10000
+) -> None:
+    """
+    This function converts a COCO human parts annotation file to a COCO annotation file with one
+    annotation per person and per visible part. The annotations are streamed through the
+    conversion in batches, so memory use does not grow with the file. The output is
+    byte-identical to `process_coco_human_parts_loop`.
+
+    Args:
+        anno_data_file (str): Path to COCO human parts annotation file.
+        dest_anno_file (str): Path to the converted annotation file.
+        batch_size (int, optional): The number of person annotations converted at once.
+            Defaults to 10000.
+
+    """
+    # The annotations hold no reference cycles, so the cyclic GC would only rescan
+    # the objects of every batch while they are being created
+    gc.disable()
+    try:
+        with CocoStreamWriter(dest_anno_file) as writer:
+            writer.write("categories", categories)
+            writer.write_encoded_array(
+                "annotations",
+                _encode_batches(iter_coco_array(anno_data_file, "annotations"), batch_size),
+            )
+            writer.write_array("images", iter_coco_array(anno_data_file, "images"))
+    finally:
+        gc.enable()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Convert COCO human parts annotations to COCO format."
+    )
+    parser.add_argument("--anno_file", type=str, help="COCO human parts annotation file")
+    parser.add_argument("--dest_anno_file", type=str, help="Converted annotation file")
+    parser.add_argument(
+        "--compare",
+        action="store_true",
+        help="Also run the per-annotation loop and report the speedup and byte equality",
+    )
+    args = parser.parse_args()
 
-    anno_file = "/Users/narsi/Downloads/person_humanparts_val2017.json"
-    dest_anno_file = "/Users/narsi/projects/datasets/cocohumanparts/person_humanparts_val2017_coco_format.json"
+    start = time.perf_counter()
+    process_coco_human_parts(args.anno_file, args.dest_anno_file)
+    seconds = time.perf_counter() - start
+    print(f"Converted {args.anno_file} in {seconds:.2f}s")
 
-    process_coco_human_parts(anno_file, dest_anno_file)
+    if args.compare:
+        loop_anno_file = args.dest_anno_file.replace(".json", "_loop.json")
+        start = time.perf_counter()
+        process_coco_human_parts_loop(args.anno_file, loop_anno_file)
+        loop_seconds = time.perf_counter() - start
+        with open(args.dest_anno_file, "rb") as f, open(loop_anno_file, "rb") as g:
+            identical = f.read() == g.read()
+        os.remove(loop_anno_file)
+        print(
+            f"Loop conversion took {loop_seconds:.2f}s, "
+            f"speedup {loop_seconds / seconds:.1f}x, byte-identical: {identical}"
+        )
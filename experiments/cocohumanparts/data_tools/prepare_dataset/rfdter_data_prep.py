@@ -1,12 +1,17 @@
 import os
 import json
+import argparse
 import yaml
-from PIL import Image
-import shutil
 from glob import glob
+import numpy as np
+from typing import Optional
 
+from od_engine.utils.boxes import box_area, convert_boxes, denormalize_boxes
+from od_engine.utils.imsize import ImageSizeIndex
+from od_engine.utils.link import FileStager, add_link_mode_argument
 
-# Function to convert YOLO bbox to COCO bbox
+
+# Function to convert YOLO bbox to COCO bbox, kept as the reference of yolo_to_coco_bboxes
 def yolo_to_coco_bbox(yolo_bbox, img_width, img_height):
     x_center, y_center, width, height = map(float, yolo_bbox)
     x_center *= img_width
@@ -18,14 +23,51 @@ def yolo_to_coco_bbox(yolo_bbox, img_width, img_height):
     return [x_min, y_min, width, height]
 
 
-if __name__ == "__main__":
-    dataset_name = "cocohumanparts"
-    # Paths to your Ultralytics dataset
-    ultralytics_root = (
-        "/home/ubuntu/data/cocohumanparts"  # Replace with your ultralytics folder
-    )
-    # Target dataset paths
-    target_root = "/home/ubuntu/data/cocohumanparts_rf"  # Replace with where you want the new dataset
+def yolo_to_coco_bboxes(
+    yolo_bboxes: np.ndarray, img_width: np.ndarray, img_height: np.ndarray
+) -> np.ndarray:
+    """
+    This function converts normalized YOLO boxes to absolute COCO boxes with the arithmetic of
+    `yolo_to_coco_bbox`, for all boxes at once.
+
+    Args:
+        yolo_bboxes (np.ndarray): An (N, 4) array of normalized [x_center, y_center, w, h].
+        img_width (np.ndarray): The image width of every box.
+        img_height (np.ndarray): The image height of every box.
+
+    Returns:
+        np.ndarray: An (N, 4) array of [x_min, y_min, width, height] in pixels.
+    """
+    boxes = denormalize_boxes(yolo_bboxes, img_width, img_height)
+    return convert_boxes(boxes, "cxcywh", "xywh", out=boxes)
+
+
+def convert_dataset(
+    ultralytics_root: str,
+    target_root: str,
+    dataset_name: str = "cocohumanparts",
+    link_mode: str = "copy",
+    size_index_file: Optional[str] = None,
+) -> None:
+    """
+    This function converts an Ultralytics dataset to the COCO layout used by RF-DETR, with one
+    folder per split holding the images and an _annotations.coco.json file.
+
+    Args:
+        ultralytics_root (str): The Ultralytics dataset folder with data.yaml.
+        target_root (str): The folder of the new dataset.
+        dataset_name (str, optional): The name in the COCO info. Defaults to "cocohumanparts".
+        link_mode (str, optional): How images are placed in the target, see `FileStager`.
+            Defaults to "copy".
+        size_index_file (str, optional): The image size index file. Defaults to None
+            (~/.cache/od_engine/image_sizes.json).
+
+    Returns:
+        None
+
+    """
+    stager = FileStager(link_mode)
+    size_index = ImageSizeIndex(size_index_file)
 
     splits = ["train", "val"]  # "test"
     target_splits = ["train", "valid"]  # "test"
@@ -71,13 +113,19 @@ if __name__ == "__main__":
         target_image_dir = os.path.join(target_root, target_split)
 
         image_id = 0
-        annotation_id = 0
+        label_rows, label_images = [], []
 
-        # Process each image
-        for src_image_path in glob(image_dir + os.sep + "*.*"):
-            if not src_image_path.endswith((".jpg", ".jpeg", ".png")):
-                continue
+        src_image_paths = [
+            p
+            for p in glob(image_dir + os.sep + "*.*")
+            if p.endswith((".jpg", ".jpeg", ".png"))
+        ]
+        # Get image dimensions from the headers, or the index if the image is unchanged
+        image_sizes = size_index.get_sizes(src_image_paths)
+        size_index.save()
 
+        # Process each image
+        for src_image_path in src_image_paths:
             dst_image_path = (
                 src_image_path.replace(os.sep + "images", "")
                 .replace(ultralytics_root, target_root)
@@ -85,11 +133,9 @@ if __name__ == "__main__":
             )
 
             print(src_image_path, dst_image_path)
-            shutil.copy(src_image_path, dst_image_path)
+            stager.stage(src_image_path, dst_image_path)
 
-            # Get image dimensions
-            with Image.open(src_image_path) as img:
-                img_width, img_height = img.size
+            img_width, img_height = image_sizes[src_image_path]
 
             # Add image to COCO JSON
             coco_data["images"].append(
@@ -111,30 +157,33 @@ if __name__ == "__main__":
                         parts = line.strip().split()
                         if len(parts) < 5:
                             continue  # Skip invalid lines
-                        class_id, x_center, y_center, width, height = parts[:5]
-                        class_id = int(class_id)  # + 1  # COCO class IDs start at 1
-
-                        # Convert YOLO bbox to COCO bbox
-                        bbox = yolo_to_coco_bbox(
-                            [x_center, y_center, width, height], img_width, img_height
-                        )
-                        area = bbox[2] * bbox[3]  # width * height
-
-                        # Add annotation to COCO JSON
-                        coco_data["annotations"].append(
-                            {
-                                "id": annotation_id,
-                                "image_id": image_id,
-                                "category_id": class_id,
-                                "bbox": bbox,
-                                "area": area,
-                                "iscrowd": 0,
-                            }
-                        )
-                        annotation_id += 1
+                        label_rows.append(parts[:5])
+                        label_images.append((image_id, img_width, img_height))
 
             image_id += 1
 
+        # Convert all YOLO bboxes of the split to COCO bboxes at once
+        class_ids = [int(row[0]) for row in label_rows]  # + 1  # COCO class IDs start at 1
+        yolo_bboxes = np.array([row[1:] for row in label_rows], dtype=np.float64).reshape(-1, 4)
+        images = np.array(label_images, dtype=np.int64).reshape(-1, 3)
+        bboxes = yolo_to_coco_bboxes(yolo_bboxes, images[:, 1], images[:, 2])
+        areas = box_area(bboxes, "xywh")  # width * height
+
+        # Add annotations to COCO JSON
+        for annotation_id, (anno_image_id, class_id, bbox, area) in enumerate(
+            zip(images[:, 0].tolist(), class_ids, bboxes.tolist(), areas.tolist())
+        ):
+            coco_data["annotations"].append(
+                {
+                    "id": annotation_id,
+                    "image_id": anno_image_id,
+                    "category_id": class_id,
+                    "bbox": bbox,
+                    "area": area,
+                    "iscrowd": 0,
+                }
+            )
+
         # Save COCO JSON
         coco_json_path = os.path.join(target_image_dir, "_annotations.coco.json")
         with open(coco_json_path, "w") as f:
@@ -142,4 +191,38 @@ if __name__ == "__main__":
 
         print(f"Finished processing {split} split. Saved to {coco_json_path}")
 
+    print(stager.summary())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Convert an Ultralytics dataset to the COCO layout used by RF-DETR."
+    )
+    add_link_mode_argument(parser)
+    parser.add_argument(
+        "--size_index",
+        type=str,
+        default=None,
+        help="Image size index file, defaults to ~/.cache/od_engine/image_sizes.json",
+    )
+    parser.add_argument(
+        "--ultralytics_root",
+        type=str,
+        default="/home/ubuntu/data/cocohumanparts",
+        help="Ultralytics dataset folder",
+    )
+    parser.add_argument(
+        "--target_root",
+        type=str,
+        default="/home/ubuntu/data/cocohumanparts_rf",
+        help="Folder of the new dataset",
+    )
+    args = parser.parse_args()
+
+    convert_dataset(
+        args.ultralytics_root,
+        args.target_root,
+        link_mode=args.link_mode,
+        size_index_file=args.size_index,
+    )
     print("Conversion complete!")
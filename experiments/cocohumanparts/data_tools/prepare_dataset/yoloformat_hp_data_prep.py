@@ -1,9 +1,13 @@
 import os
 import json
+import argparse
 import numpy as np
 from tqdm import tqdm
-import shutil
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from od_engine.utils.boxes import convert_boxes, normalize_boxes
+from od_engine.utils.link import FileStager, add_link_mode_argument
 
 
 def sort_labels_by_image_id(labels_list: List[Dict]) -> Dict[str, List[Dict]]:
@@ -33,7 +37,8 @@ def normalize_bbox(
     bbox: Tuple[float, float, float, float], img_w: int, img_h: int
 ) -> Tuple[float, float, float, float]:
     """
-    This function normalizes the bounding box coordinates to be in [0, 1] range.
+    This function normalizes the bounding box coordinates to be in [0, 1] range. It is kept with
+    the other scalar converters as the reference of `label_texts`.
 
     Args:
         bbox (Tuple[float, float, float, float]): A tuple of (x, y, width, height).
@@ -112,8 +117,135 @@ def convert_hpbbox_to_yolo(
     return normalize_bbox(bbox, img_w, img_h)
 
 
+def image_label_text_loop(image_info: Dict, person_annos: List[Dict]) -> str:
+    """
+    This function builds the YOLO label file contents of one image, one box at a time with the
+    scalar converters. It is kept as the reference for `label_texts`.
+
+    Args:
+        image_info (Dict): The COCO image entry with "width" and "height".
+        person_annos (List[Dict]): The person annotations of the image, with "bbox" and "hier".
+
+    Returns:
+        str: One "class x_center y_center width height" line per person and visible part.
+
+    """
+    img_w, img_h = image_info["width"], image_info["height"]
+
+    person_txt_list: List[List[float]] = []
+    for person_anno in person_annos:
+        person_bbox = convert_pbbox_to_yolo(person_anno["bbox"], img_w, img_h)
+        person_txt_list.append([0] + list(person_bbox))
+
+        for part_label in range(1, 7):
+            hier_index = (part_label - 1) * 5
+            part_bbox = person_anno["hier"][hier_index : hier_index + 4]
+            part_ignore = person_anno["hier"][hier_index + 4]
+            if part_ignore != 0:
+                yolo_part_bbox = convert_hpbbox_to_yolo(part_bbox, img_w, img_h)
+                person_txt_list.append([part_label] + list(yolo_part_bbox))
+    return "".join(" ".join(map(str, row)) + "\n" for row in person_txt_list)
+
+
+def fix_yolo_boxes(boxes: np.ndarray, img_wh: np.ndarray) -> None:
+    """
+    This function corrects xywh boxes in place as `convert_pbbox_to_yolo` does: a box past the
+    right or bottom edge ends one pixel before it, then a box past the left or top edge starts
+    at 0.
+
+    Args:
+        boxes (np.ndarray): An (N, 4) array of [x, y, w, h] boxes.
+        img_wh (np.ndarray): An (N, 2) array of the image width and height of every box.
+
+    """
+    xy, wh = boxes[:, :2], boxes[:, 2:]
+    over = xy + wh > img_wh
+    wh[over] = (img_wh - 1 - xy)[over]
+    under = xy < 0
+    wh[under] += xy[under]
+    xy[under] = 0
+
+
+def label_texts(items: List[Tuple[Dict, List[Dict]]]) -> List[str]:
+    """
+    This function builds the YOLO label file contents of many images at once, converting the
+    boxes of all their persons and parts with the `od_engine.utils.boxes` array kernels. The
+    labels are the same as those of `image_label_text_loop`.
+
+    Args:
+        items (List[Tuple[Dict, List[Dict]]]): The COCO image entries with "width" and "height",
+            with their person annotations with "bbox" and "hier".
+
+    Returns:
+        List[str]: For every image, one "class x_center y_center width height" line per person
+            and visible part.
+
+    """
+    person_annos = [anno for _, annos in items for anno in annos]
+    if not person_annos:
+        return [""] * len(items)
+    persons_per_image = [len(annos) for _, annos in items]
+    img_wh = np.repeat(
+        np.array([[info["width"], info["height"]] for info, _ in items], dtype=np.float64),
+        persons_per_image,
+        axis=0,
+    )
+    hier = np.array([anno["hier"] for anno in person_annos], dtype=np.float64).reshape(-1, 6, 5)
+
+    # Every person is followed by its visible parts, labelled 1 to 6
+    boxes = np.empty((len(person_annos), 7, 4))
+    boxes[:, 0] = [anno["bbox"] for anno in person_annos]
+    convert_boxes(hier[:, :, :4], "xyxy", "xywh", out=boxes[:, 1:])
+    visible = np.ones((len(person_annos), 7), dtype=bool)
+    visible[:, 1:] = hier[:, :, 4] != 0
+    person_idx, labels = np.nonzero(visible)
+    boxes, img_wh = boxes[visible], img_wh[person_idx]
+
+    fix_yolo_boxes(boxes, img_wh)
+    convert_boxes(boxes, "xywh", "cxcywh", out=boxes)
+    normalize_boxes(boxes, img_wh[:, 0], img_wh[:, 1], out=boxes)
+
+    lines = [
+        f"{label} {x} {y} {w} {h}\n"
+        for label, (x, y, w, h) in zip(labels.tolist(), boxes.tolist())
+    ]
+    image_idx = np.repeat(np.arange(len(items)), persons_per_image)[person_idx]
+    rows_per_image = np.bincount(image_idx, minlength=len(items))
+    ends = np.cumsum(rows_per_image).tolist()
+    return ["".join(lines[end - rows : end]) for end, rows in zip(ends, rows_per_image.tolist())]
+
+
+def _image_paths(
+    image_info: Dict, images_dir: str, dst_images_dir: str, dst_labels_dir: str
+) -> Tuple[str, str, str]:
+    """
+    This function returns the source image, destination image and destination label paths.
+
+    Args:
+        image_info (Dict): The COCO image entry with "file_name".
+        images_dir (str): Directory containing the image files.
+        dst_images_dir (str): Directory where images will be staged.
+        dst_labels_dir (str): Directory where labels will be saved.
+
+    Returns:
+        Tuple[str, str, str]: The source image, destination image and label file paths.
+
+    """
+    img_file_name = image_info["file_name"]
+    img_ext = img_file_name.split(".")[-1]
+    return (
+        os.path.join(images_dir, img_file_name),
+        os.path.join(dst_images_dir, img_file_name),
+        os.path.join(dst_labels_dir, img_file_name.replace(img_ext, "txt")),
+    )
+
+
 def process_coco_human_parts(
-    anno_data_file: str, images_dir: str, dst_images_dir: str, dst_labels_dir: str
+    anno_data_file: str,
+    images_dir: str,
+    dst_images_dir: str,
+    dst_labels_dir: str,
+    link_mode: str = "copy",
 ) -> None:
     """
     This function processes the COCO human parts annotations to be in YOLO format and saves them.
@@ -121,13 +253,16 @@ def process_coco_human_parts(
     Args:
         anno_data_file (str): Path to COCO human parts annotation file.
         images_dir (str): Directory containing the image files.
-        dst_images_dir (str): Directory where images will be copied.
+        dst_images_dir (str): Directory where images will be staged.
         dst_labels_dir (str): Directory where labels will be saved.
+        link_mode (str, optional): How images are placed in dst_images_dir, see `FileStager`.
+            Defaults to "copy".
 
     Returns:
         None
 
     """
+    stager = FileStager(link_mode)
     with open(anno_data_file, "r") as f:
         anno_data = json.load(f)
     os.makedirs(dst_images_dir, exist_ok=True)
@@ -135,41 +270,145 @@ def process_coco_human_parts(
 
     images_anno_data = sort_labels_by_image_id(anno_data["annotations"])
     images_info = anno_data["images"]
+    text_strings = label_texts(
+        [
+            (image_info, images_anno_data.get(str(image_info["id"]), []))
+            for image_info in images_info
+        ]
+    )
 
-    for image_info in tqdm(images_info, desc="Processing images"):
-        img_id = image_info["id"]
-        img_w, img_h = image_info["width"], image_info["height"]
-
-        img_file_name = image_info["file_name"]
-        img_ext = img_file_name.split(".")[-1]
-        img_file_path = os.path.join(images_dir, img_file_name)
-        dst_img_file_path = os.path.join(dst_images_dir, img_file_name)
-        dst_label_path = os.path.join(
-            dst_labels_dir, img_file_name.replace(img_ext, "txt")
+    for image_info, text_string in tqdm(
+        zip(images_info, text_strings), total=len(images_info), desc="Processing images"
+    ):
+        img_file_path, dst_img_file_path, dst_label_path = _image_paths(
+            image_info, images_dir, dst_images_dir, dst_labels_dir
         )
 
-        person_txt_list: List[List[float]] = []
-        for person_anno in images_anno_data[str(img_id)]:
-            person_bbox = convert_pbbox_to_yolo(person_anno["bbox"], img_w, img_h)
-            person_txt_list.append([0] + list(person_bbox))
-
-            for part_label in range(1, 7):
-                hier_index = (part_label - 1) * 5
-                part_bbox = person_anno["hier"][hier_index : hier_index + 4]
-                part_ignore = person_anno["hier"][hier_index + 4]
-                if part_ignore != 0:
-                    yolo_part_bbox = convert_hpbbox_to_yolo(part_bbox, img_w, img_h)
-                    person_txt_list.append([part_label] + list(yolo_part_bbox))
-            text_string = ""
-            for row in person_txt_list:
-                text_string += " ".join(map(str, row)) + "\n"
-
-        shutil.copyfile(img_file_path, dst_img_file_path)
+        stager.stage(img_file_path, dst_img_file_path)
         with open(dst_label_path, "w") as f:
             f.write(text_string)
+    print(stager.summary())
+
+
+def _export_shard(
+    shard: List[Tuple[Dict, List[Dict]]],
+    images_dir: str,
+    dst_images_dir: str,
+    dst_labels_dir: str,
+    link_mode: str,
+) -> Tuple[int, Dict[str, Dict[str, int]]]:
+    """
+    This function exports a contiguous range of images of a split in a worker process.
+
+    Args:
+        shard (List[Tuple[Dict, List[Dict]]]): The image entries with their person annotations.
+        images_dir (str): Directory containing the image files.
+        dst_images_dir (str): Directory where images will be staged.
+        dst_labels_dir (str): Directory where labels will be saved.
+        link_mode (str): How images are placed in dst_images_dir, see `FileStager`.
+
+    Returns:
+        Tuple[int, Dict[str, Dict[str, int]]]: The number of images exported and the stats of
+            the `FileStager`.
+
+    """
+    # Build all label files of the shard first, then copy and write in one pass
+    labels = list(
+        zip(
+            [
+                _image_paths(image_info, images_dir, dst_images_dir, dst_labels_dir)
+                for image_info, _ in shard
+            ],
+            label_texts(shard),
+        )
+    )
+    stager = FileStager(link_mode)
+    for (img_file_path, dst_img_file_path, dst_label_path), text_string in labels:
+        stager.stage(img_file_path, dst_img_file_path)
+        with open(dst_label_path, "w") as f:
+            f.write(text_string)
+    return len(labels), stager.stats()
+
+
+def process_coco_human_parts_sharded(
+    splits: List[Tuple[str, str, str, str]],
+    workers: Optional[int] = None,
+    shards_per_worker: int = 4,
+    link_mode: str = "copy",
+) -> None:
+    """
+    This function processes several splits of COCO human parts annotations to YOLO format at
+    once. The images of every split are cut into contiguous shards that a process pool exports
+    concurrently, so the output is the same as running `process_coco_human_parts` on every split.
+
+    Args:
+        splits (List[Tuple[str, str, str, str]]): One (anno_data_file, images_dir, dst_images_dir,
+            dst_labels_dir) tuple per split, as for `process_coco_human_parts`.
+        workers (Optional[int], optional): The number of worker processes. Defaults to the CPU
+            count.
+        shards_per_worker (int, optional): The number of shards per worker and split, more shards
+            balance the load better. Defaults to 4.
+        link_mode (str, optional): How images are placed in the destination, see `FileStager`.
+            Defaults to "copy".
+
+    Returns:
+        None
+
+    """
+    workers = workers or os.cpu_count() or 1
+    stager = FileStager(link_mode)
+    with ProcessPoolExecutor(workers) as executor:
+        futures = []
+        total = 0
+        for anno_data_file, images_dir, dst_images_dir, dst_labels_dir in splits:
+            with open(anno_data_file, "r") as f:
+                anno_data = json.load(f)
+            os.makedirs(dst_images_dir, exist_ok=True)
+            os.makedirs(dst_labels_dir, exist_ok=True)
+
+            images_anno_data = sort_labels_by_image_id(anno_data["annotations"])
+            items = [
+                (image_info, images_anno_data.get(str(image_info["id"]), []))
+                for image_info in anno_data["images"]
+            ]
+            del anno_data, images_anno_data
+            total += len(items)
+
+            # Shards start as soon as their split is loaded, while the next one is read
+            shard_size = max(1, -(-len(items) // (workers * shards_per_worker)))
+            for start in range(0, len(items), shard_size):
+                futures.append(
+                    executor.submit(
+                        _export_shard,
+                        items[start : start + shard_size],
+                        images_dir,
+                        dst_images_dir,
+                        dst_labels_dir,
+                        link_mode,
+                    )
+                )
+
+        with tqdm(total=total, desc="Processing images") as bar:
+            for future in as_completed(futures):
+                count, stats = future.result()
+                stager.merge(stats)
+                bar.update(count)
+    print(stager.summary())
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Convert COCO human parts annotations to a YOLO dataset."
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of worker processes, 1 processes the splits one after the other",
+    )
+    add_link_mode_argument(parser)
+    args = parser.parse_args()
+
     val_image_dir = "C:\\local\\datasets\\mscoco\\coco\\images\\val2017"
     train_image_dir = "C:\\local\\datasets\\mscoco\\coco\\images\\train2017"
 
@@ -182,12 +421,17 @@ if __name__ == "__main__":
     dst_train_image_dir = os.path.join(dst_dir, "images", "train")
     dst_val_label_dir = os.path.join(dst_dir, "labels", "val")
     dst_train_label_dir = os.path.join(dst_dir, "labels", "train")
-    # process train data
-    process_coco_human_parts(
-        train_anno_file, train_image_dir, dst_train_image_dir, dst_train_label_dir
-    )
 
-    # process val data
-    process_coco_human_parts(
-        val_anno_file, val_image_dir, dst_val_image_dir, dst_val_label_dir
-    )
+    splits = [
+        (train_anno_file, train_image_dir, dst_train_image_dir, dst_train_label_dir),
+        (val_anno_file, val_image_dir, dst_val_image_dir, dst_val_label_dir),
+    ]
+    if args.workers > 1:
+        # process train and val data concurrently
+        process_coco_human_parts_sharded(
+            splits, workers=args.workers, link_mode=args.link_mode
+        )
+    else:
+        # process train data, then val data
+        for split in splits:
+            process_coco_human_parts(*split, link_mode=args.link_mode)
@@ -1,8 +1,11 @@
 import os
 from glob import glob
-import json
-import shutil
 import yaml
+from contextlib import ExitStack
+from typing import Dict, Iterable, Iterator, List, Optional
+from od_engine.utils.atomic import snapshot_file, stageable_dirs, staged_dir
+from od_engine.utils.coco_stream import CocoStreamWriter, iter_coco_array
+from od_engine.utils.labels import ClassMap, remap_label_dirs, remap_label_files
 
 categories = [
     {"id": 1, "supercategory": "person", "name": "person"},
@@ -10,35 +13,39 @@ categories = [
     {"id": 3, "supercategory": "face", "name": "face"},
 ]
 
-def process_coco_human_parts(anno_data_file: str) -> None:
+# COCO category ids: keep person, head and face (1 to 3) and drop the hands and feet
+COCO_CLASS_MAP = ClassMap({1: 1, 2: 2, 3: 3})
+# YOLO class ids: keep person, head and face (0 to 2) and drop the hands and feet
+YOLO_CLASS_MAP = ClassMap({0: 0, 1: 1, 2: 2})
+
+
+def _filter_annotations(annos: Iterable[Dict]) -> Iterator[Dict]:
+    """Yields the annotations of classes 1 to 3."""
+    for anno in annos:
+        if COCO_CLASS_MAP(anno["category_id"]) < 0:
+            continue
+        yield anno
+
+
+def process_coco_human_parts(anno_data_file: str, backup: bool = True) -> None:
     """
     Read COCO label file and modify class values:
     - Remove classes 4 and above (hands and legs)
     """
-    with open(anno_data_file, "r") as f:
-        anno_data = json.load(f)
-
-    backup_anno_file = anno_data_file.replace(".json", "_backup.json")
-    shutil.copyfile(anno_data_file, backup_anno_file)
-    print(f"Backup created at {backup_anno_file}")
-
-    new_anno_data = {
-        "categories": categories,
-        "annotations": [],
-        "images": anno_data["images"],
-    }
-
-    new_annos = []
-    for anno in anno_data["annotations"]:
-        class_id = anno["category_id"]
-        if class_id > 3:
-            continue
-        new_annos.append(anno)
-
-    new_anno_data["annotations"] = new_annos
-
-    with open(anno_data_file, "w") as f:
-        json.dump(new_anno_data, f)
+    if backup:
+        # The original file is replaced rather than rewritten, so a hardlink keeps it intact
+        backup_anno_file = anno_data_file.replace(".json", "_backup.json")
+        snapshot_file(anno_data_file, backup_anno_file)
+        print(f"Backup created at {backup_anno_file}")
+
+    # Stream the annotations into a new file that atomically replaces the original one
+    with CocoStreamWriter(anno_data_file) as writer:
+        writer.write("categories", categories)
+        writer.write_array(
+            "annotations",
+            _filter_annotations(iter_coco_array(anno_data_file, "annotations")),
+        )
+        writer.write_array("images", iter_coco_array(anno_data_file, "images"))
 
 
 def yoloformat_process_yolo_labels(input_file):
@@ -46,68 +53,54 @@ def yoloformat_process_yolo_labels(input_file):
     Read YOLO label file and modify class values:
     - Remove classes 3 and above (hands and legs)
     """
+    remap_label_files([input_file], YOLO_CLASS_MAP)
 
-    with open(input_file, "r") as f:
-        lines = f.readlines()
-
-    modified_lines = []
-    for line in lines:
-        if not line.strip():
-            continue
-
-        try:
-            values = line.strip().split(" ")
-            if len(values) != 5:
-                print(f"Warning: Invalid format in line: {line.strip()}")
-                continue
-
-            class_id = int(values[0])
-            # remove hands and legs
-            if class_id > 2:
-                continue 
-            x1, y1, x2, y2 = values[1:]
-            new_line = f"{class_id} {x1} {y1} {x2} {y2}\n"
-            modified_lines.append(new_line)
-
-        except ValueError:
-            print(f"Warning: Invalid number format in line: {line.strip()}")
-            continue
-
-    with open(input_file, "w") as f:
-        f.writelines(modified_lines)
-
-
-def yoloformat_process_dir(input_dir):
-    # Make a backup of the original folder
-    backup_dir = input_dir + "_backup"
 
-    if os.path.exists(backup_dir):
-        shutil.rmtree(backup_dir)
-    shutil.copytree(input_dir, backup_dir)
-    print(f"Backup created at {backup_dir}")
-
-    files = glob(os.path.join(input_dir, "*.txt"))
-    for input_path in files:
-        yoloformat_process_yolo_labels(input_path)
+def yoloformat_process_dirs(
+    input_dirs: List[str], workers: Optional[int] = None, backup: bool = True
+) -> None:
+    """
+    Remap the YOLO label files of label folders with `YOLO_CLASS_MAP`, spreading the files of all
+    folders across a process pool. Every folder is transformed in a hardlinked staging copy that
+    replaces it once all folders are done, and the original folder becomes the backup.
+    """
+    with ExitStack() as stack:
+        staging_dirs = [
+            stack.enter_context(
+                staged_dir(input_dir, input_dir + "_backup" if backup else None)
+            )
+            for input_dir in input_dirs
+        ]
+        stats = remap_label_dirs(staging_dirs, YOLO_CLASS_MAP, workers=workers)
+    if backup:
+        print(f"Backups created at {', '.join(d + '_backup' for d in input_dirs)}")
+    print(
+        f"Processed {stats['files']} label files ({stats['changed']} changed): "
+        f"{stats['kept']} labels kept, "
+        f"{stats['dropped']} dropped, {stats['invalid']} invalid"
+    )
 
 
-def update_data_yaml(local_dataset_dir: str) -> None:
+def update_data_yaml(local_dataset_dir: str, backup: bool = True) -> None:
     data_yaml_path = os.path.join(local_dataset_dir, "data.yaml")
 
     # Load the existing data.yaml file
     with open(data_yaml_path, "r") as data_file:
         data = yaml.safe_load(data_file)
 
-    backup_anno_file = data_yaml_path.replace(".yaml", "_backup.yaml")
-    shutil.copyfile(data_yaml_path, backup_anno_file)
-    print(f"Backup created at {backup_anno_file}")
+    if backup:
+        backup_anno_file = data_yaml_path.replace(".yaml", "_backup.yaml")
+        snapshot_file(data_yaml_path, backup_anno_file)
+        print(f"Backup created at {backup_anno_file}")
 
     # Update the data.yaml file with the new local dataset directory
     data["names"] = {0: "person", 1: "head", 2: "face"}
 
     # Save the updated data.yaml file
-    with open(data_yaml_path, "w") as updated_data_file:
+    tmp_data_yaml_path = data_yaml_path + ".tmp"
+    with open(tmp_data_yaml_path, "w") as updated_data_file:
         yaml.dump(data, updated_data_file)
+    os.replace(tmp_data_yaml_path, data_yaml_path)
 
 
 if __name__ == "__main__":
@@ -124,6 +117,18 @@ if __name__ == "__main__":
         help="Format type: coco or yolo",
     )
 
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of worker processes for YOLO labels, defaults to the CPU count",
+    )
+    parser.add_argument(
+        "--no_backup",
+        action="store_true",
+        help="Do not keep the original annotations as *_backup files and folders",
+    )
+
     args = parser.parse_args()
 
     datafolder = args.datafolder
@@ -131,12 +136,12 @@ if __name__ == "__main__":
 
     if format_type == "coco":
         files = glob(os.path.join(datafolder, "*", "*.json"))
+        # skip the backups of earlier runs
+        files = [f for f in files if not f.endswith("_backup.json")]
         for input_path in files:
-            process_coco_human_parts(input_path)
+            process_coco_human_parts(input_path, backup=not args.no_backup)
     elif format_type == "yolo":
-        update_data_yaml(datafolder)
-        folders = glob(os.path.join(datafolder, "labels", "*"))
-        for f in folders:
-            # check if it is a directory
-            if os.path.isdir(f):
-                yoloformat_process_dir(f)
+        update_data_yaml(datafolder, backup=not args.no_backup)
+        # only process directories, skipping the backups and staging folders of earlier runs
+        folders = stageable_dirs(os.path.join(datafolder, "labels"))
+        yoloformat_process_dirs(folders, workers=args.workers, backup=not args.no_backup)
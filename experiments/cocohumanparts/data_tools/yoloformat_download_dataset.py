@@ -2,7 +2,7 @@ import os
 import argparse
 import yaml
 from pathlib import Path
-from od_engine.utils.download import download
+from od_engine.utils.scheduler import DownloadTask, schedule_downloads
 
 
 def update_data_yaml(local_dataset_dir: str) -> None:
@@ -22,52 +22,60 @@ def update_data_yaml(local_dataset_dir: str) -> None:
     # Update the data.yaml file with the new local dataset directory
     data["path"] = os.path.abspath(local_dataset_dir)
 
-    # Save the updated data.yaml file
-    with open(data_yaml_path, "w") as updated_data_file:
+    # Save the updated data.yaml file, replacing the one hardlinked from the download cache
+    tmp_data_yaml_path = data_yaml_path + ".tmp"
+    with open(tmp_data_yaml_path, "w") as updated_data_file:
         yaml.dump(data, updated_data_file)
+    os.replace(tmp_data_yaml_path, data_yaml_path)
 
 
-def main(local_dataset_dir):
+def main(local_dataset_dir, cache_dir=None):
     """
     This function downloads the COCO Human Parts dataset and its corresponding data.yaml file
     from a remote URL to a local directory.
 
     Args:
         local_dataset_dir (str): The local directory to store the downloaded dataset. Defaults to the current directory.
+        cache_dir (str, optional): The download cache directory; files already in it are
+            hardlinked instead of downloaded. Defaults to None.
     """
     # Remote URL for the dataset and data.yaml file
     remote_dataset_url = (
         "https://huggingface.co/datasets/testdummyvt/cocohumanparts/resolve/main"
     )
 
-    # Download data.yaml
+    # URL for data.yaml
     data_yaml_url = remote_dataset_url + "/data.yaml"
-    download(data_yaml_url, local_dataset_dir)
-
-    # Update data.yaml file with current local dataset directory
-    update_data_yaml(local_dataset_dir)
 
     # URLs for the training and validation labels
     labels_train_url = remote_dataset_url + "/labels/train.zip"
     labels_val_url = remote_dataset_url + "/labels/val.zip"
-
-    # Download labels in parallel using 2 threads
-    download(
-        [labels_train_url, labels_val_url],
-        local_dataset_dir + os.sep + "labels",
-        threads=2,
-    )
+    local_labels_dir = local_dataset_dir + os.sep + "labels"
 
     # URLs for the training and validation images
     images_train_url = remote_dataset_url + "/images/train.zip"
     images_val_url = remote_dataset_url + "/images/val.zip"
-
-    # Download images in parallel using 2 threads
-    download(
-        [images_train_url, images_val_url],
-        local_dataset_dir + os.sep + "images",
-        threads=2,
+    local_images_dir = local_dataset_dir + os.sep + "images"
+
+    # Download data.yaml, labels and images in one manifest
+    results = schedule_downloads(
+        [
+            DownloadTask(data_yaml_url, local_dataset_dir),
+            DownloadTask(labels_train_url, local_labels_dir),
+            DownloadTask(labels_val_url, local_labels_dir),
+            DownloadTask(images_train_url, local_images_dir),
+            DownloadTask(images_val_url, local_images_dir),
+        ],
+        cache_dir=cache_dir,
     )
+    failed = [r for r in results if not r.ok]
+    if failed:
+        raise RuntimeError(
+            "Failed to download " + ", ".join(f"{r.url} ({r.error})" for r in failed)
+        )
+
+    # Update data.yaml file with current local dataset directory
+    update_data_yaml(local_dataset_dir)
 
 
 if __name__ == "__main__":
@@ -79,10 +87,16 @@ if __name__ == "__main__":
         default=".",
         help="The local directory to store the downloaded dataset.",
     )
+    parser.add_argument(
+        "--cache_dir",
+        type=str,
+        default=None,
+        help="The download cache directory, reused across datasets and runs.",
+    )
 
     # Parse the argument and get the local dataset directory
     args = parser.parse_args()
     local_dataset_dir = args.local_dataset_dir
 
     # Call the main function with the specified local dataset directory
-    main(local_dataset_dir)
+    main(local_dataset_dir, cache_dir=args.cache_dir)
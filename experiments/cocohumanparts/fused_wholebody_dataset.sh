@@ -1,16 +1,13 @@
 # Script to download and prepare dataset on hyperbolic
 
 LOCAL_DIR="/home/ubuntu/datasets/cocohumanparts"
+CACHE_DIR="/home/ubuntu/datasets/download_cache"
 
 # # Download the dataset
-# python data_tools/yoloformat_download_dataset.py --local_dataset_dir $LOCAL_DIR
+# python data_tools/yoloformat_download_dataset.py --local_dataset_dir $LOCAL_DIR --cache_dir $CACHE_DIR
 # # Create fused hands and legs dataset
 # python data_tools/fuse_hands_legs.py --datafolder $LOCAL_DIR --format_type yolo
 
-# Download dataset in coco format
-python data_tools/cocoformat_download_dataset.py --local_dataset_dir $LOCAL_DIR
-# Create fused hands and legs dataset in coco format
-python data_tools/fuse_hands_legs.py --datafolder $LOCAL_DIR --format_type coco
-
-# Remove backup files
-rm -rf $LOCAL_DIR/annotations/*backup.json
\ No newline at end of file
+# Download the dataset in coco format and apply the label transform. Steps whose inputs and
+# outputs are unchanged since the last run are skipped; add --yolo_dataset_dir for the yolo format
+python data_tools/dataset_pipeline.py --local_dataset_dir $LOCAL_DIR --cache_dir $CACHE_DIR --transform fuse_hands_legs
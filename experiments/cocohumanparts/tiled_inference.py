@@ -0,0 +1,155 @@
+import os
+import json
+import glob
+import time
+import argparse
+import tempfile
+import yaml
+import numpy as np
+from od_engine.utils.boxes import convert_boxes
+from od_engine.utils.imcache import read_image
+from od_engine.utils.serving import load_model
+from od_engine.utils.tiling import STAGES, TiledDetector
+from benchmark_serving import tiny_detector
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Detect on overlapping tiles of high resolution images and time the stages."
+    )
+    parser.add_argument(
+        "--model",
+        type=str,
+        default=None,
+        help="OpenVINO .xml or .onnx file, a tiny random detector if unset",
+    )
+    parser.add_argument(
+        "--input_size",
+        type=int,
+        nargs=2,
+        default=None,
+        help="Input height and width of a model exported with a dynamic input size",
+    )
+    parser.add_argument(
+        "--images", type=str, default=None, help="Directory of .jpg images, 4K noise if unset"
+    )
+    parser.add_argument(
+        "--num_images", type=int, default=8, help="Images to detect on, all of --images if 0"
+    )
+    parser.add_argument(
+        "--config", type=str, default=None, help="Experiment config to take the tile_config of"
+    )
+    parser.add_argument(
+        "--tile_size", type=int, nargs=2, default=None, help="Tile height and width"
+    )
+    parser.add_argument("--overlap", type=float, default=None, help="Tile overlap ratio")
+    parser.add_argument("--iou_threshold", type=float, default=None, help="IoU of the merge NMS")
+    parser.add_argument(
+        "--max_num_instances", type=int, default=None, help="Detections kept per image"
+    )
+    parser.add_argument("--batch_size", type=int, default=8, help="Tiles per inference")
+    parser.add_argument(
+        "--workers", type=int, default=min(4, os.cpu_count()), help="Preprocessing threads"
+    )
+    parser.add_argument(
+        "--num_threads", type=int, default=None, help="Inference threads, all cores if unset"
+    )
+    parser.add_argument(
+        "--confidence_threshold",
+        type=float,
+        default=None,
+        help="Smallest score kept, the threshold of the model if unset",
+    )
+    parser.add_argument("--output", type=str, default=None, help="JSON detections and timings")
+    args = parser.parse_args()
+
+    tile_config = {}
+    if args.config:
+        with open(args.config, "r") as f:
+            tile_config = yaml.safe_load(f)["data"].get("tile_config", {})
+    for key in ("tile_size", "overlap", "iou_threshold", "max_num_instances"):
+        if getattr(args, key) is not None:
+            tile_config[key] = getattr(args, key)
+
+    if args.images:
+        files = sorted(glob.glob(os.path.join(args.images, "*.jpg")))
+        files = files[: args.num_images] if args.num_images else files
+        if not files:
+            parser.error(f"No .jpg images in {args.images}")
+    else:
+        files = [f"noise_{i}.jpg" for i in range(args.num_images)]
+        if not files:
+            parser.error("Set a positive --num_images without --images")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        model_path = args.model or tiny_detector(os.path.join(tmp_dir, "tiny_detector.xml"))
+        model = load_model(model_path, args.num_threads, input_size=args.input_size)
+    rng = np.random.default_rng(0)
+
+    results, seconds = [], 0.0
+    with TiledDetector.from_tile_config(
+        model,
+        tile_config,
+        batch_size=args.batch_size,
+        workers=args.workers,
+        confidence_threshold=args.confidence_threshold,
+    ) as detector:
+        print(
+            f"{model_path}, input {model.input_size}, tiles {detector.tile_size} with overlap "
+            f"{detector.overlap}, batch {detector.batch_size}, {args.workers} workers"
+        )
+        for file in files:
+            if args.images:
+                image = read_image(file)
+            else:
+                image = rng.integers(0, 256, (2160, 3840, 3), dtype=np.uint8)
+            start = time.perf_counter()
+            detections = detector.detect(image)
+            seconds += time.perf_counter() - start
+            boxes = convert_boxes(detections["boxes"], "xyxy", "xywh")
+            results.append(
+                {
+                    "file_name": os.path.basename(file),
+                    "height": image.shape[0],
+                    "width": image.shape[1],
+                    "bboxes": boxes.round(2).tolist(),
+                    "scores": detections["scores"].round(4).tolist(),
+                    "labels": [
+                        model.labels[i] if 0 <= i < len(model.labels) else i
+                        for i in detections["labels"].tolist()
+                    ],
+                }
+            )
+        timings, num_tiles = detector.timings, detector.num_tiles
+
+    num_images = len(results)
+    print(
+        f"{num_images} images, {num_tiles} tiles in {seconds:.2f}s: "
+        f"{seconds / num_images * 1000:.1f}ms per image, {num_tiles / seconds:.1f} tiles/s, "
+        f"{sum(len(r['scores']) for r in results) / num_images:.0f} detections per image"
+    )
+    for stage in STAGES:
+        print(
+            f"  {stage:<12} {timings[stage]:8.3f}s {timings[stage] / num_images * 1000:8.1f}ms "
+            f"per image {timings[stage] / seconds:6.1%}"
+        )
+    print(
+        f"  Preprocessing threads worked {timings['preprocess_workers']:.3f}s, "
+        f"{timings['preprocess_workers'] - timings['preprocess']:.3f}s hidden behind inference"
+    )
+
+    if args.output:
+        tmp_output = args.output + ".tmp"
+        with open(tmp_output, "w") as f:
+            json.dump(
+                {
+                    "model": args.model,
+                    "tile_config": tile_config,
+                    "seconds": seconds,
+                    "timings": timings,
+                    "num_tiles": num_tiles,
+                    "images": results,
+                },
+                f,
+            )
+        os.replace(tmp_output, args.output)
+        print(f"Detections saved to {args.output}")
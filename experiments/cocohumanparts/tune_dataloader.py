@@ -0,0 +1,315 @@
+import os
+import time
+import random
+import socket
+import argparse
+import psutil
+import yaml
+from typing import Dict, List, Optional
+from torch.utils.data import DataLoader
+from otx.core.data.mem_cache import MemCacheHandlerSingleton
+from od_engine.utils.coco_stream import iter_coco_array
+from od_engine.utils.otx_data import build_datamodule, load_config
+
+GB = 1000**3  # OTX parses "GB" as 10^9 bytes
+
+
+def worker_counts(configured: int, cpus: int) -> List[int]:
+    """
+    Returns the worker counts to try: powers of two up to the CPU count, the CPU count and the
+    configured count.
+
+    Args:
+        configured (int): The num_workers of the config.
+        cpus (int): The number of CPUs.
+
+    Returns:
+        List[int]: The worker counts in increasing order.
+    """
+    counts = {cpus, min(configured, cpus)}
+    count = 1
+    while count < cpus:
+        counts.add(count)
+        count *= 2
+    return sorted(counts)
+
+
+def cache_footprint(config: Dict, subset_name: str) -> int:
+    """
+    Estimates the bytes the memory cache needs to hold every decoded image of a subset.
+
+    Args:
+        config (Dict): The experiment config.
+        subset_name (str): The subset, e.g. train.
+
+    Returns:
+        int: The bytes of the decoded images, downscaled to mem_cache_img_max_size if set.
+    """
+    anno_file = os.path.join(
+        config["data_root"], "annotations", f"instances_{subset_name}.json"
+    )
+    max_size = config["data"].get("mem_cache_img_max_size")
+    total = 0
+    for image in iter_coco_array(anno_file, "images"):
+        height, width = image["height"], image["width"]
+        if max_size:
+            scale = min(1.0, max_size[0] / height, max_size[1] / width)
+            height, width = int(height * scale), int(width * scale)
+        total += height * width * 3
+    return total
+
+
+def _memory_in_use(process):
+    """Returns the RSS of a process and its children, which counts shared pages repeatedly."""
+    total = process.memory_info().rss
+    for child in process.children(recursive=True):
+        try:
+            total += child.memory_info().rss
+        except psutil.Error:
+            pass
+    return total
+
+
+def measure(
+    dataset,
+    batch_size: int,
+    indices: List[int],
+    workers: int,
+    prefetch: int,
+    warmup: int,
+    passes: int = 1,
+) -> Dict:
+    """
+    Iterates a dataloader over fixed indices and measures its steady throughput.
+
+    Args:
+        dataset (OTXDataset): The dataset.
+        batch_size (int): The batch size.
+        indices (List[int]): The sample indices, in order.
+        workers (int): The number of worker processes.
+        prefetch (int): The number of batches each worker loads ahead.
+        warmup (int): The batches of the first pass excluded from the throughput.
+        passes (int, optional): The passes over the indices, the last one is measured. More than
+            one measures a warm memory cache. Defaults to 1.
+
+    Returns:
+        Dict: The samples/s and the peak memory in use in bytes.
+    """
+    loader = DataLoader(
+        dataset,
+        batch_size=batch_size,
+        sampler=indices,
+        num_workers=workers,
+        prefetch_factor=prefetch if workers > 0 else None,
+        collate_fn=dataset.collate_fn,
+        persistent_workers=workers > 0,
+    )
+    process = psutil.Process()
+    peak = 0
+    for _ in range(passes):
+        times, sizes = [], []
+        for batch in loader:
+            times.append(time.perf_counter())
+            sizes.append(batch.batch_size)
+            peak = max(peak, _memory_in_use(process))
+    first = warmup if passes == 1 else 0
+    first = min(first, len(times) - 2)
+    rate = sum(sizes[first + 1 :]) / (times[-1] - times[first])
+    del loader
+    return {"samples_per_second": rate, "peak_memory": peak}
+
+
+class Tuner:
+    """
+    Measures dataloader settings within a deadline, keeping every measured trial.
+
+    Args:
+        dataset (OTXDataset): The dataset.
+        batch_size (int): The batch size.
+        indices (List[int]): The sample indices every trial iterates over.
+        deadline (float): The `time.perf_counter` value after which no trial starts.
+    """
+
+    def __init__(self, dataset, batch_size: int, indices: List[int], deadline: float):
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.indices = indices
+        self.deadline = deadline
+        self.trials: List[Dict] = []
+        self.trial_seconds = 0.0
+
+    def run(
+        self, workers: int, prefetch: int, cache: str = "0GB", passes: int = 1
+    ) -> Optional[Dict]:
+        """
+        Measures a setting unless the last trial's duration would overrun the deadline.
+
+        Args:
+            workers (int): The number of worker processes.
+            prefetch (int): The prefetch depth.
+            cache (str, optional): The mem_cache_size of the dataset. Defaults to "0GB".
+            passes (int, optional): The passes over the indices, see `measure`. Defaults to 1.
+
+        Returns:
+            Optional[Dict]: The trial, or None if it was skipped.
+        """
+        if self.trials and time.perf_counter() + self.trial_seconds > self.deadline:
+            print(f"Skipping workers={workers} prefetch={prefetch}: time budget reached")
+            return None
+        start = time.perf_counter()
+        result = measure(
+            self.dataset,
+            self.batch_size,
+            self.indices,
+            workers,
+            prefetch,
+            warmup=workers + 1,
+            passes=passes,
+        )
+        self.trial_seconds = time.perf_counter() - start
+        trial = {"workers": workers, "prefetch": prefetch, "cache": cache, **result}
+        self.trials.append(trial)
+        print(
+            f"workers={workers:<3} prefetch={prefetch:<2} cache={cache:<6} "
+            f"{trial['samples_per_second']:8.1f} samples/s "
+            f"{trial['peak_memory'] / GB:6.2f} GB in {self.trial_seconds:.1f}s"
+        )
+        return trial
+
+
+def choose(trials: List[Dict], memory_budget: int) -> Optional[Dict]:
+    """
+    Picks the fastest trial that fits the memory budget, preferring fewer workers when the
+    throughput is within 3 percent.
+
+    Args:
+        trials (List[Dict]): The measured trials.
+        memory_budget (int): The bytes the data loading may use.
+
+    Returns:
+        Optional[Dict]: The chosen trial, or None if none fits.
+    """
+    fitting = [t for t in trials if t["peak_memory"] <= memory_budget]
+    if not fitting:
+        return None
+    best = max(t["samples_per_second"] for t in fitting)
+    close = [t for t in fitting if t["samples_per_second"] >= 0.97 * best]
+    return min(close, key=lambda t: (t["workers"], t["prefetch"]))
+
+
+def write_overrides(
+    path: str, chosen: Dict, cache_size: str, trials: List[Dict], header: List[str]
+) -> None:
+    """
+    Writes the data config overrides, with the measured curve as comments.
+
+    Args:
+        path (str): The override YAML file.
+        chosen (Dict): The chosen trial.
+        cache_size (str): The mem_cache_size value.
+        trials (List[Dict]): The measured trials.
+        header (List[str]): Comment lines describing the machine.
+    """
+    lines = [f"# {line}" for line in header]
+    lines.append("# workers prefetch cache    samples/s  memory GB")
+    for t in trials:
+        lines.append(
+            f"# {t['workers']:7d} {t['prefetch']:8d} {t['cache']:>6} "
+            f"{t['samples_per_second']:11.1f} {t['peak_memory'] / GB:10.2f}"
+        )
+    if chosen["prefetch"] != 2:
+        lines.append(
+            f"# prefetch_factor {chosen['prefetch']} was fastest, but OTXDataModule always uses "
+            "the DataLoader default of 2"
+        )
+    overrides = {
+        "data": {
+            "train_subset": {"num_workers": chosen["workers"]},
+            "mem_cache_size": cache_size,
+            "auto_num_workers": False,
+        }
+    }
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+        yaml.safe_dump(overrides, f, sort_keys=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Tune num_workers, mem_cache_size and prefetch depth of the train dataloader."
+    )
+    parser.add_argument("--config", type=str, required=True, help="Experiment YAML file")
+    parser.add_argument(
+        "--output",
+        type=str,
+        default=None,
+        help="Override YAML file, defaults to <config>_dataloader.yaml",
+    )
+    parser.add_argument("--budget", type=float, default=600, help="Time budget in seconds")
+    parser.add_argument("--batches", type=int, default=30, help="Batches measured per trial")
+    parser.add_argument(
+        "--prefetch", type=int, nargs="+", default=[2, 4, 8], help="Prefetch depths to try"
+    )
+    parser.add_argument(
+        "--reserve_gb",
+        type=float,
+        default=8.0,
+        help="Memory kept free for the model and the training process",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the sample indices")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    deadline = start + args.budget
+    config = load_config(args.config)
+    train = config["data"]["train_subset"]
+    batch_size = train["batch_size"]
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+    available = psutil.virtual_memory().available
+    memory_budget = available - int(args.reserve_gb * GB)
+
+    # Throughput without the memory cache, as on the part of an epoch the cache cannot hold
+    datamodule = build_datamodule(config, mem_cache_size="0GB")
+    dataset = datamodule.subsets[train["subset_name"]]
+    rng = random.Random(args.seed)
+    counts = worker_counts(train.get("num_workers", 2), cpus)
+    num_batches = max(counts) + 1 + args.batches
+    indices = rng.choices(range(len(dataset)), k=num_batches * batch_size)
+
+    tuner = Tuner(dataset, batch_size, indices, deadline)
+    trials = tuner.trials
+
+    for workers in counts:
+        tuner.run(workers, 2)
+    best = choose(trials, memory_budget) or min(trials, key=lambda t: t["peak_memory"])
+    for prefetch in args.prefetch:
+        if prefetch != 2 and best["workers"] > 0:
+            tuner.run(best["workers"], prefetch)
+    chosen = choose(trials, memory_budget) or min(trials, key=lambda t: t["peak_memory"])
+
+    # The cache gets the memory the chosen setting leaves free, up to the whole subset
+    footprint = cache_footprint(config, train["subset_name"])
+    cache_bytes = max(0, min(footprint, memory_budget - chosen["peak_memory"]))
+    cache_size = f"{int(cache_bytes / GB * 10) / 10}GB"
+    if cache_bytes > 0 and time.perf_counter() + 2 * tuner.trial_seconds <= deadline:
+        # A second pass over the same samples shows the speed of a warm cache
+        del dataset, datamodule
+        MemCacheHandlerSingleton.delete()
+        datamodule = build_datamodule(config, mem_cache_size=cache_size)
+        tuner.dataset = datamodule.subsets[train["subset_name"]]
+        tuner.run(chosen["workers"], chosen["prefetch"], cache_size, passes=2)
+
+    header = [
+        f"Train dataloader tuned by tune_dataloader.py for {args.config}",
+        f"on {socket.gethostname()}: {cpus} CPUs, {available / GB:.1f} GB available, "
+        f"{args.reserve_gb:.1f} GB reserved, batch size {batch_size}",
+        f"The subset needs {footprint / GB:.1f} GB to be cached whole, memory is the RSS of "
+        "the loader and its workers",
+    ]
+    output = args.output or os.path.splitext(args.config)[0] + "_dataloader.yaml"
+    write_overrides(output, chosen, cache_size, trials, header)
+    print(
+        f"Chose workers={chosen['workers']} prefetch={chosen['prefetch']} "
+        f"mem_cache_size={cache_size}, saved to {output} "
+        f"after {time.perf_counter() - start:.0f}s"
+    )
@@ -1,5 +1,64 @@
+import os
+import argparse
+from od_engine.utils.serving import InferenceServer, load_model, make_http_server
+
+
 def main():
-    print("Hello from object-detetcion!")
+    parser = argparse.ArgumentParser(
+        description="Serve an exported detector on CPU with dynamic micro-batching over HTTP."
+    )
+    parser.add_argument(
+        "--model", type=str, required=True, help="OpenVINO .xml or .onnx file exported by OTX"
+    )
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="Address to listen on")
+    parser.add_argument("--port", type=int, default=8000, help="Port to listen on")
+    parser.add_argument("--max_batch_size", type=int, default=8, help="Largest batch")
+    parser.add_argument(
+        "--max_wait_ms",
+        type=float,
+        default=5.0,
+        help="Longest wait of the oldest request for its batch to fill",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=min(4, os.cpu_count()), help="Preprocessing threads"
+    )
+    parser.add_argument(
+        "--num_threads", type=int, default=None, help="Inference threads, all cores if unset"
+    )
+    parser.add_argument(
+        "--input_size",
+        type=int,
+        nargs=2,
+        default=None,
+        help="Input height and width of a model exported with a dynamic input size",
+    )
+    parser.add_argument(
+        "--confidence_threshold",
+        type=float,
+        default=None,
+        help="Smallest score returned, the threshold of the model if unset",
+    )
+    args = parser.parse_args()
+
+    model = load_model(args.model, args.num_threads, input_size=args.input_size)
+    with InferenceServer(
+        model,
+        max_batch_size=args.max_batch_size,
+        max_wait_ms=args.max_wait_ms,
+        preprocess_workers=args.workers,
+        confidence_threshold=args.confidence_threshold,
+    ) as server:
+        httpd = make_http_server(server, args.host, args.port)
+        print(
+            f"Serving {args.model} on http://{args.host}:{args.port}, POST /detect, GET /stats "
+            f"(batch {server.max_batch_size}, wait {args.max_wait_ms}ms)"
+        )
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            httpd.server_close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,334 @@
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional
+
+import numpy as np
+
+from od_engine.utils.coco_stream import (
+    CocoStreamWriter,
+    batched,
+    iter_coco_array,
+    load_coco_header,
+)
+
+FORMAT_VERSION = 1
+HIER_SIZE = 30  # Six parts of x1, y1, x2, y2 and a visibility flag
+
+# Annotation columns and their types, see `AnnotationStore` for the image columns
+ANNOTATION_COLUMNS = {
+    "id": np.int64,
+    "image_id": np.int64,
+    "category_id": np.int32,
+    "bbox": np.float64,
+    "area": np.float64,
+    "iscrowd": np.uint8,
+    "hier": np.float64,
+}
+
+
+class AnnotationStore:
+    """
+    A read-only, memory-mapped columnar store of COCO detection annotations.
+
+    A store is a directory with one ``.npy`` file per column and a small ``meta.json`` with the
+    remaining top level values of the COCO file (info, licenses, categories). The annotations are
+    grouped by image in the order of ``images``, and ``img_offsets`` is a CSR offset array: the
+    annotations of the i-th image are rows ``img_offsets[i]:img_offsets[i + 1]`` of every column.
+
+    Opening a store only maps the files, so it takes milliseconds regardless of its size, and
+    looking up the boxes of an image returns views of the mapped arrays without parsing anything.
+
+    Columns:
+        id, image_id (int64), category_id (int32), bbox (float64, N x 4 in COCO xywh),
+        area (float64), iscrowd (uint8) and, for COCO human parts, hier (float64, N x 30).
+        img_id (int64), img_file_name (str), img_width, img_height (int32) and
+        img_offsets (int64, num_images + 1).
+
+    Args:
+        path (str): The store directory.
+
+    Example:
+        >>> AnnotationStore.from_coco("person_humanparts_val2017.json", "val2017.annstore")
+        >>> store = AnnotationStore("val2017.annstore")
+        >>> boxes = store.image_annotations(store.image_index(139))["bbox"]
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        with open(self.path / "meta.json", "r") as f:
+            self.meta = json.load(f)
+        if self.meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported annotation store version in {self.path}")
+        self.columns = {
+            name: np.load(self.path / f"{name}.npy", mmap_mode="r")
+            for name in self.meta["columns"]
+        }
+        self._image_lut = None
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        """Returns a column, e.g. ``store["bbox"]``."""
+        return self.columns[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.columns
+
+    def __len__(self) -> int:
+        """The number of annotations."""
+        return len(self.columns["id"])
+
+    @property
+    def num_images(self) -> int:
+        """The number of images."""
+        return len(self.columns["img_id"])
+
+    @property
+    def header(self) -> Dict[str, Any]:
+        """The top level values of the COCO file other than images and annotations."""
+        return self.meta["header"]
+
+    def image_index(self, image_id: int) -> int:
+        """
+        Returns the position of an image in the store from its COCO id.
+
+        Args:
+            image_id (int): The COCO image id.
+
+        Returns:
+            int: The image index, for `image_slice` and the image columns.
+
+        Raises:
+            KeyError: If the store has no image with that id.
+        """
+        if self._image_lut is None:
+            img_id = self.columns["img_id"]
+            self._image_lut = np.full(int(img_id.max(initial=-1)) + 1, -1, dtype=np.int32)
+            self._image_lut[img_id] = np.arange(len(img_id), dtype=np.int32)
+        if not 0 <= image_id < len(self._image_lut) or self._image_lut[image_id] < 0:
+            raise KeyError(image_id)
+        return int(self._image_lut[image_id])
+
+    def image_slice(self, index: int) -> slice:
+        """
+        Returns the rows of the annotations of an image.
+
+        Args:
+            index (int): The image index.
+
+        Returns:
+            slice: The rows of the annotation columns that belong to the image.
+        """
+        offsets = self.columns["img_offsets"]
+        return slice(int(offsets[index]), int(offsets[index + 1]))
+
+    def image_annotations(self, index: int) -> Dict[str, np.ndarray]:
+        """
+        Returns the annotations of an image as views of the annotation columns.
+
+        Args:
+            index (int): The image index.
+
+        Returns:
+            Dict[str, np.ndarray]: Every annotation column, sliced to the image.
+        """
+        rows = self.image_slice(index)
+        return {name: self.columns[name][rows] for name in ANNOTATION_COLUMNS if name in self}
+
+    def iter_images(self) -> Iterator[Dict[str, Any]]:
+        """
+        Iterates over the images in store order.
+
+        Yields:
+            Dict[str, Any]: The COCO image entry with an extra "rows" slice of its annotations.
+        """
+        img_id, file_name = self.columns["img_id"], self.columns["img_file_name"]
+        width, height = self.columns["img_width"], self.columns["img_height"]
+        offsets = self.columns["img_offsets"].tolist()
+        for i in range(self.num_images):
+            yield {
+                "id": int(img_id[i]),
+                "file_name": str(file_name[i]),
+                "width": int(width[i]),
+                "height": int(height[i]),
+                "rows": slice(offsets[i], offsets[i + 1]),
+            }
+
+    @classmethod
+    def from_coco(
+        cls, coco_file: str, path: str, chunk_size: int = 100000
+    ) -> "AnnotationStore":
+        """
+        Converts a COCO JSON file to a store, streaming the file rather than loading it.
+
+        Only the columns of the store are kept from every annotation; fields such as segmentation
+        are dropped. The store has a hier column if any annotation has one, with zeros for the
+        annotations without it. Annotations are reordered to be grouped by image, keeping their
+        relative order within an image.
+
+        Args:
+            coco_file (str): Path to the COCO JSON file.
+            path (str): The store directory to write, which is replaced if it exists.
+            chunk_size (int, optional): The number of annotations converted at a time. Defaults
+                to 100000.
+
+        Returns:
+            AnnotationStore: The opened store.
+
+        Raises:
+            ValueError: If an annotation refers to an image that is not in the file.
+        """
+        images = list(iter_coco_array(coco_file, "images"))
+        img_id = np.array([image["id"] for image in images], dtype=np.int64)
+        columns = {
+            "img_id": img_id,
+            "img_file_name": np.array([image["file_name"] for image in images], dtype=str),
+            "img_width": np.array([image.get("width", 0) for image in images], dtype=np.int32),
+            "img_height": np.array([image.get("height", 0) for image in images], dtype=np.int32),
+        }
+        del images
+
+        chunks = {name: [] for name in ANNOTATION_COLUMNS}
+        for annos in batched(iter_coco_array(coco_file, "annotations"), chunk_size):
+            chunks["id"].append(np.array([a["id"] for a in annos], dtype=np.int64))
+            chunks["image_id"].append(np.array([a["image_id"] for a in annos], dtype=np.int64))
+            chunks["category_id"].append(
+                np.array([a["category_id"] for a in annos], dtype=np.int32)
+            )
+            chunks["bbox"].append(np.array([a["bbox"] for a in annos], dtype=np.float64))
+            chunks["area"].append(
+                np.array([a.get("area", a["bbox"][2] * a["bbox"][3]) for a in annos])
+            )
+            chunks["iscrowd"].append(np.array([a.get("iscrowd", 0) for a in annos], dtype=np.uint8))
+            # None for a chunk without hier, zeros for the annotations without one
+            rows = [i for i, a in enumerate(annos) if "hier" in a]
+            hier = None
+            if rows:
+                hier = np.zeros((len(annos), HIER_SIZE), dtype=np.float64)
+                hier[rows] = np.array([annos[i]["hier"] for i in rows]).reshape(-1, HIER_SIZE)
+            chunks["hier"].append(hier)
+
+        if all(hier is None for hier in chunks["hier"]):
+            chunks["hier"] = []
+        else:
+            chunks["hier"] = [
+                np.zeros((len(ids), HIER_SIZE)) if hier is None else hier
+                for ids, hier in zip(chunks["id"], chunks["hier"])
+            ]
+        for name, dtype in ANNOTATION_COLUMNS.items():
+            if chunks[name]:
+                columns[name] = np.concatenate(chunks[name]).astype(dtype, copy=False)
+            elif name != "hier":
+                shape = (0, 4) if name == "bbox" else (0,)
+                columns[name] = np.empty(shape, dtype=dtype)
+        del chunks
+
+        # Map image ids to image indices and group the annotations by image
+        lut = np.full(int(img_id.max(initial=-1)) + 1, -1, dtype=np.int64)
+        lut[img_id] = np.arange(len(img_id))
+        image_id = columns["image_id"]
+        known = (image_id >= 0) & (image_id < len(lut))
+        index = np.full(len(image_id), -1, dtype=np.int64)
+        index[known] = lut[image_id[known]]
+        if (index < 0).any():
+            missing = image_id[index < 0][0]
+            raise ValueError(f"Annotation refers to image {missing} which is not in {coco_file}")
+        order = np.argsort(index, kind="stable")
+        for name in ANNOTATION_COLUMNS:
+            if name in columns:
+                columns[name] = columns[name][order]
+        columns["img_offsets"] = np.zeros(len(img_id) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(index, minlength=len(img_id)), out=columns["img_offsets"][1:])
+
+        header = load_coco_header(coco_file)
+        cls.write(path, columns, header)
+        return cls(path)
+
+    @staticmethod
+    def write(path: str, columns: Dict[str, np.ndarray], header: Dict[str, Any]) -> None:
+        """
+        Writes a store from its columns, replacing the directory atomically.
+
+        Args:
+            path (str): The store directory.
+            columns (Dict[str, np.ndarray]): The annotation and image columns.
+            header (Dict[str, Any]): The top level values of the COCO file, e.g. categories.
+        """
+        path = Path(path)
+        tmp_path = path.with_name(path.name + ".tmp")
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        tmp_path.mkdir(parents=True)
+        for name, column in columns.items():
+            np.save(tmp_path / f"{name}.npy", np.ascontiguousarray(column))
+        with open(tmp_path / "meta.json", "w") as f:
+            json.dump(
+                {"version": FORMAT_VERSION, "columns": list(columns), "header": header}, f
+            )
+        # Directories cannot be replaced atomically, so the old store is moved aside first
+        old_path = path.with_name(path.name + ".old")
+        if path.exists():
+            shutil.rmtree(old_path, ignore_errors=True)
+            os.replace(path, old_path)
+        os.replace(tmp_path, path)
+        shutil.rmtree(old_path, ignore_errors=True)
+
+    def to_coco(
+        self,
+        coco_file: str,
+        batch_size: int = 100000,
+        keep: Optional[np.ndarray] = None,
+        columns: Optional[Dict[str, np.ndarray]] = None,
+    ) -> None:
+        """
+        Writes the store as a COCO JSON file, in store order.
+
+        Args:
+            coco_file (str): Path to the COCO JSON file to write.
+            batch_size (int, optional): The number of annotations converted at a time. Defaults
+                to 100000.
+            keep (np.ndarray, optional): A boolean mask of the annotations to write. Defaults to
+                None, all of them.
+            columns (Dict[str, np.ndarray], optional): Annotation columns to write instead of
+                those of the store, e.g. an edited "hier". Defaults to None.
+        """
+        values_of = {**self.columns, **(columns or {})}
+
+        def _images():
+            for image in self.iter_images():
+                del image["rows"]
+                yield image
+
+        def _annotations():
+            names = [name for name in ANNOTATION_COLUMNS if name in self]
+            for start in range(0, len(self), batch_size):
+                rows = slice(start, start + batch_size)
+                values = [values_of[name][rows] for name in names]
+                if keep is not None:
+                    values = [v[keep[rows]] for v in values]
+                for row in zip(*(v.tolist() for v in values)):
+                    yield dict(zip(names, row))
+
+        with CocoStreamWriter(coco_file) as writer:
+            for key, value in self.header.items():
+                writer.write(key, value)
+            writer.write_array("images", _images())
+            writer.write_array("annotations", _annotations())
+
+
+def open_store(path: str, coco_file: Optional[str] = None) -> AnnotationStore:
+    """
+    Opens a store, converting it from a COCO JSON file first if it is missing or older.
+
+    Args:
+        path (str): The store directory.
+        coco_file (str, optional): The COCO JSON file the store is built from. Defaults to None.
+
+    Returns:
+        AnnotationStore: The opened store.
+    """
+    meta_file = Path(path) / "meta.json"
+    if coco_file is not None and (
+        not meta_file.exists() or meta_file.stat().st_mtime < os.stat(coco_file).st_mtime
+    ):
+        return AnnotationStore.from_coco(coco_file, path)
+    return AnnotationStore(path)
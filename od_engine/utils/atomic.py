@@ -0,0 +1,156 @@
+import os
+import shutil
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+from od_engine.utils.link import FileStager
+
+# Suffixes of the temporary directories of `staged_dir`, `snapshot_dir` and `replace_dir`
+TEMP_SUFFIXES = (".staging", ".tmp", ".old")
+
+
+def snapshot_file(src: str, dst: str) -> None:
+    """
+    Snapshots a file as a hardlink, falling back to a copy across filesystems.
+
+    The snapshot keeps the current contents as long as the file is replaced rather than rewritten
+    in place, e.g. by `CocoStreamWriter` or a write to a temporary file and `os.replace`.
+
+    Args:
+        src (str): The file to snapshot.
+        dst (str): The snapshot path, which is replaced if it exists.
+    """
+    FileStager("hardlink").stage(src, dst)
+
+
+def snapshot_dir(src: str, dst: str) -> FileStager:
+    """
+    Snapshots a directory tree by hardlinking every file into a new tree.
+
+    The tree is built under a temporary name and renamed into place, so ``dst`` is either the old
+    snapshot or a complete new one.
+
+    Args:
+        src (str): The directory to snapshot.
+        dst (str): The snapshot directory, which is replaced if it exists.
+
+    Returns:
+        FileStager: The stager, whose counts tell how many files were linked or copied.
+    """
+    src, dst = Path(src), Path(dst)
+    tmp = dst.with_name(dst.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    stager = FileStager("hardlink")
+    for root, dirs, files in os.walk(src):
+        out_dir = tmp / Path(root).relative_to(src)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        for name in files:
+            stager.stage(os.path.join(root, name), out_dir / name)
+    shutil.rmtree(dst, ignore_errors=True)
+    os.replace(tmp, dst)
+    return stager
+
+
+def replace_dir(src: str, dst: str, backup: Optional[str] = None) -> None:
+    """
+    Moves a finished directory over another one with two renames, keeping the old one as a backup.
+
+    A crash between the renames leaves the old directory at ``backup`` (or ``dst`` + ".old") and
+    the new one at ``src``, never a mix of both.
+
+    Args:
+        src (str): The finished directory.
+        dst (str): The directory to replace.
+        backup (str, optional): Where the old directory is kept. Defaults to None (deleted).
+    """
+    old = backup if backup is not None else dst + ".old"
+    shutil.rmtree(old, ignore_errors=True)
+    os.replace(dst, old)
+    os.replace(src, dst)
+    if backup is None:
+        shutil.rmtree(old)
+
+
+def recover_dir(dst: str, backup: Optional[str] = None) -> None:
+    """
+    Cleans up after a `staged_dir` that was interrupted.
+
+    A crash between the renames of `replace_dir` leaves ``dst`` missing, in which case the old
+    directory is moved back from ``dst`` + ".old" or ``backup``. Stale staging directories are
+    removed.
+
+    Args:
+        dst (str): The directory that was transformed.
+        backup (str, optional): Where the old directory was kept. Defaults to None.
+    """
+    if not os.path.exists(dst):
+        for old in (dst + ".old", backup):
+            if old is not None and os.path.isdir(old):
+                os.replace(old, dst)
+                print(f"Restored {dst} from {old} after an interrupted run")
+                break
+    for stale in (dst + ".staging", dst + ".staging.tmp"):
+        shutil.rmtree(stale, ignore_errors=True)
+
+
+def stageable_dirs(parent: str, backup_suffix: str = "_backup") -> List[str]:
+    """
+    Lists the directories of a parent to transform with `staged_dir`, skipping the backups and
+    temporary directories of earlier runs after recovering the interrupted ones.
+
+    Args:
+        parent (str): The parent directory, e.g. the labels folder of a YOLO dataset.
+        backup_suffix (str, optional): The suffix of the backup directories. Defaults to
+            "_backup".
+
+    Returns:
+        List[str]: The sorted directories.
+    """
+    skip = TEMP_SUFFIXES + (backup_suffix,)
+    names = [name for name in os.listdir(parent) if os.path.isdir(os.path.join(parent, name))]
+    for name in names:
+        base = name
+        while base.endswith(skip):
+            base = next(base[: -len(suffix)] for suffix in skip if base.endswith(suffix))
+        if base != name:
+            dst = os.path.join(parent, base)
+            recover_dir(dst, dst + backup_suffix)
+    return sorted(
+        os.path.join(parent, name)
+        for name in os.listdir(parent)
+        if os.path.isdir(os.path.join(parent, name)) and not name.endswith(skip)
+    )
+
+
+@contextmanager
+def staged_dir(dst: str, backup: Optional[str] = None) -> Iterator[str]:
+    """
+    Transforms a directory out of place and swaps the result in when the transform succeeds.
+
+    The staging directory starts as a hardlink snapshot of ``dst``, so only the files the transform
+    replaces take new space. Files must be replaced (written to a new file), not rewritten in
+    place, because the snapshot shares them with ``dst``. If the transform raises, the staging
+    directory is removed and ``dst`` is left untouched. An earlier interrupted run is cleaned
+    up first with `recover_dir`.
+
+    Args:
+        dst (str): The directory to transform.
+        backup (str, optional): Where the old directory is kept. Defaults to None (deleted).
+
+    Yields:
+        str: The staging directory to transform.
+
+    Example:
+        >>> with staged_dir("labels/train", backup="labels/train_backup") as staging:
+        ...     remap_label_dirs([staging], class_map)
+    """
+    recover_dir(dst, backup)
+    staging = dst + ".staging"
+    snapshot_dir(dst, staging)
+    try:
+        yield staging
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    replace_dir(staging, dst, backup)
@@ -0,0 +1,412 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from od_engine.utils.annostore import HIER_SIZE, AnnotationStore
+from od_engine.utils.boxes import box_area, box_intersection, convert_boxes
+
+# The hier parts of a person, with category ids 2 to 7 as in the prepared COCO dataset
+PART_NAMES = ("head", "face", "lefthand", "righthand", "leftfoot", "rightfoot")
+PERSON_NAME = "person"
+EDGE_TOLERANCE = 1.0  # Pixels a box may extend past the image before it is out of the image
+# Reasons a box is degenerate, in order of precedence
+DEGENERATE_REASONS = ("non_finite", "empty", "tiny", "out_of_image")
+
+
+def box_table(store: AnnotationStore, start: int, stop: int) -> Dict[str, np.ndarray]:
+    """
+    Lists every box of a range of images: the annotations, and for a COCO Human Parts file with
+    "hier" vectors the visible parts of every person.
+
+    The parent of a part is its person: the person whose "hier" it comes from, or in the prepared
+    seven category layout, where every person is followed by its parts, the last person before it
+    in the same image.
+
+    Args:
+        store (AnnotationStore): The annotations.
+        start (int): The first image index.
+        stop (int): The image index after the last one.
+
+    Returns:
+        Dict[str, np.ndarray]: Per box, the store "row", the hier "part" or -1 for the annotation
+            itself, the "image" index, the "category_id", the xyxy "boxes", the "crowd" flag and
+            the table index of its "parent" person, or -1.
+    """
+    offsets = np.asarray(store["img_offsets"][start : stop + 1])
+    rows = np.arange(offsets[0], offsets[-1])
+    image = np.repeat(np.arange(start, stop), np.diff(offsets))
+    category_id = np.asarray(store["category_id"][offsets[0] : offsets[-1]])
+    crowd = np.asarray(store["iscrowd"][offsets[0] : offsets[-1]]) != 0
+    boxes = convert_boxes(np.asarray(store["bbox"][offsets[0] : offsets[-1]]), "xywh", "xyxy")
+    part = np.full(len(rows), -1, dtype=np.int64)
+
+    person_ids = [c["id"] for c in store.header.get("categories", []) if c["name"] == PERSON_NAME]
+    is_person = np.isin(category_id, person_ids)
+    if "hier" not in store:
+        # The last person at or before every row, if it is in the same image
+        last = np.maximum.accumulate(np.where(is_person, np.arange(len(rows)), -1))
+        parent = np.where(
+            ~is_person & (last >= offsets[:-1].repeat(np.diff(offsets)) - offsets[0]), last, -1
+        )
+        return {
+            "row": rows,
+            "part": part,
+            "image": image,
+            "category_id": category_id.astype(np.int64),
+            "boxes": boxes,
+            "crowd": crowd,
+            "parent": parent,
+        }
+
+    hier = np.asarray(store["hier"][offsets[0] : offsets[-1]]).reshape(-1, len(PART_NAMES), 5)
+    person, part_index = np.nonzero(hier[:, :, 4] != 0)
+    return {
+        "row": np.concatenate([rows, rows[person]]),
+        "part": np.concatenate([part, part_index]),
+        "image": np.concatenate([image, image[person]]),
+        "category_id": np.concatenate([category_id, part_index + 2]).astype(np.int64),
+        "boxes": np.concatenate([boxes, hier[person, part_index, :4]]),
+        "crowd": np.concatenate([crowd, crowd[person]]),
+        "parent": np.concatenate([np.full(len(rows), -1), person]),
+    }
+
+
+def find_duplicates(
+    table: Dict[str, np.ndarray], iou_threshold: float
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Finds the pairs of boxes of the same image and category with an IoU over a threshold.
+
+    The boxes are sorted by image, category and x_min, a sweep line over every image and
+    category. A box can only overlap the boxes after it that start before its x_max, so the
+    candidates are the next box of every box, then the one after, for the boxes that still
+    have one, until no box has. Crowd boxes are skipped.
+
+    Args:
+        table (Dict[str, np.ndarray]): The boxes of `box_table`.
+        iou_threshold (float): The IoU over which two boxes are duplicates.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: The table indices of the first and second
+            box of every pair, in table order, and their IoU.
+    """
+    index = np.flatnonzero(~table["crowd"])
+    boxes = table["boxes"][index]
+    order = np.lexsort((boxes[:, 0], table["category_id"][index], table["image"][index]))
+    index, boxes = index[order], boxes[order]
+    group = table["image"][index] * (table["category_id"].max(initial=0) + 1)
+    group += table["category_id"][index]
+
+    first, second = [], []
+    i = np.arange(len(index))
+    step = 1
+    while i.size:
+        i = i[i + step < len(index)]
+        j = i + step
+        i = i[(group[j] == group[i]) & (boxes[j, 0] < boxes[i, 2])]
+        j = i + step
+        overlap = (boxes[j, 1] < boxes[i, 3]) & (boxes[i, 1] < boxes[j, 3])
+        first.append(i[overlap])
+        second.append(j[overlap])
+        step += 1
+    first = np.concatenate(first) if first else np.empty(0, dtype=np.int64)
+    second = np.concatenate(second) if second else np.empty(0, dtype=np.int64)
+
+    intersection = box_intersection(boxes[first], boxes[second])
+    union = box_area(boxes[first]) + box_area(boxes[second]) - intersection
+    iou = np.divide(intersection, union, out=np.zeros_like(union), where=union > 0)
+    over = iou > iou_threshold
+    first, second = np.sort(np.stack([index[first[over]], index[second[over]]]), axis=0)
+    return first, second, iou[over]
+
+
+def find_outside_parent(
+    table: Dict[str, np.ndarray], min_inside: float
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Finds the parts with less than a ratio of their area inside their person box.
+
+    Args:
+        table (Dict[str, np.ndarray]): The boxes of `box_table`.
+        min_inside (float): The smallest ratio of the part area inside the person box.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The table indices of the parts and their inside ratio.
+    """
+    index = np.flatnonzero(table["parent"] >= 0)
+    boxes = table["boxes"][index]
+    area = box_area(boxes)
+    intersection = box_intersection(boxes, table["boxes"][table["parent"][index]])
+    inside = np.divide(intersection, area, out=np.zeros_like(area), where=area > 0)
+    outside = (inside < min_inside) & (area > 0)
+    return index[outside], inside[outside]
+
+
+def find_degenerate(
+    table: Dict[str, np.ndarray], widths: np.ndarray, heights: np.ndarray, min_size: float
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Finds the boxes with non-finite coordinates, no area, a side under a size, or that extend
+    past the image by more than `EDGE_TOLERANCE` pixels.
+
+    Args:
+        table (Dict[str, np.ndarray]): The boxes of `box_table`.
+        widths (np.ndarray): The width of every image of the store, 0 if unknown.
+        heights (np.ndarray): The height of every image of the store, 0 if unknown.
+        min_size (float): The smallest width and height of a box in pixels.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The table indices of the boxes and the index of their
+            first reason in `DEGENERATE_REASONS`.
+    """
+    boxes = table["boxes"]
+    wh = boxes[:, 2:] - boxes[:, :2]
+    image_wh = np.stack([widths[table["image"]], heights[table["image"]]], axis=1)
+    known = (image_wh > 0).all(axis=1)
+    out_of_image = known & (
+        (boxes[:, :2] < -EDGE_TOLERANCE).any(axis=1)
+        | (boxes[:, 2:] > image_wh + EDGE_TOLERANCE).any(axis=1)
+    )
+    flags = np.stack(
+        [
+            ~np.isfinite(boxes).all(axis=1),
+            (wh <= 0).any(axis=1),
+            (wh < min_size).any(axis=1),
+            out_of_image,
+        ]
+    )
+    index = np.flatnonzero(flags.any(axis=0))
+    return index, flags[:, index].argmax(axis=0)
+
+
+def audit_images(
+    store_path: str,
+    start: int,
+    stop: int,
+    iou_threshold: float = 0.7,
+    min_inside: float = 0.5,
+    min_size: float = 1.0,
+) -> Dict[str, Dict[str, np.ndarray]]:
+    """
+    Audits a range of images of a store, in a worker process.
+
+    Args:
+        store_path (str): The store directory.
+        start (int): The first image index.
+        stop (int): The image index after the last one.
+        iou_threshold (float, optional): See `find_duplicates`. Defaults to 0.7.
+        min_inside (float, optional): See `find_outside_parent`. Defaults to 0.5.
+        min_size (float, optional): See `find_degenerate`. Defaults to 1.0.
+
+    Returns:
+        Dict[str, Dict[str, np.ndarray]]: The "duplicates", "outside_parent" and "degenerate"
+            issues, with the store "row" and hier "part" of every box, see `audit_store`.
+    """
+    store = AnnotationStore(store_path)
+    table = box_table(store, start, stop)
+    first, second, iou = find_duplicates(table, iou_threshold)
+    outside, inside = find_outside_parent(table, min_inside)
+    widths = np.asarray(store["img_width"])
+    heights = np.asarray(store["img_height"])
+    degenerate, reason = find_degenerate(table, widths, heights, min_size)
+    parent = table["parent"][outside]
+    return {
+        "duplicates": {
+            "row": np.stack([table["row"][first], table["row"][second]], axis=1),
+            "part": np.stack([table["part"][first], table["part"][second]], axis=1),
+            "iou": iou,
+        },
+        "outside_parent": {
+            "row": table["row"][outside],
+            "part": table["part"][outside],
+            "parent_row": table["row"][parent],
+            "inside": inside,
+        },
+        "degenerate": {
+            "row": table["row"][degenerate],
+            "part": table["part"][degenerate],
+            "reason": reason,
+        },
+    }
+
+
+def audit_store(
+    store: AnnotationStore,
+    iou_threshold: float = 0.7,
+    min_inside: float = 0.5,
+    min_size: float = 1.0,
+    workers: Optional[int] = None,
+    shards_per_worker: int = 4,
+) -> Dict[str, Dict[str, np.ndarray]]:
+    """
+    Finds the duplicate, outside parent and degenerate boxes of a whole store.
+
+    The images are cut into contiguous shards of about the same number of annotations, which a
+    process pool audits with `audit_images`. Every worker maps the store itself, so only the
+    issues are sent back.
+
+    Args:
+        store (AnnotationStore): The annotations.
+        iou_threshold (float, optional): The IoU over which two boxes of the same image and
+            category are duplicates. Defaults to 0.7.
+        min_inside (float, optional): The smallest ratio of a part area inside its person box.
+            Defaults to 0.5.
+        min_size (float, optional): The smallest width and height of a box in pixels. Defaults
+            to 1.0.
+        workers (int, optional): The number of worker processes, 1 audits in this process.
+            Defaults to the CPU count.
+        shards_per_worker (int, optional): The number of shards per worker. Defaults to 4.
+
+    Returns:
+        Dict[str, Dict[str, np.ndarray]]: With keys
+            duplicates: the N x 2 "row" and "part" of both boxes of every pair and their "iou".
+            outside_parent: the "row" and "part" of every part, the "parent_row" of its person
+                and the "inside" ratio.
+            degenerate: the "row", "part" and "reason" index in `DEGENERATE_REASONS`.
+            The part is -1 for an annotation and the hier part index for a hier part.
+    """
+    workers = workers or os.cpu_count() or 1
+    kwargs = {"iou_threshold": iou_threshold, "min_inside": min_inside, "min_size": min_size}
+    offsets = np.asarray(store["img_offsets"])
+    num_shards = min(store.num_images, workers * shards_per_worker) if workers > 1 else 1
+    bounds = np.searchsorted(offsets, np.linspace(0, len(store), num_shards + 1)[1:-1])
+    bounds = np.unique(np.concatenate([[0], bounds, [store.num_images]]))
+    shards = list(zip(bounds[:-1].tolist(), bounds[1:].tolist())) or [(0, 0)]
+
+    if workers == 1:
+        results = [audit_images(str(store.path), a, b, **kwargs) for a, b in shards]
+    else:
+        with ProcessPoolExecutor(workers) as executor:
+            futures = [
+                executor.submit(audit_images, str(store.path), a, b, **kwargs)
+                for a, b in shards
+            ]
+            results = [future.result() for future in futures]
+    return {
+        kind: {name: np.concatenate([r[kind][name] for r in results]) for name in results[0][kind]}
+        for kind in results[0]
+    }
+
+
+def dropped_boxes(
+    issues: Dict[str, Dict[str, np.ndarray]], drop_degenerate: bool = False
+) -> List[Tuple[int, int]]:
+    """
+    Chooses the boxes to drop to remove the duplicates: the second box of every pair, unless its
+    first box is dropped itself, so one box of every group of duplicates is kept.
+
+    Args:
+        issues (Dict[str, Dict[str, np.ndarray]]): The issues of `audit_store`.
+        drop_degenerate (bool, optional): Whether to drop the degenerate boxes too. Defaults to
+            False.
+
+    Returns:
+        List[Tuple[int, int]]: The store row and hier part, -1 for the annotation, of every box.
+    """
+    dropped = set()
+    rows, parts = issues["duplicates"]["row"], issues["duplicates"]["part"]
+    order = np.lexsort((rows[:, 1], parts[:, 0], rows[:, 0]))
+    for (row_a, row_b), (part_a, part_b) in zip(rows[order].tolist(), parts[order].tolist()):
+        if (row_a, part_a) not in dropped:
+            dropped.add((row_b, part_b))
+    if drop_degenerate:
+        degenerate = issues["degenerate"]
+        dropped.update(zip(degenerate["row"].tolist(), degenerate["part"].tolist()))
+    return sorted(dropped)
+
+
+def write_deduplicated(
+    store: AnnotationStore, dropped: List[Tuple[int, int]], coco_file: str
+) -> Tuple[int, int]:
+    """
+    Writes the store as a COCO JSON file without some boxes. A dropped annotation is removed, a
+    dropped hier part is hidden by clearing its visibility flag.
+
+    Args:
+        store (AnnotationStore): The annotations.
+        dropped (List[Tuple[int, int]]): The store row and hier part of the boxes, see
+            `dropped_boxes`.
+        coco_file (str): Path to the COCO JSON file to write.
+
+    Returns:
+        Tuple[int, int]: The number of annotations removed and of parts hidden in the annotations
+            kept.
+    """
+    keep = np.ones(len(store), dtype=bool)
+    rows = np.array([row for row, part in dropped if part < 0], dtype=np.int64)
+    keep[rows] = False
+    columns = {}
+    # The parts of a removed annotation go with its row
+    hidden = [(row, part) for row, part in dropped if part >= 0 and keep[row]]
+    if hidden:
+        hier = np.array(store["hier"]).reshape(-1, HIER_SIZE)
+        hier[[row for row, _ in hidden], [part * 5 + 4 for _, part in hidden]] = 0
+        columns["hier"] = hier
+    store.to_coco(coco_file, keep=keep, columns=columns)
+    return len(rows), len(hidden)
+
+
+def issue_records(
+    store: AnnotationStore, issues: Dict[str, Dict[str, np.ndarray]]
+) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Converts the issues of `audit_store` to JSON records with annotation and image ids, file
+    names and category names.
+
+    Args:
+        store (AnnotationStore): The annotations.
+        issues (Dict[str, Dict[str, np.ndarray]]): The issues of `audit_store`.
+
+    Returns:
+        Dict[str, List[Dict[str, Any]]]: The records of every kind of issue.
+    """
+    names = {c["id"]: c["name"] for c in store.header.get("categories", [])}
+    names.update({i + 2: name for i, name in enumerate(PART_NAMES) if "hier" in store})
+    ids, category_id = store["id"], store["category_id"]
+    offsets = np.asarray(store["img_offsets"])
+    file_names = store["img_file_name"]
+
+    def box(row, part):
+        record = {"id": int(ids[row])}
+        if part >= 0:
+            record["part"] = PART_NAMES[part]
+        image = int(np.searchsorted(offsets, row, side="right")) - 1
+        record["category"] = names.get(part + 2 if part >= 0 else int(category_id[row]))
+        record["image_id"] = int(store["img_id"][image])
+        record["file_name"] = str(file_names[image])
+        return record
+
+    duplicates, outside, degenerate = (
+        issues["duplicates"],
+        issues["outside_parent"],
+        issues["degenerate"],
+    )
+    return {
+        "duplicates": [
+            {"boxes": [box(row_a, part_a), box(row_b, part_b)], "iou": iou}
+            for (row_a, row_b), (part_a, part_b), iou in zip(
+                duplicates["row"].tolist(),
+                duplicates["part"].tolist(),
+                duplicates["iou"].tolist(),
+            )
+        ],
+        "outside_parent": [
+            {**box(row, part), "parent_id": int(ids[parent]), "inside": inside}
+            for row, part, parent, inside in zip(
+                outside["row"].tolist(),
+                outside["part"].tolist(),
+                outside["parent_row"].tolist(),
+                outside["inside"].tolist(),
+            )
+        ],
+        "degenerate": [
+            {**box(row, part), "reason": DEGENERATE_REASONS[reason]}
+            for row, part, reason in zip(
+                degenerate["row"].tolist(),
+                degenerate["part"].tolist(),
+                degenerate["reason"].tolist(),
+            )
+        ],
+    }
@@ -0,0 +1,125 @@
+import math
+import warnings
+from typing import Optional
+
+import otx
+import torch
+from otx.algo.samplers.balanced_sampler import BalancedSampler
+from torch.utils.data import Sampler
+
+from od_engine.utils.sampler_weights import (
+    coco_anno_file,
+    indices_per_class,
+    load_sampler_weights,
+    sidecar_path,
+)
+
+# BalancedSampler.__init__ scans the annotations inline, without a hook for the class statistics,
+# so `CachedBalancedSampler` mirrors the __init__ of this OTX version and only uses it there
+OTX_VERSION = "2.4.5"
+
+
+class CachedBalancedSampler(BalancedSampler):
+    """
+    A `BalancedSampler` that reads the images of every class from a sidecar file written by
+    `od_engine.utils.sampler_weights.write_sampler_weights` instead of scanning every annotation.
+
+    It is a plain `BalancedSampler`, scanning the annotations, when the file is missing, the
+    annotation file changed since it was written, the dataset has items or labels the file does not
+    know, or the installed OTX is not `OTX_VERSION`, whose ``__init__`` it mirrors.
+
+    The OTX CLI fails to merge configs whose sampler has ``init_args``, so by default the file is
+    the sidecar of the COCO annotation file of the subset, as ``build_sampler_weights.py`` writes
+    it, found from the dataset directory. In a config:
+
+        sampler:
+          class_path: od_engine.utils.balanced_sampler.CachedBalancedSampler
+          init_args: {}
+
+    Args:
+        dataset (OTXDataset): The dataset.
+        weights_file (str, optional): The sidecar file. Defaults to None, the sidecar of the
+            COCO annotation file of the subset.
+        efficient_mode (bool, optional): See `BalancedSampler`. Defaults to False.
+        num_replicas (int, optional): See `BalancedSampler`. Defaults to 1.
+        rank (int, optional): See `BalancedSampler`. Defaults to 0.
+        drop_last (bool, optional): See `BalancedSampler`. Defaults to False.
+        n_repeats (int, optional): See `BalancedSampler`. Defaults to 1.
+        generator (torch.Generator, optional): See `BalancedSampler`. Defaults to None.
+    """
+
+    def __init__(
+        self,
+        dataset,
+        weights_file: Optional[str] = None,
+        efficient_mode: bool = False,
+        num_replicas: int = 1,
+        rank: int = 0,
+        drop_last: bool = False,
+        n_repeats: int = 1,
+        generator: Optional[torch.Generator] = None,
+    ):
+        ann_stats = self._cached_stats(dataset, weights_file)
+        if ann_stats is None:
+            super().__init__(
+                dataset,
+                efficient_mode=efficient_mode,
+                num_replicas=num_replicas,
+                rank=rank,
+                drop_last=drop_last,
+                n_repeats=n_repeats,
+                generator=generator,
+            )
+            return
+
+        # The rest is BalancedSampler.__init__ of OTX_VERSION with the cached statistics
+        self.dataset = dataset
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.drop_last = drop_last
+        self.generator = generator
+        self.repeat = n_repeats
+        Sampler.__init__(self, dataset)
+        self.img_indices = {
+            k: torch.tensor(v, dtype=torch.int64) for k, v in ann_stats.items() if len(v) > 0
+        }
+        self.num_cls = len(self.img_indices.keys())
+        self.data_length = len(self.dataset)
+        self.num_trials = max(int(self.data_length / self.num_cls), 1)
+
+        if efficient_mode:
+            # Reduce the number of trials to about one epoch, as BalancedSampler does
+            num_tail = min(len(cls_indices) for cls_indices in self.img_indices.values())
+            if num_tail > 1:
+                base = 1 - (1 / num_tail)
+                num_reduced_trials = int(math.log(0.001, base))
+                self.num_trials = min(num_reduced_trials, self.num_trials)
+
+        self.num_samples = self._calculate_num_samples()
+
+    @staticmethod
+    def _cached_stats(dataset, weights_file):
+        """Returns the dataset indices of every label from the sidecar file, or None to scan."""
+        dm_subset = dataset.dm_subset
+        if weights_file is None:
+            subsets = list(dm_subset.subsets())
+            if dm_subset.data_path is None or len(subsets) != 1:
+                warnings.warn("Cannot tell the annotation file of the dataset, scanning them")
+                return None
+            weights_file = sidecar_path(coco_anno_file(dm_subset.data_path, subsets[0]))
+        if otx.__version__ != OTX_VERSION:
+            warnings.warn(
+                f"CachedBalancedSampler mirrors BalancedSampler of OTX {OTX_VERSION}, not "
+                f"{otx.__version__}, scanning the annotations"
+            )
+            return None
+        sidecar = load_sampler_weights(weights_file)
+        if sidecar is None:
+            warnings.warn(f"{weights_file} is missing or stale, scanning the annotations")
+            return None
+        stats = indices_per_class(
+            sidecar, [item.id for item in dm_subset], dm_subset.get_label_cat_names()
+        )
+        if stats is None:
+            warnings.warn(f"{weights_file} does not match the dataset, scanning the annotations")
+        return stats
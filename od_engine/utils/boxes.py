@@ -0,0 +1,285 @@
+from typing import Optional, Union
+
+import numpy as np
+
+FORMATS = ("xyxy", "xywh", "cxcywh")
+NMS_CHUNK_SIZE = 1 << 20  # Box pairs of an IoU block in `nms`
+
+ArrayLike = Union[np.ndarray, float, int]
+
+
+def _check_format(fmt: str) -> None:
+    """Raises a ValueError for an unknown box format."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown box format {fmt}, expected one of {FORMATS}")
+
+
+def _output(boxes: np.ndarray, out: Optional[np.ndarray], shape=None) -> np.ndarray:
+    """Returns out, or a new float array of the shape, float64 for integer boxes."""
+    shape = boxes.shape if shape is None else shape
+    if out is not None:
+        if out.shape != shape:
+            raise ValueError(f"out has shape {out.shape}, expected {shape}")
+        return out
+    dtype = boxes.dtype if boxes.dtype.kind == "f" else np.float64
+    return np.empty(shape, dtype=dtype)
+
+
+def _scale(width: ArrayLike, height: ArrayLike) -> np.ndarray:
+    """Stacks image widths and heights into ... x 4 scales of x, y, x, y coordinates."""
+    width, height = np.broadcast_arrays(width, height)
+    return np.stack([width, height, width, height], axis=-1)
+
+
+def convert_boxes(
+    boxes: np.ndarray, in_fmt: str, out_fmt: str, out: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    Converts ... x 4 boxes between the "xyxy" (x_min, y_min, x_max, y_max), "xywh" (x_min,
+    y_min, width, height) and "cxcywh" (x_center, y_center, width, height) formats.
+
+    Every conversion goes through xywh with the arithmetic of the scalar converters, e.g.
+    x_center = x_min + width / 2, so the results are the same to the last bit. The boxes may be
+    normalised or absolute, see `normalize_boxes`.
+
+    Args:
+        boxes (np.ndarray): The ... x 4 boxes.
+        in_fmt (str): The format of the boxes.
+        out_fmt (str): The format of the result.
+        out (np.ndarray, optional): The result array, which may be `boxes` to convert in
+            place, or an integer array for integer xyxy and xywh boxes. Defaults to None, a new
+            float array.
+
+    Returns:
+        np.ndarray: The converted boxes, `out` if given.
+    """
+    _check_format(in_fmt)
+    _check_format(out_fmt)
+    boxes = np.asarray(boxes)
+    out = _output(boxes, out)
+    lo, hi = (..., slice(0, 2)), (..., slice(2, 4))
+    # To xywh, each step only reads the values it has not overwritten yet
+    if in_fmt == "xyxy":
+        np.subtract(boxes[hi], boxes[lo], out=out[hi])
+        out[lo] = boxes[lo]
+    elif in_fmt == "cxcywh":
+        out[hi] = boxes[hi]
+        np.subtract(boxes[lo], np.divide(boxes[hi], 2), out=out[lo])
+    elif out is not boxes:
+        out[...] = boxes
+    # From xywh, in place
+    if out_fmt == "xyxy":
+        np.add(out[lo], out[hi], out=out[hi])
+    elif out_fmt == "cxcywh":
+        np.add(out[lo], np.divide(out[hi], 2), out=out[lo])
+    return out
+
+
+def normalize_boxes(
+    boxes: np.ndarray, width: ArrayLike, height: ArrayLike, out: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    Divides the x coordinates of ... x 4 boxes of any format by the image width and the y
+    coordinates by the height.
+
+    Args:
+        boxes (np.ndarray): The ... x 4 absolute boxes.
+        width (ArrayLike): The image width, or one per box.
+        height (ArrayLike): The image height, or one per box.
+        out (np.ndarray, optional): The result array, which may be `boxes`. Defaults to None.
+
+    Returns:
+        np.ndarray: The boxes in [0, 1] image units, `out` if given.
+    """
+    boxes = np.asarray(boxes)
+    return np.divide(boxes, _scale(width, height), out=_output(boxes, out))
+
+
+def denormalize_boxes(
+    boxes: np.ndarray, width: ArrayLike, height: ArrayLike, out: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    Multiplies the x coordinates of ... x 4 boxes of any format by the image width and the y
+    coordinates by the height, the inverse of `normalize_boxes`.
+
+    Args:
+        boxes (np.ndarray): The ... x 4 boxes in [0, 1] image units.
+        width (ArrayLike): The image width, or one per box.
+        height (ArrayLike): The image height, or one per box.
+        out (np.ndarray, optional): The result array, which may be `boxes`. Defaults to None.
+
+    Returns:
+        np.ndarray: The absolute boxes, `out` if given.
+    """
+    boxes = np.asarray(boxes)
+    return np.multiply(boxes, _scale(width, height), out=_output(boxes, out))
+
+
+def clip_boxes(
+    boxes: np.ndarray, width: ArrayLike, height: ArrayLike, out: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    Clips ... x 4 xyxy boxes to the image, [0, width] x [0, height].
+
+    Args:
+        boxes (np.ndarray): The ... x 4 xyxy boxes.
+        width (ArrayLike): The image width, or one per box.
+        height (ArrayLike): The image height, or one per box.
+        out (np.ndarray, optional): The result array, which may be `boxes`. Defaults to None.
+
+    Returns:
+        np.ndarray: The clipped boxes, `out` if given.
+    """
+    boxes = np.asarray(boxes)
+    return np.clip(boxes, 0, _scale(width, height), out=_output(boxes, out))
+
+
+def box_area(
+    boxes: np.ndarray, fmt: str = "xyxy", out: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    Computes the areas of ... x 4 boxes, negative for inverted xyxy boxes.
+
+    Args:
+        boxes (np.ndarray): The ... x 4 boxes.
+        fmt (str, optional): The format of the boxes. Defaults to "xyxy".
+        out (np.ndarray, optional): The ... result array. Defaults to None.
+
+    Returns:
+        np.ndarray: The areas, `out` if given.
+    """
+    _check_format(fmt)
+    boxes = np.asarray(boxes)
+    out = _output(boxes, out, boxes.shape[:-1])
+    if fmt == "xyxy":
+        # The height goes through out, so only the width is allocated
+        np.subtract(boxes[..., 3], boxes[..., 1], out=out)
+        return np.multiply(boxes[..., 2] - boxes[..., 0], out, out=out)
+    return np.multiply(boxes[..., 2], boxes[..., 3], out=out)
+
+
+def box_intersection(
+    boxes1: np.ndarray, boxes2: np.ndarray, out: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    Computes the intersection areas of ... x 4 xyxy boxes with the boxes at the same positions
+    of other ... x 4 xyxy boxes.
+
+    Args:
+        boxes1 (np.ndarray): The ... x 4 xyxy boxes.
+        boxes2 (np.ndarray): The ... x 4 xyxy boxes, of the same shape.
+        out (np.ndarray, optional): The ... result array. Defaults to None.
+
+    Returns:
+        np.ndarray: The intersection areas, `out` if given.
+    """
+    boxes1, boxes2 = np.asarray(boxes1), np.asarray(boxes2)
+    out = _output(boxes1, out, boxes1.shape[:-1])
+    np.minimum(boxes1[..., 2], boxes2[..., 2], out=out)
+    out -= np.maximum(boxes1[..., 0], boxes2[..., 0])
+    np.maximum(out, 0, out=out)
+    height = np.minimum(boxes1[..., 3], boxes2[..., 3])
+    height -= np.maximum(boxes1[..., 1], boxes2[..., 1])
+    np.maximum(height, 0, out=height)
+    out *= height
+    return out
+
+
+def box_iou(
+    boxes1: np.ndarray, boxes2: np.ndarray, out: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    Computes the IoU of every pair of N x 4 and M x 4 xyxy boxes, 0 for pairs without area.
+
+    Args:
+        boxes1 (np.ndarray): The N x 4 xyxy boxes.
+        boxes2 (np.ndarray): The M x 4 xyxy boxes.
+        out (np.ndarray, optional): The N x M result array. Defaults to None.
+
+    Returns:
+        np.ndarray: The N x M IoU, `out` if given.
+    """
+    boxes1, boxes2 = np.asarray(boxes1), np.asarray(boxes2)
+    out = _output(boxes1, out, (len(boxes1), len(boxes2)))
+    area1, area2 = box_area(boxes1), box_area(boxes2)
+    # The intersection width, then its area, are built in out
+    np.minimum(boxes1[:, None, 2], boxes2[None, :, 2], out=out)
+    out -= np.maximum(boxes1[:, None, 0], boxes2[None, :, 0])
+    np.maximum(out, 0, out=out)
+    height = np.minimum(boxes1[:, None, 3], boxes2[None, :, 3])
+    height -= np.maximum(boxes1[:, None, 1], boxes2[None, :, 1])
+    np.maximum(height, 0, out=height)
+    out *= height
+    # Reuse the height buffer for the union
+    np.add(area1[:, None], area2[None, :], out=height)
+    height -= out
+    return np.divide(out, height, out=out, where=height > 0)
+
+
+def _greedy_nms(boxes: np.ndarray, iou_threshold: float, limit: int) -> np.ndarray:
+    """Returns the indices kept by greedy NMS of N x 4 xyxy boxes sorted by descending score."""
+    keep = []
+    alive = np.ones(len(boxes), dtype=bool)
+    block = max(1, NMS_CHUNK_SIZE // max(len(boxes), 1))
+    start = 0
+    while start < len(boxes) and len(keep) < limit:
+        # The next block of boxes not suppressed by an earlier block, against the boxes left
+        rest = np.flatnonzero(alive[start:]) + start
+        if not rest.size:
+            break
+        candidates = rest[:block]
+        over = box_iou(boxes[candidates], boxes[rest]) > iou_threshold
+        # Within the block, a box survives unless a surviving box before it overlaps it
+        inner = np.triu(over[:, : len(candidates)], 1)
+        kept = np.ones(len(candidates), dtype=bool)
+        for i in np.flatnonzero(inner.any(axis=0)).tolist():
+            kept[i] = not (inner[:i, i] & kept[:i]).any()
+        keep.extend(candidates[kept].tolist())
+        alive[rest[over[kept].any(axis=0)]] = False
+        alive[candidates] = False
+        start = candidates[-1] + 1
+    return np.array(keep[:limit], dtype=np.int64)
+
+
+def nms(
+    boxes: np.ndarray,
+    scores: np.ndarray,
+    iou_threshold: float,
+    labels: Optional[np.ndarray] = None,
+    max_output: Optional[int] = None,
+) -> np.ndarray:
+    """
+    Greedy non-maximum suppression of N x 4 xyxy boxes, class-aware when labels are given.
+
+    A box is dropped when its IoU with a kept box of a higher score, and of the same label, is
+    over the threshold. Equal scores keep the input order. Every class is suppressed on its own,
+    and the IoU of a block of kept boxes with the boxes left is computed at once, so there is no
+    N x N matrix.
+
+    Args:
+        boxes (np.ndarray): The N x 4 xyxy boxes.
+        scores (np.ndarray): The N scores.
+        iou_threshold (float): The IoU over which a box is suppressed.
+        labels (np.ndarray, optional): The N class labels. Defaults to None, class-agnostic.
+        max_output (int, optional): The largest number of boxes kept. Defaults to None.
+
+    Returns:
+        np.ndarray: The indices of the kept boxes, by descending score.
+    """
+    boxes = np.asarray(boxes).reshape(-1, 4)
+    order = np.argsort(-np.asarray(scores).reshape(-1), kind="stable")
+    limit = len(boxes) if max_output is None else max_output
+    if labels is None:
+        return order[_greedy_nms(boxes[order], iou_threshold, limit)]
+
+    labels = np.asarray(labels).reshape(-1)[order]
+    by_label = np.argsort(labels, kind="stable")
+    changes = np.flatnonzero(np.diff(labels[by_label])) + 1
+    starts = np.concatenate([[0], changes, [len(labels)]])
+    # Positions in score order of the boxes kept in every class, merged back by score
+    kept = [
+        members[_greedy_nms(boxes[order[members]], iou_threshold, limit)]
+        for members in (by_label[a:b] for a, b in zip(starts[:-1], starts[1:]))
+    ]
+    kept = np.sort(np.concatenate(kept)) if kept else np.empty(0, dtype=np.int64)
+    return order[kept[:limit]]
@@ -0,0 +1,393 @@
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+RECALL_THRESHOLDS = np.linspace(0.0, 1.0, 101)
+MAX_DETECTIONS = (1, 10, 100)
+# Box area ranges in pixels, both ends included as in pycocotools
+AREA_RANGES = {
+    "all": (0.0, 1e10),
+    "small": (0.0, 32.0**2),
+    "medium": (32.0**2, 96.0**2),
+    "large": (96.0**2, 1e10),
+}
+CHUNK_SIZE = 1 << 22  # Detection x ground truth IoU values matched at a time
+# The types of the stored arrays, boxes are N x 4
+DTYPES = {
+    "boxes": np.float64,
+    "scores": np.float64,
+    "labels": np.int64,
+    "crowd": bool,
+    "area": np.float64,
+}
+
+
+def _segments(keys: np.ndarray):
+    """Returns the start of every run of equal keys in a sorted array, and the run of every row."""
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else keys[:0]
+    runs = np.cumsum(np.r_[False, keys[1:] != keys[:-1]]) if len(keys) else keys[:0]
+    return starts, runs
+
+
+def _box_iou(dt: np.ndarray, gt: np.ndarray, crowd: np.ndarray) -> np.ndarray:
+    """
+    Computes the IoU of batched x_min, y_min, x_max, y_max boxes as pycocotools does, dividing by
+    the detection area alone for crowd ground truth.
+
+    Args:
+        dt (np.ndarray): The n x d x 4 detections.
+        gt (np.ndarray): The n x k x 4 ground truth.
+        crowd (np.ndarray): The n x k crowd flags.
+
+    Returns:
+        np.ndarray: The n x d x k IoU.
+    """
+    dt, gt = dt[:, :, None], gt[:, None]
+    iw = np.minimum(dt[..., 2], gt[..., 2]) - np.maximum(dt[..., 0], gt[..., 0])
+    ih = np.minimum(dt[..., 3], gt[..., 3]) - np.maximum(dt[..., 1], gt[..., 1])
+    inter = np.clip(iw, 0, None) * np.clip(ih, 0, None)
+    dt_area = (dt[..., 2] - dt[..., 0]) * (dt[..., 3] - dt[..., 1])
+    gt_area = (gt[..., 2] - gt[..., 0]) * (gt[..., 3] - gt[..., 1])
+    union = np.where(crowd[:, None], dt_area, dt_area + gt_area - inter)
+    return np.divide(inter, union, out=np.zeros_like(inter), where=(inter > 0) & (union > 0))
+
+
+class CocoEvaluator:
+    """
+    COCO box mAP over flat NumPy arrays, matching pycocotools ``COCOeval`` with its default
+    parameters.
+
+    `update` only appends the boxes of a batch. `compute` then matches all images at once: the
+    detections are sorted once per image and class, the IoU of every detection with the ground
+    truth of its image and class is computed in batches of image-class groups with the same
+    number of ground truth boxes, and the greedy matching runs for all groups, IoU thresholds and
+    area ranges together, one detection rank at a time. The precision-recall curves are built
+    from one sort of all detections per class.
+
+    Images are numbered in update order, which breaks score ties between images as the image id
+    order of pycocotools does. Ground truth and detection areas are box areas unless the ground
+    truth gives its own.
+
+    Args:
+        iou_thresholds (Sequence[float], optional): Defaults to 0.5 to 0.95 in steps of 0.05.
+        max_detections (Sequence[int], optional): The per image detection limits of the recall
+            metrics, the last one is also the limit of the precision metrics. Defaults to
+            (1, 10, 100).
+
+    Example:
+        >>> evaluator = CocoEvaluator()
+        >>> evaluator.update(
+        ...     [{"boxes": pred_boxes, "scores": scores, "labels": pred_labels}],
+        ...     [{"boxes": gt_boxes, "labels": gt_labels}],
+        ... )
+        >>> evaluator.compute()["map_50"]
+    """
+
+    def __init__(
+        self,
+        iou_thresholds: Sequence[float] = IOU_THRESHOLDS,
+        max_detections: Sequence[int] = MAX_DETECTIONS,
+    ):
+        self.iou_thresholds = np.asarray(iou_thresholds, dtype=np.float64)
+        self.max_detections = tuple(max_detections)
+        self.reset()
+
+    def reset(self) -> None:
+        """Drops every image added so far."""
+        self._dt: Dict[str, List[np.ndarray]] = {k: [] for k in ("boxes", "scores", "labels")}
+        self._gt: Dict[str, List[np.ndarray]] = {
+            k: [] for k in ("boxes", "labels", "crowd", "area")
+        }
+        self._dt_counts: List[int] = []
+        self._gt_counts: List[int] = []
+
+    def __len__(self) -> int:
+        """The number of images added."""
+        return len(self._dt_counts)
+
+    def update(self, preds: List[Dict[str, Any]], target: List[Dict[str, Any]]) -> None:
+        """
+        Adds the detections and ground truth of a batch of images.
+
+        Args:
+            preds (List[Dict[str, Any]]): Per image, the N x 4 "boxes" in x_min, y_min, x_max,
+                y_max, the N "scores" and the N "labels".
+            target (List[Dict[str, Any]]): Per image, the M x 4 "boxes" and M "labels", and
+                optionally the M "iscrowd" flags and "area" of the ground truth.
+        """
+        if len(preds) != len(target):
+            raise ValueError(f"Got {len(preds)} predictions for {len(target)} targets")
+        for pred, gt in zip(preds, target):
+            labels = np.asarray(gt["labels"], dtype=np.int64).reshape(-1)
+            boxes = np.asarray(gt["boxes"], dtype=np.float64).reshape(-1, 4)
+            crowd = gt.get("iscrowd")
+            area = gt.get("area")
+            self._gt["boxes"].append(boxes)
+            self._gt["labels"].append(labels)
+            self._gt["crowd"].append(
+                np.zeros(len(labels), dtype=bool)
+                if crowd is None
+                else np.asarray(crowd, dtype=bool).reshape(-1)
+            )
+            self._gt["area"].append(
+                (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+                if area is None
+                else np.asarray(area, dtype=np.float64).reshape(-1)
+            )
+            self._gt_counts.append(len(labels))
+            self._dt["boxes"].append(np.asarray(pred["boxes"], dtype=np.float64).reshape(-1, 4))
+            self._dt["scores"].append(np.asarray(pred["scores"], dtype=np.float64).reshape(-1))
+            self._dt["labels"].append(np.asarray(pred["labels"], dtype=np.int64).reshape(-1))
+            self._dt_counts.append(len(self._dt["labels"][-1]))
+
+    @staticmethod
+    def _arrays(store, counts):
+        """Concatenates the stored arrays and numbers their images."""
+        arrays = {
+            k: np.concatenate(v) if v else np.empty((0, 4) if k == "boxes" else 0, DTYPES[k])
+            for k, v in store.items()
+        }
+        arrays["image"] = np.repeat(np.arange(len(counts)), counts)
+        return arrays
+
+    def compute(self) -> Dict[str, Any]:
+        """
+        Computes the COCO metrics of every image added.
+
+        Returns:
+            Dict[str, Any]: The float map, map_50, map_75, map_small, map_medium, map_large,
+                mar_<n> for every detection limit, mar_small, mar_medium and mar_large, with -1
+                when undefined, and the per class map_per_class and mar_<last limit>_per_class
+                arrays for the int64 "classes", the labels of the ground truth.
+        """
+        dt = self._arrays(self._dt, self._dt_counts)
+        gt = self._arrays(self._gt, self._gt_counts)
+        classes = np.unique(gt["labels"])
+        num_thresholds = len(self.iou_thresholds)
+        area_ranges = np.array(list(AREA_RANGES.values()))
+
+        # Detections of classes without ground truth cannot match and are not evaluated
+        keep = np.isin(dt["labels"], classes)
+        dt = {k: v[keep] for k, v in dt.items()}
+        dt["label"] = np.searchsorted(classes, dt["labels"])
+        gt["label"] = np.searchsorted(classes, gt["labels"])
+
+        # Sort the detections by image, class and descending score, keeping the first ones
+        order = np.lexsort((-dt["scores"], dt["label"], dt["image"]))
+        dt = {k: v[order] for k, v in dt.items()}
+        dt_group = dt["image"] * len(classes) + dt["label"]
+        starts, runs = _segments(dt_group)
+        dt["rank"] = np.arange(len(dt_group)) - (starts[runs] if len(runs) else 0)
+        keep = dt["rank"] < self.max_detections[-1]
+        dt = {k: v[keep] for k, v in dt.items()}
+        dt_group = dt_group[keep]
+        dt_area = (dt["boxes"][:, 2] - dt["boxes"][:, 0]) * (dt["boxes"][:, 3] - dt["boxes"][:, 1])
+        dt_outside = (dt_area[:, None] < area_ranges[:, 0]) | (dt_area[:, None] > area_ranges[:, 1])
+
+        gt_order = np.argsort(gt["image"] * len(classes) + gt["label"], kind="stable")
+        gt = {k: v[gt_order] for k, v in gt.items()}
+        gt_group = gt["image"] * len(classes) + gt["label"]
+        gt_ignore = gt["crowd"][:, None] | (
+            (gt["area"][:, None] < area_ranges[:, 0]) | (gt["area"][:, None] > area_ranges[:, 1])
+        )
+
+        # Matches and ignore flags per detection, area range and IoU threshold
+        matched = np.zeros((len(dt_group), len(area_ranges), num_thresholds), dtype=bool)
+        ignored = np.broadcast_to(dt_outside[:, :, None], matched.shape).copy()
+        self._match(dt, dt_group, gt, gt_group, gt_ignore, matched, ignored)
+
+        precision = -np.ones(
+            (
+                num_thresholds,
+                len(RECALL_THRESHOLDS),
+                len(classes),
+                len(area_ranges),
+                len(self.max_detections),
+            )
+        )
+        recall = -np.ones(
+            (num_thresholds, len(classes), len(area_ranges), len(self.max_detections))
+        )
+        # One sort of all detections per class, ties by image and rank as in pycocotools
+        order = np.lexsort((dt["rank"], dt["image"], -dt["scores"], dt["label"]))
+        class_starts = np.searchsorted(dt["label"][order], np.arange(len(classes) + 1))
+        num_gt = np.zeros((len(classes), len(area_ranges)), dtype=np.int64)
+        np.add.at(num_gt, gt["label"], ~gt_ignore)
+        for k in range(len(classes)):
+            rows = order[class_starts[k] : class_starts[k + 1]]
+            for m, max_det in enumerate(self.max_detections):
+                rows_m = rows[dt["rank"][rows] < max_det]
+                for a in range(len(area_ranges)):
+                    if num_gt[k, a] == 0:
+                        continue
+                    precision[:, :, k, a, m], recall[:, k, a, m] = self._curve(
+                        matched[rows_m, a].T, ignored[rows_m, a].T, num_gt[k, a]
+                    )
+        return self._summarize(precision, recall, classes)
+
+    def _match(self, dt, dt_group, gt, gt_group, gt_ignore, matched, ignored):
+        """Greedily matches the detections of every image-class group to its ground truth."""
+        groups, dt_starts = np.unique(dt_group, return_index=True)
+        dt_counts = np.diff(np.r_[dt_starts, len(dt_group)])
+        gt_groups, gt_starts, gt_counts = np.unique(gt_group, return_index=True, return_counts=True)
+        position = np.searchsorted(gt_groups, groups)
+        has_gt = (position < len(gt_groups)) & (
+            gt_groups[np.minimum(position, len(gt_groups) - 1)] == groups
+            if len(gt_groups)
+            else False
+        )
+        groups_gt = np.where(has_gt, gt_counts[np.minimum(position, len(gt_groups) - 1)], 0)
+        thresholds = np.minimum(self.iou_thresholds, 1 - 1e-10)
+
+        # Groups with the same number of ground truth boxes are padded to the same shape
+        for num_gt in np.unique(groups_gt[groups_gt > 0]):
+            selected = np.flatnonzero(groups_gt == num_gt)
+            selected = selected[np.argsort(dt_counts[selected], kind="stable")]
+            start = 0
+            while start < len(selected):
+                depth = dt_counts[selected[start]]
+                # Sorted by detection count, so a chunk is padded to its last group
+                end = start + 1
+                while end < len(selected) and (end + 1 - start) * dt_counts[
+                    selected[end]
+                ] * num_gt <= max(CHUNK_SIZE, depth * num_gt):
+                    end += 1
+                chunk = selected[start:end]
+                start = end
+                self._match_chunk(
+                    chunk,
+                    dt_starts,
+                    dt_counts,
+                    gt_starts[position[chunk]],
+                    int(num_gt),
+                    dt,
+                    gt,
+                    gt_ignore,
+                    thresholds,
+                    matched,
+                    ignored,
+                )
+
+    def _match_chunk(
+        self,
+        chunk,
+        dt_starts,
+        dt_counts,
+        gt_starts,
+        num_gt,
+        dt,
+        gt,
+        gt_ignore,
+        thresholds,
+        matched,
+        ignored,
+    ):
+        """Matches a chunk of groups with ``num_gt`` ground truth boxes each."""
+        n, depth = len(chunk), int(dt_counts[chunk].max())
+        dt_rows = dt_starts[chunk][:, None] + np.arange(depth)
+        valid = np.arange(depth) < dt_counts[chunk][:, None]
+        dt_rows = np.where(valid, dt_rows, 0)
+        gt_rows = gt_starts[:, None] + np.arange(num_gt)
+        crowd = gt["crowd"][gt_rows]
+        iou = _box_iou(dt["boxes"][dt_rows], gt["boxes"][gt_rows], crowd)
+
+        # Detections under every threshold match nothing, so only the others are visited, and
+        # the groups are ordered by their number of them to visit a shrinking suffix
+        matchable = valid & (iou.max(axis=-1) >= thresholds.min())
+        counts = matchable.sum(axis=1)
+        if not counts.any():
+            return
+        order = np.argsort(~matchable, axis=1, kind="stable")[:, : counts.max()]
+        by_count = np.argsort(counts, kind="stable")
+        iou = np.take_along_axis(iou, order[..., None], axis=1)[by_count]
+        dt_rows = np.take_along_axis(dt_rows, order, axis=1)[by_count]
+        counts, crowd = counts[by_count], crowd[by_count][:, None, None, :]
+
+        # n x areas x 1 x k ignore flags against n x areas x thresholds x k match state
+        ig = gt_ignore[gt_rows[by_count]].transpose(0, 2, 1)[:, :, None, :]
+        taken = np.zeros((n, ig.shape[1], len(thresholds), num_gt), dtype=bool)
+        reversed_index = num_gt - 1 - np.arange(num_gt)
+        for d in range(counts[-1]):
+            lo = np.searchsorted(counts, d, side="right")
+            iou_d = iou[lo:, d][:, None, None, :]
+            ok = ~(taken[lo:] & ~crowd[lo:]) & (iou_d >= thresholds[:, None])
+            first = ok & ~ig[lo:]
+            candidates = np.where(first.any(axis=-1, keepdims=True), first, ok & ig[lo:])
+            # The highest IoU wins, and the last of equal ones as in pycocotools
+            values = np.where(candidates, iou_d, -1.0)
+            best = values.max(axis=-1, keepdims=True)
+            last = (values == best)[..., ::-1].argmax(axis=-1)
+            g, a, t = np.nonzero(candidates.any(axis=-1))
+            index = reversed_index[last[g, a, t]]
+            taken[g + lo, a, t, index] = True
+            rows = dt_rows[g + lo, d]
+            matched[rows, a, t] = True
+            ignored[rows, a, t] = ig[g + lo, a, 0, index]
+
+    @staticmethod
+    def _curve(matched, ignored, num_gt):
+        """Computes the interpolated precision and the recall of a class, as pycocotools does."""
+        tps = np.cumsum(matched & ~ignored, axis=1, dtype=np.float64)
+        fps = np.cumsum(~matched & ~ignored, axis=1, dtype=np.float64)
+        num_dt = tps.shape[1]
+        precision = np.zeros((len(tps), len(RECALL_THRESHOLDS)))
+        if num_dt == 0:
+            return precision, np.zeros(len(tps))
+        rc = tps / num_gt
+        pr = tps / (fps + tps + np.spacing(1))
+        pr = np.maximum.accumulate(pr[:, ::-1], axis=1)[:, ::-1]
+        for t in range(len(tps)):
+            inds = np.searchsorted(rc[t], RECALL_THRESHOLDS, side="left")
+            inside = inds < num_dt
+            precision[t, inside] = pr[t, inds[inside]]
+        return precision, rc[:, -1]
+
+    def _summarize(self, precision, recall, classes):
+        """Averages the defined precision and recall values into the COCO metrics."""
+
+        def mean(values):
+            values = values[values > -1]
+            return float(values.mean()) if values.size else -1.0
+
+        areas = {name: a for a, name in enumerate(AREA_RANGES)}
+        last = len(self.max_detections) - 1
+        result = {"map": mean(precision[:, :, :, 0, last])}
+        for name, iou in (("map_50", 0.5), ("map_75", 0.75)):
+            t = np.flatnonzero(np.isclose(self.iou_thresholds, iou))
+            result[name] = mean(precision[t[0], :, :, 0, last]) if t.size else -1.0
+        for name in ("small", "medium", "large"):
+            result[f"map_{name}"] = mean(precision[:, :, :, areas[name], last])
+        for m, max_det in enumerate(self.max_detections):
+            result[f"mar_{max_det}"] = mean(recall[:, :, 0, m])
+        for name in ("small", "medium", "large"):
+            result[f"mar_{name}"] = mean(recall[:, :, areas[name], last])
+        result["map_per_class"] = np.array(
+            [mean(precision[:, :, k, 0, last]) for k in range(len(classes))]
+        )
+        result[f"mar_{self.max_detections[-1]}_per_class"] = np.array(
+            [mean(recall[:, k, 0, last]) for k in range(len(classes))]
+        )
+        result["classes"] = classes
+        return result
+
+
+def evaluate(
+    preds: List[Dict[str, Any]],
+    target: List[Dict[str, Any]],
+    iou_thresholds: Optional[Sequence[float]] = None,
+) -> Dict[str, Any]:
+    """
+    Computes the COCO metrics of a whole set at once, see `CocoEvaluator`.
+
+    Args:
+        preds (List[Dict[str, Any]]): The detections of every image.
+        target (List[Dict[str, Any]]): The ground truth of every image.
+        iou_thresholds (Sequence[float], optional): Defaults to `IOU_THRESHOLDS`.
+
+    Returns:
+        Dict[str, Any]: The metrics.
+    """
+    evaluator = CocoEvaluator(IOU_THRESHOLDS if iou_thresholds is None else iou_thresholds)
+    evaluator.update(preds, target)
+    return evaluator.compute()
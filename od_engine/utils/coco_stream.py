@@ -0,0 +1,267 @@
+import json
+import os
+from itertools import islice
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List
+
+CHUNK_SIZE = 1024 * 1024  # Characters read from the file at a time
+WHITESPACE = " \t\n\r"
+
+
+class _JsonReader:
+    """
+    Decodes a JSON document from a file one value at a time.
+
+    The reader keeps a window of the file in memory and uses `json.JSONDecoder.raw_decode` to decode
+    values from it, reading more of the file whenever a value runs past the end of the window.
+
+    Args:
+        f (TextIO): The open file to read.
+        chunk_size (int): The number of characters read from the file at a time.
+    """
+
+    def __init__(self, f, chunk_size):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        """Drops the consumed part of the window and reads the next chunk of the file."""
+        data = self.f.read(self.chunk_size)
+        if not data:
+            self.eof = True
+        self.buf = self.buf[self.pos :] + data
+        self.pos = 0
+
+    def peek(self):
+        """Skips whitespace and returns the next character, or an empty string at the end."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf) or self.eof:
+                return self.buf[self.pos : self.pos + 1]
+            self._fill()
+
+    def expect(self, chars):
+        """Consumes the next character, which must be one of ``chars``, and returns it."""
+        c = self.peek()
+        if not c or c not in chars:
+            raise ValueError(f"Expected one of {chars!r} but found {c!r} in {self.f.name}")
+        self.pos += 1
+        return c
+
+    def decode(self):
+        """Decodes the next value."""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+                self._fill()
+                continue
+            # A number at the end of the window may continue in the next chunk
+            if end == len(self.buf) and not self.eof:
+                self._fill()
+                continue
+            self.pos = end
+            return value
+
+    def iter_array(self):
+        """Decodes the elements of the next value, which must be an array, one at a time."""
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.decode()
+            if self.expect(",]") == "]":
+                return
+
+    def skip(self):
+        """Skips the next value, an element at a time if it is an array."""
+        if self.peek() == "[":
+            for _ in self.iter_array():
+                pass
+        else:
+            self.decode()
+
+    def iter_keys(self):
+        """Yields the keys of the next value, which must be an object, before each of its values."""
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.decode()
+            self.expect(":")
+            yield key
+            if self.expect(",}") == "}":
+                return
+
+
+def iter_coco_array(path: str, key: str, chunk_size: int = CHUNK_SIZE) -> Iterator[Any]:
+    """
+    Iterates over the elements of a top level array of a COCO JSON file without loading the file.
+
+    Memory use is bounded by the largest element rather than the file size. The file is read up to
+    the end of the requested array, so iterating over ``images`` of a file that stores them before
+    ``annotations`` does not read the annotations.
+
+    Args:
+        path (str): Path to the COCO JSON file.
+        key (str): The top level key of the array, e.g. "images" or "annotations".
+        chunk_size (int, optional): The number of characters read at a time. Defaults to 1M.
+
+    Yields:
+        Any: The decoded elements of the array.
+
+    Raises:
+        KeyError: If the file has no such top level key.
+    """
+    with open(path, "r") as f:
+        reader = _JsonReader(f, chunk_size)
+        for k in reader.iter_keys():
+            if k == key:
+                yield from reader.iter_array()
+                return
+            reader.skip()
+    raise KeyError(key)
+
+
+def load_coco_header(
+    path: str, skip: Iterable[str] = ("images", "annotations"), chunk_size: int = CHUNK_SIZE
+) -> Dict[str, Any]:
+    """
+    Loads the top level values of a COCO JSON file except the large arrays.
+
+    Args:
+        path (str): Path to the COCO JSON file.
+        skip (Iterable[str], optional): The top level keys to skip. Defaults to images and
+            annotations.
+        chunk_size (int, optional): The number of characters read at a time. Defaults to 1M.
+
+    Returns:
+        Dict[str, Any]: The top level values, e.g. info, licenses and categories.
+    """
+    skip = set(skip)
+    header = {}
+    with open(path, "r") as f:
+        reader = _JsonReader(f, chunk_size)
+        for k in reader.iter_keys():
+            if k in skip:
+                reader.skip()
+            else:
+                header[k] = reader.decode()
+    return header
+
+
+def batched(iterable: Iterable[Any], n: int) -> Iterator[List[Any]]:
+    """
+    Splits an iterable into lists of at most n items.
+
+    Args:
+        iterable (Iterable[Any]): The items to split.
+        n (int): The maximum number of items per list.
+
+    Yields:
+        List[Any]: The next batch of items.
+    """
+    it = iter(iterable)
+    while batch := list(islice(it, n)):
+        yield batch
+
+
+class CocoStreamWriter:
+    """
+    Writes a COCO JSON file one top level value, or one array element, at a time.
+
+    The output is identical to `json.dump` of a dict with the same keys in the same order. It is
+    written to a temporary file that replaces ``path`` when the writer is closed without an error,
+    so the input of a transform can be the file it rewrites.
+
+    Args:
+        path (str): Path to the COCO JSON file to write.
+
+    Example:
+        >>> with CocoStreamWriter("instances_train.json") as writer:
+        ...     writer.write("categories", categories)
+        ...     writer.write_array("annotations", iter_coco_array(src, "annotations"))
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.tmp_path = self.path.with_name(self.path.name + ".tmp")
+        self.f = None
+        self._first = True
+
+    def __enter__(self):
+        self.f = open(self.tmp_path, "w")
+        self.f.write("{")
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.f.write("}")
+            self.f.close()
+            os.replace(self.tmp_path, self.path)
+        else:
+            self.f.close()
+            self.tmp_path.unlink(missing_ok=True)
+
+    def _key(self, key: str) -> None:
+        """Writes the separator and the key of the next top level value."""
+        if not self._first:
+            self.f.write(", ")
+        self._first = False
+        self.f.write(json.dumps(key) + ": ")
+
+    def write(self, key: str, value: Any) -> None:
+        """
+        Writes a top level value.
+
+        Args:
+            key (str): The top level key.
+            value (Any): The value, encoded in one piece.
+        """
+        self._key(key)
+        self.f.write(json.dumps(value))
+
+    def write_array(self, key: str, items: Iterable[Any]) -> int:
+        """
+        Writes a top level array one element at a time.
+
+        Args:
+            key (str): The top level key.
+            items (Iterable[Any]): The elements, e.g. a generator over another file.
+
+        Returns:
+            int: The number of elements written.
+        """
+        return self.write_encoded_array(key, map(json.dumps, items))
+
+    def write_encoded_array(self, key: str, texts: Iterable[str]) -> int:
+        """
+        Writes a top level array from elements that are already JSON encoded.
+
+        Args:
+            key (str): The top level key.
+            texts (Iterable[str]): The JSON text of every element.
+
+        Returns:
+            int: The number of elements written.
+        """
+        self._key(key)
+        self.f.write("[")
+        count = 0
+        for text in texts:
+            if count:
+                self.f.write(", ")
+            self.f.write(text)
+            count += 1
+        self.f.write("]")
+        return count
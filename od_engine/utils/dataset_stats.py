@@ -0,0 +1,267 @@
+from typing import Any, Dict, Optional, Sequence
+
+import numpy as np
+
+from od_engine.utils.annostore import AnnotationStore
+
+INPUT_SIZES = (320, 416, 512, 640, 800, 960, 1024, 1280)  # Candidate square input sizes
+SMALL_SIZE = 32  # Boxes under 32 x 32 pixels are small in COCO
+TINY_SIZE = 16  # Boxes under 16 x 16 pixels fall below a stride 16 feature cell
+SIZE_BINS = 2.0 ** np.arange(0, 13.5, 0.5)  # sqrt(area) histogram edges, 1 to 8192 pixels
+ASPECT_BINS = 2.0 ** np.arange(-4, 4.5, 0.5)  # width / height histogram edges, 1/16 to 16
+# Boxes per image histogram edges
+COUNT_BINS = np.array([0, 1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, np.inf])
+PERCENTILES = (1, 5, 25, 50, 75, 95, 99)
+
+
+def robust_stats(values: np.ndarray) -> Dict[str, float]:
+    """
+    Computes the mean, spread and range of values, with a min and max clipped to three standard
+    deviations of the mean, as `otx.core.data.utils.utils.compute_robust_statistics` does.
+
+    Args:
+        values (np.ndarray): The values.
+
+    Returns:
+        Dict[str, float]: avg, std, min, max, robust_min and robust_max, or {} if empty.
+    """
+    if values.size == 0:
+        return {}
+    avg, std = float(values.mean()), float(values.std())
+    low, high = float(values.min()), float(values.max())
+    return {
+        "avg": avg,
+        "std": std,
+        "min": low,
+        "max": high,
+        "robust_min": max(low, avg - 3 * std),
+        "robust_max": min(high, avg + 3 * std),
+    }
+
+
+def robust_scale_stats(values: np.ndarray) -> Dict[str, float]:
+    """
+    Computes `robust_stats` of positive sizes in log scale, so 0.5x and 2x average to 1x, as
+    `otx.core.data.utils.utils.compute_robust_scale_statistics` does.
+
+    Args:
+        values (np.ndarray): The positive values.
+
+    Returns:
+        Dict[str, float]: The statistics in the original scale, with the std of the values.
+    """
+    if values.size == 0:
+        return {}
+    stats = {k: float(np.exp(v)) for k, v in robust_stats(np.log(values)).items()}
+    stats["std"] = float(values.std())
+    return stats
+
+
+def _histogram(values, bins):
+    """Returns the counts of values in bins, with the edges, as JSON lists."""
+    counts, edges = np.histogram(values, bins=bins)
+    return {"edges": edges.tolist(), "counts": counts.tolist()}
+
+
+def _percentiles(values):
+    """Returns the `PERCENTILES` of values by name, e.g. p50."""
+    if values.size == 0:
+        return {}
+    return {f"p{p}": float(v) for p, v in zip(PERCENTILES, np.percentile(values, PERCENTILES))}
+
+
+def compute_stats(
+    store: AnnotationStore,
+    input_sizes: Sequence[int] = INPUT_SIZES,
+    include_crowd: bool = False,
+) -> Dict[str, Any]:
+    """
+    Computes box statistics over a whole annotation store with vectorised NumPy.
+
+    Boxes without area or of an unknown category are skipped, as the OTX pre-filtering drops
+    them. The size of a box is the square root of its area in pixels. At an input size, an image
+    is letterboxed so its longer side fits, and the box sizes shrink or grow by the same scale.
+
+    Args:
+        store (AnnotationStore): The annotations.
+        input_sizes (Sequence[int], optional): The candidate square input sizes. Defaults to
+            `INPUT_SIZES`.
+        include_crowd (bool, optional): Whether to count crowd boxes. Defaults to False.
+
+    Returns:
+        Dict[str, Any]: With keys
+            images: the number of images, the robust statistics of their heights and widths.
+            boxes: the number of boxes, robust statistics, percentiles and a histogram of their
+                sizes, and a histogram of their aspect ratios.
+            boxes_per_image: robust statistics, percentiles and a histogram.
+            classes: per class name, the boxes, the images containing it and the median size.
+            input_sizes: per input size, the ratio of boxes under `SMALL_SIZE` and `TINY_SIZE`
+                pixels after resizing, overall and per class.
+    """
+    categories = sorted(store.header.get("categories", []), key=lambda c: c["id"])
+    offsets = np.asarray(store["img_offsets"])
+    widths = np.asarray(store["img_width"], dtype=np.float64)
+    heights = np.asarray(store["img_height"], dtype=np.float64)
+    bbox = np.asarray(store["bbox"])
+    category_id = np.asarray(store["category_id"])
+    image_index = np.repeat(np.arange(len(widths)), np.diff(offsets))
+
+    if not categories:
+        raise ValueError(f"{store.path} has no categories")
+    lut = np.full(max(c["id"] for c in categories) + 1, -1, dtype=np.int64)
+    lut[[c["id"] for c in categories]] = np.arange(len(categories))
+    known = (category_id >= 0) & (category_id < len(lut))
+    label = np.where(known, lut[np.where(known, category_id, 0)], -1)
+
+    keep = (bbox[:, 2] > 0) & (bbox[:, 3] > 0) & (label >= 0)
+    if not include_crowd:
+        keep &= np.asarray(store["iscrowd"]) == 0
+    bbox, label, image_index = bbox[keep], label[keep], image_index[keep]
+
+    sizes = np.sqrt(bbox[:, 2] * bbox[:, 3])
+    aspects = bbox[:, 2] / bbox[:, 3]
+    boxes_per_image = np.bincount(image_index, minlength=len(widths))
+    num_classes = len(categories)
+    class_boxes = np.bincount(label, minlength=num_classes)
+    present = np.zeros((len(widths), num_classes), dtype=bool)
+    present[image_index, label] = True
+    class_images = present.sum(axis=0)
+
+    classes = {}
+    for i, category in enumerate(categories):
+        class_sizes = sizes[label == i]
+        classes[category["name"]] = {
+            "boxes": int(class_boxes[i]),
+            "images": int(class_images[i]),
+            "median_size": float(np.median(class_sizes)) if class_sizes.size else None,
+        }
+
+    by_input_size = {}
+    image_long_side = np.maximum(widths, heights)
+    for input_size in input_sizes:
+        scaled = sizes * (input_size / image_long_side[image_index])
+        small = scaled < SMALL_SIZE
+        small_per_class = np.bincount(label[small], minlength=num_classes)
+        by_input_size[int(input_size)] = {
+            "small_ratio": float(small.mean()) if sizes.size else 0.0,
+            "tiny_ratio": float((scaled < TINY_SIZE).mean()) if sizes.size else 0.0,
+            "small_ratio_per_class": {
+                category["name"]: float(small_per_class[i] / max(class_boxes[i], 1))
+                for i, category in enumerate(categories)
+            },
+        }
+
+    return {
+        "images": {
+            "count": int(len(widths)),
+            "height": robust_scale_stats(heights[heights > 0]),
+            "width": robust_scale_stats(widths[widths > 0]),
+        },
+        "boxes": {
+            "count": int(len(sizes)),
+            "size": {
+                **robust_scale_stats(sizes),
+                **_percentiles(sizes),
+                "histogram": _histogram(sizes, SIZE_BINS),
+            },
+            "aspect_ratio": {
+                **_percentiles(aspects),
+                "histogram": _histogram(aspects, ASPECT_BINS),
+            },
+        },
+        "boxes_per_image": {
+            **robust_stats(boxes_per_image),
+            **_percentiles(boxes_per_image),
+            "histogram": _histogram(boxes_per_image, COUNT_BINS),
+        },
+        "classes": classes,
+        "input_sizes": by_input_size,
+    }
+
+
+def suggest_input_size(
+    stats: Dict[str, Any],
+    max_small_ratio: float = 0.1,
+    multiplier: int = 32,
+    current: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Suggests the smallest candidate input size that keeps the small boxes under a ratio.
+
+    Args:
+        stats (Dict[str, Any]): The statistics of `compute_stats`.
+        max_small_ratio (float, optional): The largest acceptable ratio of boxes under
+            `SMALL_SIZE` pixels after resizing. Defaults to 0.1.
+        multiplier (int, optional): The input size must be a multiple of it. Defaults to 32.
+        current (int, optional): The input size of the config, to report its small ratio.
+            Defaults to None.
+
+    Returns:
+        Dict[str, Any]: The suggested input_size, its small_ratio, whether it met the ratio, and
+            the small ratio of the current size if given.
+    """
+    candidates = sorted(
+        (size, ratios) for size, ratios in stats["input_sizes"].items() if size % multiplier == 0
+    )
+    if not candidates:
+        raise ValueError(f"No candidate input size is a multiple of {multiplier}")
+    fitting = [(size, r) for size, r in candidates if r["small_ratio"] <= max_small_ratio]
+    size, ratios = fitting[0] if fitting else candidates[-1]
+    suggestion = {
+        "input_size": size,
+        "small_ratio": ratios["small_ratio"],
+        "meets_ratio": bool(fitting),
+    }
+    if current is not None and current in stats["input_sizes"]:
+        suggestion["current_small_ratio"] = stats["input_sizes"][current]["small_ratio"]
+    return suggestion
+
+
+def suggest_tiling(
+    stats: Dict[str, Any],
+    input_size: int,
+    object_tile_ratio: float = 0.03,
+    max_small_ratio: float = 0.1,
+) -> Dict[str, Any]:
+    """
+    Suggests the tile_config of a dataset from the box sizes over all images, with the rules of
+    `otx.core.data.utils.utils.adapt_tile_config`, which only samples 1000 images.
+
+    Tiling is suggested when the images are at least twice the input size and too many boxes
+    are small at the input size: a tile then keeps the boxes at their resolution. The tile size
+    is capped at the image size.
+
+    Args:
+        stats (Dict[str, Any]): The statistics of `compute_stats`.
+        input_size (int): The input size of the model, one of the input sizes of the statistics.
+        object_tile_ratio (float, optional): The ratio of the average box size to the tile size.
+            Defaults to 0.03.
+        max_small_ratio (float, optional): The largest acceptable ratio of boxes under
+            `SMALL_SIZE` pixels at the input size without tiling. Defaults to 0.1.
+
+    Returns:
+        Dict[str, Any]: enable_tiler, tile_size, overlap, max_num_instances and
+            object_tile_ratio values for the tile_config.
+    """
+    size = stats["boxes"]["size"]
+    if not size:
+        return {"enable_tiler": False}
+    image_side = max(
+        stats["images"]["height"].get("robust_max", 0),
+        stats["images"]["width"].get("robust_max", 0),
+    )
+    tile_size = int(size["avg"] / object_tile_ratio)
+    if image_side:
+        tile_size = min(tile_size, int(image_side))
+    overlap = size["robust_max"] / tile_size
+    if overlap >= 0.9:
+        # A tile as small as the largest boxes would have no stride left
+        overlap = min(size["avg"] / tile_size, 0.9)
+    small_ratio = stats["input_sizes"][input_size]["small_ratio"]
+    return {
+        "enable_tiler": bool(image_side >= 2 * input_size and small_ratio > max_small_ratio),
+        "tile_size": [tile_size, tile_size],
+        "overlap": round(float(overlap), 3),
+        "max_num_instances": int(round(stats["boxes_per_image"].get("max", 0))),
+        "object_tile_ratio": object_tile_ratio,
+    }
@@ -1,13 +1,475 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from contextlib import contextmanager
 from pathlib import Path
+from urllib.request import Request, urlopen
 
-from torch.hub import download_url_to_file
-import zipfile
-from concurrent.futures import ThreadPoolExecutor
+from tqdm import tqdm
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
+from od_engine.utils.extract import ZipStreamExtractor
 
-def download(url, dir=".", unzip=True, delete=True, threads=1):
+CHUNK_SIZE = 64 * 1024 * 1024  # Bytes fetched per HTTP Range request
+BLOCK_SIZE = 1024 * 1024  # Bytes read from the socket per write
+USER_AGENT = "od_engine"
+
+
+def _probe(url, timeout=30):
+    """
+    Probes a URL with a one byte Range request to find its size and whether it supports ranges.
+
+    Args:
+        url (str): The URL to probe.
+        timeout (float, optional): Socket timeout in seconds. Defaults to 30.
+
+    Returns:
+        Tuple[Optional[int], bool, Optional[str], str]: The total size in bytes (None if unknown),
+            whether the server honours Range requests, the ETag (None if not sent) and the final
+            URL after redirects.
+    """
+    req = Request(url, headers={"Range": "bytes=0-0", "User-Agent": USER_AGENT})
+    with urlopen(req, timeout=timeout) as r:
+        etag = r.headers.get("X-Linked-Etag") or r.headers.get("ETag")
+        final_url = r.geturl()
+        content_range = r.headers.get("Content-Range", "")
+        match = re.match(r"bytes 0-0/(\d+)", content_range)
+        if r.status == 206 and match:
+            return int(match.group(1)), True, etag, final_url
+        length = r.headers.get("Content-Length")
+        return (int(length) if length else None), False, etag, final_url
+
+
+def _load_state(state_file):
+    """Reads a sidecar download state file, returning None if it is missing or corrupt."""
+    try:
+        with open(state_file, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_state(state_file, state):
+    """Atomically writes a sidecar download state file."""
+    tmp_file = state_file.with_name(state_file.name + ".tmp")
+    with open(tmp_file, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp_file, state_file)
+
+
+def _download_stream(url, file, progress=True, timeout=60, on_bytes=None):
+    """
+    Downloads a URL to a file over a single connection, through a temporary file.
+
+    Args:
+        url (str): The URL to download from.
+        file (Path): The destination file path.
+        progress (bool, optional): Whether to show a progress bar. Defaults to True.
+        timeout (float, optional): Socket timeout in seconds. Defaults to 60.
+        on_bytes (callable, optional): Called with the number of bytes of every block received, and
+            with the negated total if the download fails. Defaults to None.
+    """
+    tmp_file = file.with_name(file.name + ".tmp")
+    written = 0
+    try:
+        with urlopen(Request(url, headers={"User-Agent": USER_AGENT}), timeout=timeout) as r:
+            length = r.headers.get("Content-Length")
+            with open(tmp_file, "wb") as f, tqdm(
+                total=int(length) if length else None,
+                unit="B",
+                unit_scale=True,
+                unit_divisor=1024,
+                disable=not progress,
+            ) as bar:
+                while block := r.read(BLOCK_SIZE):
+                    f.write(block)
+                    written += len(block)
+                    bar.update(len(block))
+                    if on_bytes is not None:
+                        on_bytes(len(block))
+    except BaseException:
+        if on_bytes is not None:
+            on_bytes(-written)
+        raise
+    os.replace(tmp_file, file)
+
+
+def download_ranged(
+    url,
+    file,
+    connections=8,
+    chunk_size=CHUNK_SIZE,
+    retries=3,
+    progress=True,
+    timeout=60,
+    on_chunk=None,
+    on_bytes=None,
+):
     """
-    Downloads and unzips files from a URL or list of URLs using PyTorch Hub.
+    Downloads a URL to a file by fetching fixed-size HTTP Range chunks over several connections.
+
+    The file is assembled in ``<file>.part`` next to a ``<file>.part.json`` state file that records
+    the finished chunks, so an interrupted download resumes from the last finished chunk when called
+    again. Servers that do not honour Range requests, and files smaller than one chunk, fall back to
+    a single-stream download. The last chunk is fetched first so that a zip central directory is
+    available early, see `od_engine.utils.extract.ZipStreamExtractor`.
+
+    Args:
+        url (str): The URL to download from.
+        file (str or Path): The destination file path.
+        connections (int, optional): The number of concurrent Range requests. Defaults to 8.
+        chunk_size (int, optional): The number of bytes per Range request. Defaults to 64 MiB.
+        retries (int, optional): The number of attempts per chunk before giving up. Defaults to 3.
+        progress (bool, optional): Whether to show a progress bar. Defaults to True.
+        timeout (float, optional): Socket timeout in seconds. Defaults to 60.
+        on_chunk (callable, optional): Called as ``on_chunk(part_file, size, start, end)`` for every
+            byte range that is on disk, including chunks finished by an earlier run. Defaults to
+            None.
+        on_bytes (callable, optional): Called from the download threads with the number of bytes of
+            every block received, and with a negative count when a failed chunk is discarded. It may
+            block to throttle the download. Defaults to None.
+    """
+    file = Path(file)
+    size, ranged, etag, final_url = _probe(url)
+    if not ranged or size is None or size <= chunk_size or connections < 2:
+        _download_stream(url, file, progress=progress, timeout=timeout, on_bytes=on_bytes)
+        return
+
+    part_file = file.with_name(file.name + ".part")
+    state_file = file.with_name(file.name + ".part.json")
+    state = _load_state(state_file)
+    if (
+        state is None
+        or state.get("url") != url
+        or state.get("size") != size
+        or state.get("etag") != etag
+        or state.get("chunk_size") != chunk_size
+        or not part_file.exists()
+        or part_file.stat().st_size != size
+    ):
+        # Start from scratch with a preallocated part file
+        state = {"url": url, "size": size, "etag": etag, "chunk_size": chunk_size, "done": []}
+        with open(part_file, "wb") as f:
+            f.truncate(size)
+        _save_state(state_file, state)
+
+    chunks = [
+        (i, start, min(start + chunk_size, size) - 1)
+        for i, start in enumerate(range(0, size, chunk_size))
+    ]
+    done = set(state["done"])
+    pending = [c for c in chunks if c[0] not in done]
+    pending = pending[-1:] + pending[:-1]  # Tail first, it holds the zip central directory
+    done_bytes = sum(end - start + 1 for i, start, end in chunks if i in done)
+    if done:
+        print(f"Resuming {url} with {len(done)}/{len(chunks)} chunks done...")
+    if on_chunk is not None:
+        for i, start, end in chunks:
+            if i in done:
+                on_chunk(part_file, size, start, end)
+
+    lock = threading.Lock()
+    bar = tqdm(
+        total=size,
+        initial=done_bytes,
+        unit="B",
+        unit_scale=True,
+        unit_divisor=1024,
+        disable=not progress,
+    )
+
+    def _fetch_chunk(chunk):
+        """Fetches one chunk into the part file and records it in the state file."""
+        i, start, end = chunk
+        for attempt in range(retries):
+            written = 0
+            try:
+                headers = {"Range": f"bytes={start}-{end}", "User-Agent": USER_AGENT}
+                with urlopen(Request(final_url, headers=headers), timeout=timeout) as r:
+                    if r.status != 206:
+                        raise IOError(f"Server ignored Range request for {url}")
+                    with open(part_file, "r+b") as f:
+                        f.seek(start)
+                        while written <= end - start:
+                            block = r.read(BLOCK_SIZE)
+                            if not block:
+                                break
+                            f.write(block)
+                            written += len(block)
+                            bar.update(len(block))
+                            if on_bytes is not None:
+                                on_bytes(len(block))
+                if written != end - start + 1:
+                    raise IOError(f"Chunk {i} of {url} is truncated")
+                break
+            except OSError:
+                bar.update(-written)
+                if on_bytes is not None:
+                    on_bytes(-written)
+                if attempt == retries - 1:
+                    raise
+        with lock:
+            state["done"].append(i)
+            _save_state(state_file, state)
+            if on_chunk is not None:
+                on_chunk(part_file, size, start, end)
+
+    try:
+        with ThreadPoolExecutor(connections) as executor:
+            futures = [executor.submit(_fetch_chunk, c) for c in pending]
+            for future in as_completed(futures):
+                future.result()
+    finally:
+        bar.close()
+
+    os.replace(part_file, file)
+    state_file.unlink()
+
+
+def _link_or_copy(src, dst):
+    """Hardlinks a file to a new path, falling back to a copy across filesystems."""
+    dst = Path(dst)
+    if dst.exists():
+        dst.unlink()
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+def _sha256(file):
+    """Computes the SHA-256 hex digest of a file."""
+    digest = hashlib.sha256()
+    with open(file, "rb") as f:
+        while block := f.read(BLOCK_SIZE):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class DownloadCache:
+    """
+    A content-addressed local cache of downloaded files.
+
+    Files are stored under ``<root>/objects`` with a key derived from the URL and the ETag the
+    server reports for it, so a changed remote file gets a new entry. ``<root>/manifest.json``
+    records the size, mtime and SHA-256 of every object and when it was last used; the least
+    recently used objects are evicted once the cache grows beyond ``max_bytes``. Cached files are
+    materialised into their destination with hardlinks, so they must be replaced rather than
+    rewritten in place. Concurrent misses of the same key, from threads or processes, wait for
+    a single download under a ``<key>.lock`` file lock.
+
+    Args:
+        root (str or Path): The cache directory.
+        max_bytes (int, optional): The size cap of the cache in bytes. Defaults to None (no cap).
+        verify (bool, optional): Whether to re-hash objects on every hit instead of checking only
+            their size and mtime. Defaults to False.
+    """
+
+    def __init__(self, root, max_bytes=None, verify=False):
+        self.root = Path(root)
+        self.objects_dir = self.root / "objects"
+        self.manifest_file = self.root / "manifest.json"
+        self.max_bytes = max_bytes
+        self.verify = verify
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+
+    def _load_manifest(self):
+        """Reads the manifest, returning an empty one if it is missing or corrupt."""
+        return _load_state(self.manifest_file) or {}
+
+    def _is_valid(self, key, entry):
+        """Checks that a cached object still matches its manifest entry."""
+        try:
+            st = (self.objects_dir / key).stat()
+        except OSError:
+            return False
+        if st.st_size != entry["size"] or st.st_mtime_ns != entry["mtime_ns"]:
+            return False
+        return not self.verify or _sha256(self.objects_dir / key) == entry["sha256"]
+
+    @contextmanager
+    def _key_lock(self, key):
+        """Holds the lock of a key, across threads and, with POSIX file locks, processes."""
+        with self._lock:
+            lock = self._key_locks.setdefault(key, threading.Lock())
+        with lock, open(self.objects_dir / f"{key}.lock", "a") as f:
+            if os.name == "posix":
+                import fcntl
+
+                fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
+    def _evict(self, manifest, keep):
+        """Removes least recently used objects until the cache fits in max_bytes."""
+        if self.max_bytes is None:
+            return
+        total = sum(entry["size"] for entry in manifest.values())
+        for key in sorted(manifest, key=lambda k: manifest[k]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            print(f"Evicting {manifest[key]['url']} from cache")
+            (self.objects_dir / key).unlink(missing_ok=True)
+            total -= manifest.pop(key)["size"]
+
+    def fetch(self, url, file, connections=8, progress=True, on_chunk=None, on_bytes=None):
+        """
+        Materialises a URL at a file path from the cache, downloading it on a miss.
+
+        Args:
+            url (str): The URL to fetch.
+            file (str or Path): The destination file path, hardlinked to the cached object.
+            connections (int, optional): The number of Range connections on a miss. Defaults to 8.
+            progress (bool, optional): Whether to show a progress bar on a miss. Defaults to True.
+            on_chunk (callable, optional): Passed to `download_ranged` on a miss. Defaults to None.
+            on_bytes (callable, optional): Passed to `download_ranged` on a miss. Defaults to None.
+
+        Returns:
+            bool: True if the file was served from the cache.
+        """
+        size, _, etag, _ = _probe(url)
+        key = hashlib.sha256(f"{url}\n{etag or ''}".encode()).hexdigest()
+        obj = self.objects_dir / key
+
+        # A second miss of the key waits for the first download and finds it in the manifest
+        with self._key_lock(key):
+            with self._lock:
+                manifest = self._load_manifest()
+                entry = manifest.get(key)
+                hit = (
+                    entry is not None
+                    and (size is None or entry["size"] == size)
+                    and self._is_valid(key, entry)
+                )
+                if hit:
+                    entry["last_used"] = time.time()
+                    _save_state(self.manifest_file, manifest)
+
+            if not hit:
+                download_ranged(
+                    url,
+                    obj,
+                    connections=connections,
+                    progress=progress,
+                    on_chunk=on_chunk,
+                    on_bytes=on_bytes,
+                )
+                st = obj.stat()
+                with self._lock:
+                    manifest = self._load_manifest()
+                    manifest[key] = {
+                        "url": url,
+                        "etag": etag,
+                        "size": st.st_size,
+                        "mtime_ns": st.st_mtime_ns,
+                        "sha256": _sha256(obj),
+                        "last_used": time.time(),
+                    }
+                    self._evict(manifest, keep=key)
+                    _save_state(self.manifest_file, manifest)
+
+        _link_or_copy(obj, file)
+        return hit
+
+
+def download_file(
+    url,
+    dir=".",
+    unzip=True,
+    delete=True,
+    connections=8,
+    workers=None,
+    cache=None,
+    progress=True,
+    on_bytes=None,
+):
+    """
+    Downloads a single URL into a directory and unzips it while it downloads.
+
+    Args:
+        url (str): The URL to download from.
+        dir (str, optional): The directory to save the file in. Defaults to ".".
+        unzip (bool, optional): Whether to unzip a downloaded zip file. Defaults to True.
+        delete (bool, optional): Whether to delete the zip file after unzipping. Defaults to True.
+        connections (int, optional): The number of Range connections. Defaults to 8.
+        workers (int, optional): The number of unzip processes. Defaults to the CPU count.
+        cache (DownloadCache, optional): The download cache to fetch through. Defaults to None.
+        progress (bool, optional): Whether to show a progress bar. Defaults to True.
+        on_bytes (callable, optional): Passed to `download_ranged`. Defaults to None.
+
+    Returns:
+        Tuple[Path, bool]: The downloaded file path and whether it was served from the cache.
+    """
+    f = Path(dir) / Path(url).name  # Filename
+    dir = f.parent
+    dir.mkdir(parents=True, exist_ok=True)  # Create dir if it does not exist
+
+    def _fetch(on_chunk=None):
+        """Fetches the URL to the file, through the cache if one is given."""
+        if cache is None:
+            download_ranged(
+                url,
+                f,
+                connections=connections,
+                progress=progress,
+                on_chunk=on_chunk,
+                on_bytes=on_bytes,
+            )
+            return False
+        return cache.fetch(
+            url,
+            f,
+            connections=connections,
+            progress=progress,
+            on_chunk=on_chunk,
+            on_bytes=on_bytes,
+        )
+
+    print(f"Downloading {url} to {f}...")
+    if not (unzip and f.suffix == ".zip"):
+        return f, _fetch()
+
+    # Unzip to dir while downloading
+    extractor = ZipStreamExtractor(f, dir, workers=workers)
+    try:
+        cached = _fetch(on_chunk=extractor.update)
+    except BaseException:
+        extractor.abort()
+        raise
+    print(f"Unzipping {f}...")
+    extracted, skipped = extractor.close()
+    print(f"Unzipped {extracted} files, {skipped} already present")
+    if delete:
+        f.unlink()  # Delete zip file
+    return f, cached
+
+
+def download(
+    url,
+    dir=".",
+    unzip=True,
+    delete=True,
+    threads=1,
+    connections=8,
+    workers=None,
+    cache_dir=None,
+    cache_max_bytes=None,
+):
+    """
+    Downloads and unzips files from a URL or list of URLs.
+
+    Large files are fetched as concurrent HTTP Range chunks and resume after an interruption, see
+    `download_ranged`. Zip files are extracted by a process pool while they download, see
+    `ZipStreamExtractor`. With a cache directory, files are hardlinked from a `DownloadCache` and
+    only fetched when they are missing from it. To download a whole manifest of files with retries
+    and a shared concurrency limit, use `od_engine.utils.scheduler.schedule_downloads`.
 
     Args:
         url (str or list): The URL or list of URLs to download from.
@@ -15,34 +477,25 @@ def download(url, dir=".", unzip=True, delete=True, threads=1):
         unzip (bool, optional): Whether to unzip the downloaded files. Defaults to True.
         delete (bool, optional): Whether to delete the zip file after unzipping. Defaults to True.
         threads (int, optional): The number of threads to use for parallel downloads. Defaults to 1.
+        connections (int, optional): The number of Range connections per file. Defaults to 8.
+        workers (int, optional): The number of unzip processes per file. Defaults to the CPU count.
+        cache_dir (str, optional): The download cache directory. Defaults to None (no cache).
+        cache_max_bytes (int, optional): The size cap of the download cache. Defaults to None.
     """
+    cache = DownloadCache(cache_dir, cache_max_bytes) if cache_dir is not None else None
 
-    def _download_one(url, dir, unzip, delete):
+    def _download_one(url):
         """Helper function to download and process a single URL."""
-        f = Path(dir) / Path(url).name  # Filename
-        dir = f.parent
-        dir.mkdir(parents=True, exist_ok=True)  # Create dir if it does not exist
-
-        print(f"Downloading {url} to {f}...")
-        download_url_to_file(url, str(f), progress=True)
-
-        if unzip and f.suffix == ".zip":
-            print(f"Unzipping {f}...")
-            with zipfile.ZipFile(f, "r") as zip_ref:
-                zip_ref.extractall(path=dir)  # Unzip to dir
-            if delete:
-                f.unlink()  # Delete zip file
+        _, cached = download_file(
+            url, dir, unzip, delete, connections=connections, workers=workers, cache=cache
+        )
+        if cached:
+            print(f"Found {url} in cache {cache_dir}")
 
     urls = [url] if isinstance(url, str) else url
     if threads > 1 and len(urls) > 1:
         with ThreadPoolExecutor(threads) as executor:
-            executor.map(
-                _download_one,
-                urls,
-                [dir] * len(urls),
-                [unzip] * len(urls),
-                [delete] * len(urls),
-            )
+            list(executor.map(_download_one, urls))  # Re-raises the first failure
     else:
         for u in urls:
-            _download_one(u, dir, unzip, delete)
+            _download_one(u)
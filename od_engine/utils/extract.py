@@ -0,0 +1,259 @@
+import multiprocessing
+import os
+import threading
+import zipfile
+import zlib
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+BLOCK_SIZE = 1024 * 1024  # Bytes read per CRC update
+BATCH_SIZE = 256  # Zip members per worker task
+# Workers are started fresh rather than forked, as the pools are created from download threads
+MP_CONTEXT = multiprocessing.get_context("spawn")
+
+
+def _member_path(dir, name):
+    """Returns the path a zip member name extracts to, dropping unsafe path components."""
+    parts = [p for p in name.split("/") if p not in ("", ".", "..")]
+    return Path(dir, *parts)
+
+
+def _is_extracted(path, info):
+    """Checks whether a zip member already exists on disk with a matching size and CRC."""
+    try:
+        if path.stat().st_size != info.file_size:
+            return False
+        crc = 0
+        with open(path, "rb") as f:
+            while block := f.read(BLOCK_SIZE):
+                crc = zlib.crc32(block, crc)
+        return crc == info.CRC
+    except OSError:
+        return False
+
+
+def _extract_members(files, names, dir):
+    """
+    Extracts the given members of a zip file, skipping members that are already extracted.
+
+    Args:
+        files (List[str]): Candidate paths of the zip file; the first one that exists is used, so a
+            partially downloaded file can be renamed to its final name while workers are running.
+        names (List[str]): The member names to extract.
+        dir (str): The directory to extract into.
+
+    Returns:
+        Tuple[int, int]: The number of extracted and skipped members.
+    """
+    for file in files:
+        try:
+            zip_ref = zipfile.ZipFile(file, "r")
+            break
+        except FileNotFoundError:
+            continue
+    else:
+        raise FileNotFoundError(f"None of {files} exist")
+
+    extracted = skipped = 0
+    with zip_ref:
+        for name in names:
+            info = zip_ref.getinfo(name)
+            if not info.is_dir() and _is_extracted(_member_path(dir, name), info):
+                skipped += 1
+                continue
+            zip_ref.extract(info, dir)
+            extracted += 1
+    return extracted, skipped
+
+
+def _make_dirs(infos, dir):
+    """
+    Creates the directory members and the parent directories of the file members, so workers
+    extracting into the same tree do not race on creating them.
+    """
+    paths = (_member_path(dir, info.filename) for info in infos)
+    dirs = {path if info.is_dir() else path.parent for path, info in zip(paths, infos)}
+    for path in dirs:
+        os.makedirs(path, exist_ok=True)
+
+
+def _batches(infos, batch_size):
+    """Splits zip members into batches of names for the worker processes."""
+    return [
+        [info.filename for info in infos[i : i + batch_size]]
+        for i in range(0, len(infos), batch_size)
+    ]
+
+
+def extract_zip(file, dir, workers=None, batch_size=BATCH_SIZE):
+    """
+    Extracts a zip file by spreading its members across a process pool.
+
+    Members that already exist with a matching size and CRC are skipped, so re-running after a
+    crash only extracts what is missing.
+
+    Args:
+        file (str or Path): The zip file to extract.
+        dir (str or Path): The directory to extract into.
+        workers (int, optional): The number of worker processes. Defaults to the CPU count.
+        batch_size (int, optional): The number of members per worker task. Defaults to 256.
+
+    Returns:
+        Tuple[int, int]: The number of extracted and skipped members.
+    """
+    with zipfile.ZipFile(file, "r") as zip_ref:
+        infos = sorted(zip_ref.infolist(), key=lambda info: info.header_offset)
+
+    _make_dirs(infos, dir)
+    extracted = skipped = 0
+    with ProcessPoolExecutor(workers, mp_context=MP_CONTEXT) as executor:
+        futures = [
+            executor.submit(_extract_members, [str(file)], names, str(dir))
+            for names in _batches(infos, batch_size)
+        ]
+        for future in futures:
+            e, s = future.result()
+            extracted += e
+            skipped += s
+    return extracted, skipped
+
+
+class ZipStreamExtractor:
+    """
+    Extracts a zip file while it is being downloaded.
+
+    `update` is called with every byte range that has been written to the partial download. Once the
+    central directory at the end of the file is available, every member whose local header and data
+    are fully downloaded is handed to a process pool, so extraction overlaps with the download.
+    `close` extracts whatever is left from the finished file.
+
+    Args:
+        file (str or Path): The final path of the zip file.
+        dir (str or Path): The directory to extract into.
+        workers (int, optional): The number of worker processes. Defaults to the CPU count.
+        batch_size (int, optional): The number of members per worker task. Defaults to 256.
+    """
+
+    def __init__(self, file, dir, workers=None, batch_size=BATCH_SIZE):
+        self.file = Path(file)
+        self.dir = Path(dir)
+        self.batch_size = batch_size
+        self._executor = ProcessPoolExecutor(workers, mp_context=MP_CONTEXT)
+        self._futures = []
+        self._lock = threading.Lock()
+        self._intervals = []  # Sorted, merged [start, end) ranges that are on disk
+        self._infos = None  # Members sorted by header offset, once the directory is readable
+        self._offsets = []
+        self._ends = []
+        self._submitted = []
+
+    def _covered(self, start, end):
+        """Checks whether the byte range [start, end) is fully on disk."""
+        i = bisect_right(self._intervals, [start, float("inf")]) - 1
+        return i >= 0 and self._intervals[i][0] <= start and end <= self._intervals[i][1]
+
+    def _add_interval(self, start, end):
+        """Merges the byte range [start, end) into the on-disk intervals."""
+        merged = []
+        for a, b in self._intervals:
+            if b < start or a > end:
+                merged.append([a, b])
+            else:
+                start, end = min(a, start), max(b, end)
+        merged.append([start, end])
+        self._intervals = sorted(merged)
+
+    def _open_directory(self, part_file, size):
+        """Reads the central directory from the partial file once the tail has been downloaded."""
+        if not self._covered(size - 1, size):
+            return
+        try:
+            with zipfile.ZipFile(part_file, "r") as zip_ref:
+                if not self._covered(zip_ref.start_dir, size):
+                    return
+                infos = sorted(zip_ref.infolist(), key=lambda info: info.header_offset)
+                start_dir = zip_ref.start_dir
+        except (zipfile.BadZipFile, OSError, ValueError):
+            return
+        self._set_infos(infos, start_dir)
+
+    def _set_infos(self, infos, start_dir):
+        """Records the members and the byte span each one occupies in the file."""
+        self._infos = infos
+        self._offsets = [info.header_offset for info in infos]
+        self._ends = self._offsets[1:] + [start_dir]
+        self._submitted = [False] * len(infos)
+
+    def _submit(self, indices, files):
+        """Hands the given members to the worker processes in batches."""
+        infos = [self._infos[i] for i in indices]
+        for i in indices:
+            self._submitted[i] = True
+        _make_dirs(infos, self.dir)
+        for names in _batches(infos, self.batch_size):
+            self._futures.append(
+                self._executor.submit(_extract_members, files, names, str(self.dir))
+            )
+
+    def update(self, part_file, size, start, end):
+        """
+        Records that the bytes [start, end] of the partial download are on disk.
+
+        Args:
+            part_file (str or Path): The partial download file.
+            size (int): The total size of the zip file in bytes.
+            start (int): The first byte of the finished range.
+            end (int): The last byte of the finished range, inclusive.
+        """
+        with self._lock:
+            self._add_interval(start, end + 1)
+            if self._infos is None:
+                self._open_directory(part_file, size)
+                if self._infos is None:
+                    return
+                candidates = range(len(self._infos))
+            else:
+                # Only members overlapping the new range can have become complete
+                lo = max(bisect_right(self._offsets, start) - 1, 0)
+                hi = bisect_left(self._offsets, end + 1)
+                candidates = range(lo, hi)
+
+            ready = [
+                i
+                for i in candidates
+                if not self._submitted[i] and self._covered(self._offsets[i], self._ends[i])
+            ]
+            if ready:
+                # The part file is renamed to its final name once the download completes
+                final_file = Path(part_file).with_suffix("")
+                self._submit(ready, [str(part_file), str(final_file), str(self.file)])
+
+    def close(self):
+        """
+        Extracts the remaining members from the finished zip file and waits for all workers.
+
+        Returns:
+            Tuple[int, int]: The number of extracted and skipped members.
+        """
+        with self._lock:
+            if self._infos is None:
+                with zipfile.ZipFile(self.file, "r") as zip_ref:
+                    infos = sorted(zip_ref.infolist(), key=lambda info: info.header_offset)
+                    self._set_infos(infos, zip_ref.start_dir)
+            remaining = [i for i, done in enumerate(self._submitted) if not done]
+            self._submit(remaining, [str(self.file)])
+
+        extracted = skipped = 0
+        try:
+            for future in self._futures:
+                e, s = future.result()
+                extracted += e
+                skipped += s
+        finally:
+            self._executor.shutdown()
+        return extracted, skipped
+
+    def abort(self):
+        """Stops the worker processes without extracting the remaining members."""
+        self._executor.shutdown(wait=True, cancel_futures=True)
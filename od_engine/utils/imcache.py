@@ -0,0 +1,277 @@
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+FORMAT_VERSION = 1
+PAD_VAL = 114
+CHUNK_SIZE = 256  # Images decoded per worker task
+
+
+def letterbox(
+    image: np.ndarray, input_size: Sequence[int], pad_val: int = PAD_VAL
+) -> Tuple[np.ndarray, Tuple[int, int]]:
+    """
+    Resizes an image to fit in the input size keeping its aspect ratio and pads it at the bottom
+    and right, like the ``Resize`` (keep_ratio) and ``Pad`` transforms of the configs.
+
+    Args:
+        image (np.ndarray): The H x W x 3 image.
+        input_size (Sequence[int]): The height and width of the output.
+        pad_val (int, optional): The padding value. Defaults to 114.
+
+    Returns:
+        Tuple[np.ndarray, Tuple[int, int]]: The padded image and the height and width of the
+            resized image within it.
+    """
+    height, width = image.shape[:2]
+    scale = min(input_size[0] / height, input_size[1] / width)
+    resized_h = max(1, min(input_size[0], int(height * scale + 0.5)))
+    resized_w = max(1, min(input_size[1], int(width * scale + 0.5)))
+    out = np.full((input_size[0], input_size[1], 3), pad_val, dtype=np.uint8)
+    out[:resized_h, :resized_w] = cv2.resize(
+        image, (resized_w, resized_h), interpolation=cv2.INTER_LINEAR
+    )
+    return out, (resized_h, resized_w)
+
+
+def read_image(path: str) -> np.ndarray:
+    """
+    Decodes an image as BGR, ignoring the EXIF orientation since COCO boxes refer to the stored
+    pixels.
+
+    Args:
+        path (str): The image file.
+
+    Returns:
+        np.ndarray: The H x W x 3 uint8 image.
+    """
+    image = cv2.imread(path, cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION)
+    if image is None:
+        raise ValueError(f"Cannot decode image {path}")
+    return image
+
+
+def _source_entry(path):
+    """Describes a source image by its size and modification time."""
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _fill_chunk(images_file, start, paths, input_size, pad_val):
+    """Decodes and letterboxes a chunk of images into the rows of the mapped array."""
+    images = np.load(images_file, mmap_mode="r+")
+    shapes = np.zeros((len(paths), 4), dtype=np.int32)
+    for i, path in enumerate(paths):
+        image = read_image(path)
+        letterboxed, resized = letterbox(image, input_size, pad_val)
+        images[start + i] = letterboxed
+        shapes[i] = (*image.shape[:2], *resized)
+    images.flush()
+    return start, shapes
+
+
+class ImageCache:
+    """
+    A read-only, memory-mapped cache of decoded images letterboxed to the training input size.
+
+    A cache is a directory with ``images.npy``, one N x H x W x 3 uint8 (BGR) array of the padded
+    images, ``shapes.npy``, an N x 4 int32 table of the original and the resized height and width
+    of every image, and a ``meta.json`` with the input size, the file names and the size and
+    modification time of every source image, which `stale` compares to find outdated entries.
+
+    Reading an image returns a view of the mapped array, so dataloader workers share the page
+    cache instead of each decoding and resizing the JPEGs every epoch. The arrays are mapped
+    again rather than copied when the cache is pickled to a spawned worker.
+
+    Args:
+        path (str): The cache directory.
+
+    Example:
+        >>> ImageCache.build("images/train", file_names, "image_cache/train", (640, 640))
+        >>> cache = ImageCache("image_cache/train")
+        >>> image, scale = cache.load("000000000139.jpg")
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        with open(self.path / "meta.json", "r") as f:
+            self.meta = json.load(f)
+        if self.meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported image cache version in {self.path}")
+        self.input_size = tuple(self.meta["input_size"])
+        self.files: List[str] = self.meta["files"]
+        self._index = {name: i for i, name in enumerate(self.files)}
+        self._open()
+
+    def _open(self):
+        """Maps the arrays."""
+        self.images = np.load(self.path / "images.npy", mmap_mode="r")
+        self.shapes = np.load(self.path / "shapes.npy", mmap_mode="r")
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["images"], state["shapes"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._open()
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+    def __contains__(self, file_name: str) -> bool:
+        return file_name in self._index
+
+    def index(self, file_name: str) -> int:
+        """Returns the row of an image by its file name, relative to the images directory."""
+        return self._index[file_name]
+
+    def get(self, index: int, crop: bool = False) -> np.ndarray:
+        """
+        Returns a read-only view of a cached image.
+
+        Args:
+            index (int): The row of the image.
+            crop (bool, optional): Whether to drop the padding. Defaults to False (the padded
+                input size image).
+
+        Returns:
+            np.ndarray: The H x W x 3 BGR image.
+        """
+        if not crop:
+            return self.images[index]
+        _, _, resized_h, resized_w = self.shapes[index]
+        return self.images[index, :resized_h, :resized_w]
+
+    def scale(self, index: int) -> float:
+        """Returns the factor the boxes of an image are multiplied by to match the cached image."""
+        height, width, resized_h, resized_w = self.shapes[index]
+        return float(min(resized_h / height, resized_w / width))
+
+    def load(self, file_name: str, crop: bool = False) -> Tuple[np.ndarray, float]:
+        """
+        Returns a read-only view of a cached image and its scale factor by file name.
+
+        Args:
+            file_name (str): The file name, relative to the images directory.
+            crop (bool, optional): Whether to drop the padding. Defaults to False.
+
+        Returns:
+            Tuple[np.ndarray, float]: The image and the scale factor of its boxes.
+        """
+        index = self._index[file_name]
+        return self.get(index, crop), self.scale(index)
+
+    def stale(
+        self, images_dir: Optional[str] = None, input_size: Optional[Sequence[int]] = None
+    ) -> List[str]:
+        """
+        Lists the images whose cached entry no longer matches the source.
+
+        Args:
+            images_dir (str, optional): The images directory. Defaults to the one the cache was
+                built from.
+            input_size (Sequence[int], optional): The expected input size. If it differs from the
+                cached one, every image is stale. Defaults to None (not checked).
+
+        Returns:
+            List[str]: The file names of the changed or missing images.
+        """
+        if input_size is not None and tuple(input_size) != self.input_size:
+            return list(self.files)
+        images_dir = images_dir or self.meta["images_dir"]
+        stale = []
+        for name, entry in zip(self.files, self.meta["sources"]):
+            try:
+                if _source_entry(os.path.join(images_dir, name)) != entry:
+                    stale.append(name)
+            except FileNotFoundError:
+                stale.append(name)
+        return stale
+
+    @classmethod
+    def build(
+        cls,
+        images_dir: str,
+        file_names: Sequence[str],
+        path: str,
+        input_size: Sequence[int],
+        pad_val: int = PAD_VAL,
+        workers: Optional[int] = None,
+    ) -> "ImageCache":
+        """
+        Decodes and letterboxes images into a new cache, replacing the directory atomically.
+
+        Worker processes write their images straight into the mapped array, so the build needs no
+        more memory than a chunk of decoded images per worker.
+
+        Args:
+            images_dir (str): The images directory.
+            file_names (Sequence[str]): The file names of the images, relative to images_dir.
+            path (str): The cache directory to write, which is replaced if it exists.
+            input_size (Sequence[int]): The height and width of the cached images.
+            pad_val (int, optional): The padding value. Defaults to 114.
+            workers (int, optional): The number of worker processes. Defaults to None (the number
+                of CPUs).
+
+        Returns:
+            ImageCache: The opened cache.
+        """
+        path = Path(path)
+        tmp_path = path.with_name(path.name + ".tmp")
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        tmp_path.mkdir(parents=True)
+
+        file_names = list(file_names)
+        paths = [os.path.join(images_dir, name) for name in file_names]
+        sources = [_source_entry(p) for p in paths]
+        images_file = str(tmp_path / "images.npy")
+        shape = (len(paths), input_size[0], input_size[1], 3)
+        # Allocate the array file, which the workers fill in place
+        images = np.lib.format.open_memmap(images_file, mode="w+", dtype=np.uint8, shape=shape)
+        del images
+
+        shapes = np.zeros((len(paths), 4), dtype=np.int32)
+        with ProcessPoolExecutor(workers) as executor:
+            futures = [
+                executor.submit(
+                    _fill_chunk,
+                    images_file,
+                    start,
+                    paths[start : start + CHUNK_SIZE],
+                    tuple(input_size),
+                    pad_val,
+                )
+                for start in range(0, len(paths), CHUNK_SIZE)
+            ]
+            for future in futures:
+                start, chunk_shapes = future.result()
+                shapes[start : start + len(chunk_shapes)] = chunk_shapes
+        np.save(tmp_path / "shapes.npy", shapes)
+
+        meta: Dict[str, Any] = {
+            "version": FORMAT_VERSION,
+            "input_size": list(input_size),
+            "pad_val": pad_val,
+            "color": "BGR",
+            "images_dir": os.path.abspath(images_dir),
+            "files": file_names,
+            "sources": sources,
+        }
+        with open(tmp_path / "meta.json", "w") as f:
+            json.dump(meta, f)
+        # Directories cannot be replaced atomically, so the old cache is moved aside first
+        old_path = path.with_name(path.name + ".old")
+        if path.exists():
+            shutil.rmtree(old_path, ignore_errors=True)
+            os.replace(path, old_path)
+        os.replace(tmp_path, path)
+        shutil.rmtree(old_path, ignore_errors=True)
+        return cls(path)
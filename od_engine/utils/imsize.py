@@ -0,0 +1,178 @@
+import json
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_INDEX = Path.home() / ".cache" / "od_engine" / "image_sizes.json"
+HEADER_SIZE = 64 * 1024  # Bytes read at once while looking for a JPEG frame header
+
+# JPEG start of frame markers; C4, C8 and CC share the range but are not frame headers
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def _jpeg_size(f):
+    """Walks the JPEG segments from the start of the file up to the first frame header."""
+    f.seek(2)
+    while True:
+        marker = f.read(2)
+        while marker[:1] == b"\xff" and marker[1:] == b"\xff":  # Fill bytes before a marker
+            marker = marker[1:] + f.read(1)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+        if marker[1] in (0xD8, 0x01) or 0xD0 <= marker[1] <= 0xD7:  # Markers without a segment
+            continue
+        header = f.read(2)
+        if len(header) < 2:
+            return None
+        (length,) = struct.unpack(">H", header)
+        if marker[1] in _SOF_MARKERS:
+            data = f.read(5)
+            if len(data) < 5:
+                return None
+            height, width = struct.unpack(">HH", data[1:5])
+            return width, height
+        f.seek(length - 2, os.SEEK_CUR)
+
+
+def read_image_size(path: str) -> Tuple[int, int]:
+    """
+    Reads the width and height of an image from its header.
+
+    JPEG and PNG files are parsed directly, reading only the segments before the JPEG frame header
+    or the PNG IHDR chunk. Other formats are opened lazily with PIL, which also only reads the
+    header. Like `PIL.Image.size`, the EXIF orientation is not applied.
+
+    Args:
+        path (str): Path to the image file.
+
+    Returns:
+        Tuple[int, int]: The width and height in pixels.
+    """
+    with open(path, "rb", buffering=HEADER_SIZE) as f:
+        head = f.read(24)
+        size = None
+        if head[:2] == b"\xff\xd8":
+            size = _jpeg_size(f)
+        elif head[:8] == _PNG_SIGNATURE and head[12:16] == b"IHDR":
+            size = struct.unpack(">II", head[16:24])
+    if size is None:
+        from PIL import Image
+
+        with Image.open(path) as img:
+            size = img.size
+    return int(size[0]), int(size[1])
+
+
+class ImageSizeIndex:
+    """
+    A persistent index of image sizes, keyed by the absolute path of every image.
+
+    An entry stores the modification time and file size it was read at, so a changed image is
+    probed again while an unchanged one only costs a `stat`. The index is a JSON file shared by all
+    tools, so any of them can fill COCO ``images[].width/height`` from sizes another one read.
+
+    Args:
+        path (str, optional): The index file. Defaults to ~/.cache/od_engine/image_sizes.json.
+        workers (int, optional): The number of threads that stat and probe images. Defaults to 16.
+
+    Example:
+        >>> index = ImageSizeIndex()
+        >>> sizes = index.get_sizes(glob("images/train/*.jpg"))
+        >>> index.save()
+    """
+
+    def __init__(self, path: Optional[str] = None, workers: int = 16):
+        self.path = Path(path) if path is not None else DEFAULT_INDEX
+        self.workers = workers
+        self.dirty = False
+        try:
+            with open(self.path, "r") as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def save(self) -> None:
+        """Atomically writes the index if it has changed."""
+        if not self.dirty:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + f".{os.getpid()}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+    def _lookup(self, key):
+        """Returns the indexed size of an image, probing it if it is new or has changed."""
+        st = os.stat(key)
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+            return (entry[2], entry[3]), None
+        width, height = read_image_size(key)
+        return (width, height), [st.st_mtime_ns, st.st_size, width, height]
+
+    def get_sizes(self, paths: Iterable[str]) -> Dict[str, Tuple[int, int]]:
+        """
+        Returns the sizes of many images, probing the new and changed ones in a thread pool.
+
+        Args:
+            paths (Iterable[str]): The image files.
+
+        Returns:
+            Dict[str, Tuple[int, int]]: The width and height of every image, keyed by the given
+                path.
+        """
+        paths = list(paths)
+        keys = [os.path.abspath(p) for p in paths]
+        with ThreadPoolExecutor(self.workers) as executor:
+            results = list(executor.map(self._lookup, keys))
+
+        sizes = {}
+        for path, key, (size, entry) in zip(paths, keys, results):
+            sizes[path] = size
+            if entry is not None:
+                self.entries[key] = entry
+                self.dirty = True
+        return sizes
+
+    def get_size(self, path: str) -> Tuple[int, int]:
+        """
+        Returns the size of one image.
+
+        Args:
+            path (str): The image file.
+
+        Returns:
+            Tuple[int, int]: The width and height in pixels.
+        """
+        return self.get_sizes([path])[path]
+
+
+def fill_coco_image_sizes(
+    images: List[Dict], images_dir: str, index: Optional[ImageSizeIndex] = None
+) -> List[Dict]:
+    """
+    Sets the width and height of COCO image entries from an `ImageSizeIndex`.
+
+    Args:
+        images (List[Dict]): The COCO ``images`` entries, with a "file_name" relative to images_dir.
+        images_dir (str): Directory containing the image files.
+        index (ImageSizeIndex, optional): The index to use. Defaults to the shared default index,
+            which is saved afterwards.
+
+    Returns:
+        List[Dict]: The same entries, updated in place.
+    """
+    own_index = index is None
+    if own_index:
+        index = ImageSizeIndex()
+    paths = [os.path.join(images_dir, image["file_name"]) for image in images]
+    sizes = index.get_sizes(paths)
+    for image, path in zip(images, paths):
+        image["width"], image["height"] = sizes[path]
+    if own_index:
+        index.save()
+    return images
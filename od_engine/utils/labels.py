@@ -0,0 +1,203 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from glob import glob
+from itertools import compress
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+BATCH_SIZE = 1000  # Label files per worker task
+
+
+class ClassMap:
+    """
+    A declarative class remap, where a target of -1 drops the label.
+
+    The mapping is compiled to a lookup table, so it applies to a whole array of class ids with one
+    `np.take` and one mask.
+
+    Args:
+        mapping (Dict[int, int]): The new class of every listed class, or -1 to drop it.
+        keep_unknown (bool, optional): Whether classes that are not in the mapping are kept as
+            they are, rather than dropped. Negative class ids are always dropped. Defaults to
+            False.
+
+    Example:
+        >>> # Merge the left and right hands and feet
+        >>> fuse = ClassMap({4: 3, 5: 4, 6: 4}, keep_unknown=True)
+        >>> keep = ClassMap({0: 0, 1: 1, 2: 2})  # Drop everything but person, head and face
+    """
+
+    def __init__(self, mapping: Dict[int, int], keep_unknown: bool = False):
+        self.mapping = dict(mapping)
+        self.keep_unknown = keep_unknown
+        size = max(self.mapping, default=-1) + 1
+        self.lut = np.arange(size) if keep_unknown else np.full(size, -1)
+        for src, dst in self.mapping.items():
+            if src < 0:
+                raise ValueError(f"Class ids must not be negative, got {src}")
+            self.lut[src] = dst
+
+    def __call__(self, class_id: int) -> int:
+        """Returns the new class of one class id, or -1 if it is dropped."""
+        if 0 <= class_id < len(self.lut):
+            return int(self.lut[class_id])
+        return class_id if self.keep_unknown and class_id >= 0 else -1
+
+    def apply(self, classes: np.ndarray) -> np.ndarray:
+        """
+        Remaps an array of class ids.
+
+        Args:
+            classes (np.ndarray): The class ids.
+
+        Returns:
+            np.ndarray: The new class ids, -1 where the label is dropped.
+        """
+        classes = np.asarray(classes, dtype=np.int64)
+        in_range = (classes >= 0) & (classes < len(self.lut))
+        out = np.full_like(classes, -1)
+        if self.keep_unknown:
+            np.maximum(classes, -1, out=out)
+        out[in_range] = np.take(self.lut, classes[in_range])
+        return out
+
+
+def _parse_classes(tokens: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """Parses class id tokens, returning the ids and a mask of the tokens that are integers."""
+    try:
+        return np.array(tokens).astype(np.int64), np.ones(len(tokens), dtype=bool)
+    except ValueError:
+        pass
+    classes = np.zeros(len(tokens), dtype=np.int64)
+    valid = np.ones(len(tokens), dtype=bool)
+    for i, token in enumerate(tokens):
+        try:
+            classes[i] = int(token)
+        except ValueError:
+            valid[i] = False
+    return classes, valid
+
+
+def remap_labels(texts: Sequence[str], class_map: ClassMap) -> Tuple[List[str], Dict[str, int]]:
+    """
+    Remaps the classes of YOLO label files held in memory.
+
+    The lines of all files are parsed into one array of class ids, remapped with one lookup and
+    filtered with one mask, then split back into files. The box coordinates are kept as written.
+    Blank lines are dropped, and lines that do not have five values or an integer class are
+    dropped with a warning.
+
+    Args:
+        texts (Sequence[str]): The contents of the label files.
+        class_map (ClassMap): The class remap.
+
+    Returns:
+        Tuple[List[str], Dict[str, int]]: The new contents of every file, and the number of labels
+            kept, dropped by the class map and invalid.
+    """
+    lines, counts = [], []
+    for text in texts:
+        file_lines = [line for line in map(str.strip, text.split("\n")) if line]
+        lines.extend(file_lines)
+        counts.append(len(file_lines))
+
+    rows = [line.split(" ", 1) for line in lines]
+    # A line has five values when it has four separators, which also keeps empty values
+    well_formed = np.fromiter(
+        (line.count(" ") == 4 for line in lines), dtype=bool, count=len(lines)
+    )
+    classes, is_int = _parse_classes([row[0] for row in rows])
+    for i in np.flatnonzero(~well_formed):
+        print(f"Warning: Invalid format in line: {lines[i]}")
+    for i in np.flatnonzero(well_formed & ~is_int):
+        print(f"Warning: Invalid number format in line: {lines[i]}")
+
+    valid = well_formed & is_int
+    new_classes = class_map.apply(classes)
+    keep = valid & (new_classes >= 0)
+    new_lines = [
+        f"{c} {row[1]}\n" if k else None
+        for c, row, k in zip(new_classes.tolist(), rows, keep.tolist())
+    ]
+
+    out, start = [], 0
+    for count in counts:
+        out.append("".join(compress(new_lines[start : start + count], keep[start : start + count])))
+        start += count
+    stats = {
+        "kept": int(keep.sum()),
+        "dropped": int((valid & ~keep).sum()),
+        "invalid": int((~valid).sum()),
+    }
+    return out, stats
+
+
+def remap_label_files(files: Sequence[str], class_map: ClassMap) -> Dict[str, int]:
+    """
+    Remaps the classes of YOLO label files in place, only rewriting the files that change.
+
+    A file with other hardlinks, e.g. in a `snapshot_dir` snapshot, is replaced by a new file, so
+    the other links keep the old contents.
+
+    Args:
+        files (Sequence[str]): The label files.
+        class_map (ClassMap): The class remap.
+
+    Returns:
+        Dict[str, int]: The number of files and changed files, and of labels kept, dropped and
+            invalid.
+    """
+    texts, linked = [], []
+    for file in files:
+        with open(file, "r") as f:
+            texts.append(f.read())
+            linked.append(os.fstat(f.fileno()).st_nlink > 1)
+    new_texts, stats = remap_labels(texts, class_map)
+    changed = 0
+    for file, text, new_text, is_linked in zip(files, texts, new_texts, linked):
+        if new_text != text:
+            if is_linked:
+                # Give the file a new inode rather than rewriting a snapshot that shares it
+                os.unlink(file)
+            with open(file, "w") as f:
+                f.write(new_text)
+            changed += 1
+    stats["files"] = len(files)
+    stats["changed"] = changed
+    return stats
+
+
+def remap_label_dirs(
+    dirs: Sequence[str],
+    class_map: ClassMap,
+    workers: Optional[int] = None,
+    batch_size: int = BATCH_SIZE,
+) -> Dict[str, int]:
+    """
+    Remaps the classes of every ``.txt`` label file in some directories, with a process pool.
+
+    The files of all directories are split into batches, so a single large split is spread across
+    all workers as well.
+
+    Args:
+        dirs (Sequence[str]): The label directories.
+        class_map (ClassMap): The class remap.
+        workers (int, optional): The number of worker processes. Defaults to the CPU count.
+        batch_size (int, optional): The number of files per worker task. Defaults to 1000.
+
+    Returns:
+        Dict[str, int]: The number of files and changed files, and of labels kept, dropped and
+            invalid.
+    """
+    files = [file for d in dirs for file in sorted(glob(os.path.join(d, "*.txt")))]
+    stats = {"files": 0, "changed": 0, "kept": 0, "dropped": 0, "invalid": 0}
+    with ProcessPoolExecutor(workers) as executor:
+        futures = [
+            executor.submit(remap_label_files, files[i : i + batch_size], class_map)
+            for i in range(0, len(files), batch_size)
+        ]
+        for future in futures:
+            for key, value in future.result().items():
+                stats[key] += value
+    return stats
@@ -0,0 +1,173 @@
+import errno
+import os
+import shutil
+import sys
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Optional
+
+LINK_MODES = ("copy", "hardlink", "reflink", "symlink", "auto")
+
+# Methods tried in order for each mode. "auto" prefers a copy-on-write clone, which is as cheap as a
+# hardlink but leaves the source untouched if the staged file is rewritten in place.
+_FALLBACKS = {
+    "copy": ("copy",),
+    "hardlink": ("hardlink", "copy"),
+    "reflink": ("reflink", "copy"),
+    "symlink": ("symlink", "copy"),
+    "auto": ("reflink", "hardlink", "copy"),
+}
+
+# Errors meaning a method can never work between two filesystems, rather than for one file
+_UNSUPPORTED = {
+    errno.EXDEV,
+    errno.EPERM,
+    errno.ENOTSUP,
+    errno.EOPNOTSUPP,
+    errno.ENOTTY,
+    errno.EINVAL,
+}
+
+FICLONE = 0x40049409  # Linux ioctl that shares the extents of one file with another
+
+
+def _reflink(src, dst):
+    """Clones a file with a Linux copy-on-write reflink, on btrfs, XFS and similar filesystems."""
+    if not sys.platform.startswith("linux"):
+        raise OSError(errno.ENOTSUP, "reflinks are only supported on Linux", str(dst))
+    import fcntl
+
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        except OSError:
+            fdst.close()
+            os.unlink(dst)
+            raise
+
+
+def _hardlink(src, dst):
+    """Hardlinks a file."""
+    os.link(src, dst)
+
+
+def _symlink(src, dst):
+    """Symlinks a file by its absolute path, so the link does not depend on the destination."""
+    os.symlink(os.path.abspath(src), dst)
+
+
+def _copy(src, dst):
+    """Copies a file."""
+    shutil.copyfile(src, dst)
+
+
+_METHODS = {"copy": _copy, "hardlink": _hardlink, "reflink": _reflink, "symlink": _symlink}
+
+
+class FileStager:
+    """
+    Stages files into a new dataset layout without duplicating their bytes where possible.
+
+    Every file is placed with the first method of its mode that works, falling back per file. A
+    method that fails because the filesystems do not support it is not tried again for the same
+    pair of devices. Files are created under a temporary name and moved over the destination, so an
+    existing destination is replaced and a failed file leaves nothing behind.
+
+    Args:
+        mode (str, optional): One of "copy", "hardlink", "reflink", "symlink" or "auto". Defaults to
+            "copy".
+
+    Example:
+        >>> stager = FileStager("auto")
+        >>> stager.stage("images/train/0001.jpg", "dataset/train/0001.jpg")
+        'hardlink'
+        >>> print(stager.summary())
+    """
+
+    def __init__(self, mode: str = "copy"):
+        if mode not in LINK_MODES:
+            raise ValueError(f"Unknown link mode {mode!r}, expected one of {LINK_MODES}")
+        self.mode = mode
+        self.files = Counter()  # Files staged per method
+        self.bytes = Counter()  # Bytes staged per method
+        self._unsupported = set()  # (method, source device, destination device)
+
+    def stage(self, src: str, dst: str) -> str:
+        """
+        Places a file at a new path.
+
+        Args:
+            src (str): The source file.
+            dst (str): The destination file, which is replaced if it exists.
+
+        Returns:
+            str: The method used, e.g. "hardlink".
+        """
+        dst = Path(dst)
+        src_stat = os.stat(src)
+        devices = (src_stat.st_dev, os.stat(dst.parent).st_dev)
+        tmp = dst.with_name(dst.name + ".tmp")
+
+        for method in _FALLBACKS[self.mode]:
+            if (method, *devices) in self._unsupported:
+                continue
+            try:
+                tmp.unlink(missing_ok=True)
+                _METHODS[method](src, tmp)
+            except OSError as e:
+                if method == "copy":
+                    raise
+                if e.errno in _UNSUPPORTED:
+                    self._unsupported.add((method, *devices))
+                continue
+            os.replace(tmp, dst)
+            # Renaming over another hardlink of the same file does nothing and keeps the temporary
+            tmp.unlink(missing_ok=True)
+            self.files[method] += 1
+            self.bytes[method] += src_stat.st_size
+            return method
+        raise AssertionError("copy is the last fallback of every mode")
+
+    @property
+    def bytes_avoided(self) -> int:
+        """The number of bytes that were not duplicated on disk."""
+        return sum(n for method, n in self.bytes.items() if method != "copy")
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Returns the files and bytes staged per method, e.g. to send back from a worker."""
+        return {"files": dict(self.files), "bytes": dict(self.bytes)}
+
+    def merge(self, stats: Optional[Dict[str, Dict[str, int]]]) -> None:
+        """Adds the `stats` of another stager, e.g. one that ran in a worker process."""
+        if stats:
+            self.files.update(stats["files"])
+            self.bytes.update(stats["bytes"])
+
+    def summary(self) -> str:
+        """Describes how the files were staged and how many bytes that saved."""
+        methods = ", ".join(
+            f"{method} {self.files[method]}" for method in _METHODS if self.files[method]
+        )
+        return (
+            f"Staged {sum(self.files.values())} files ({methods or 'none'}), "
+            f"{self.bytes_avoided / 1e6:.1f} MB not duplicated"
+        )
+
+
+def add_link_mode_argument(parser, default: str = "copy") -> None:
+    """
+    Adds the shared ``--link_mode`` option to a dataset preparation script.
+
+    Args:
+        parser (argparse.ArgumentParser): The parser of the script.
+        default (str, optional): The default mode. Defaults to "copy".
+    """
+    parser.add_argument(
+        "--link_mode",
+        "--link-mode",
+        choices=LINK_MODES,
+        default=default,
+        help="How images are placed in the new dataset: copied, hardlinked, reflinked "
+        "(copy-on-write clone) or symlinked. auto uses a reflink, then a hardlink, then a copy, "
+        "per file",
+    )
@@ -0,0 +1,90 @@
+from typing import Dict, List
+
+import numpy as np
+import torch
+from otx.core.metrics.fmeasure import FMeasure
+from otx.core.types.label import LabelInfo
+from torch import Tensor
+from torchmetrics import Metric, MetricCollection
+
+from od_engine.utils.coco_map import CocoEvaluator
+
+
+class CocoMeanAveragePrecision(Metric):
+    """
+    The box mAP of `torchmetrics.detection.MeanAveragePrecision`, computed by
+    `od_engine.utils.coco_map.CocoEvaluator` in NumPy instead of pycocotools.
+
+    The boxes of every image are kept as list states, which distributed runs gather as
+    `MeanAveragePrecision` does. `compute` returns the scalar metrics under the same names, so a
+    config switching to it keeps its val/map_50 monitor.
+
+    Args:
+        **kwargs: The `torchmetrics.Metric` arguments.
+    """
+
+    full_state_update = False
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        for name in ("dt_boxes", "dt_scores", "dt_labels", "gt_boxes", "gt_labels"):
+            self.add_state(name, default=[], dist_reduce_fx=None)
+
+    def update(self, preds: List[Dict[str, Tensor]], target: List[Dict[str, Tensor]]) -> None:
+        """
+        Adds a batch of images.
+
+        Args:
+            preds (List[Dict[str, Tensor]]): Per image, the x_min, y_min, x_max, y_max "boxes",
+                the "scores" and the "labels".
+            target (List[Dict[str, Tensor]]): Per image, the "boxes" and "labels".
+        """
+        if len(preds) != len(target):
+            raise ValueError(f"Got {len(preds)} predictions for {len(target)} targets")
+        for pred, gt in zip(preds, target):
+            self.dt_boxes.append(pred["boxes"].detach().reshape(-1, 4))
+            self.dt_scores.append(pred["scores"].detach().reshape(-1))
+            self.dt_labels.append(pred["labels"].detach().reshape(-1))
+            self.gt_boxes.append(gt["boxes"].detach().reshape(-1, 4))
+            self.gt_labels.append(gt["labels"].detach().reshape(-1))
+
+    def compute(self) -> Dict[str, Tensor]:
+        """
+        Computes the COCO metrics of every image added.
+
+        Returns:
+            Dict[str, Tensor]: The scalar map, map_50, map_75, map_small, map_medium,
+                map_large, mar_1, mar_10, mar_100, mar_small, mar_medium and mar_large.
+        """
+
+        def numpy(tensors):
+            return [t.cpu().numpy() for t in tensors]
+
+        evaluator = CocoEvaluator()
+        evaluator.update(
+            [
+                {"boxes": boxes, "scores": scores, "labels": labels}
+                for boxes, scores, labels in zip(
+                    numpy(self.dt_boxes), numpy(self.dt_scores), numpy(self.dt_labels)
+                )
+            ],
+            [
+                {"boxes": boxes, "labels": labels}
+                for boxes, labels in zip(numpy(self.gt_boxes), numpy(self.gt_labels))
+            ],
+        )
+        return {
+            name: torch.tensor(value, dtype=torch.float32)
+            for name, value in evaluator.compute().items()
+            if not isinstance(value, np.ndarray)
+        }
+
+
+def _mean_ap_f_measure_callable(label_info: LabelInfo) -> MetricCollection:
+    """
+    Builds the metrics of `otx.core.metrics.fmeasure._mean_ap_f_measure_callable` with
+    `CocoMeanAveragePrecision` for the mAP. In a config:
+
+        metric: od_engine.utils.map_metric._mean_ap_f_measure_callable
+    """
+    return MetricCollection([CocoMeanAveragePrecision(), FMeasure(label_info=label_info)])
@@ -0,0 +1,166 @@
+import copy
+from typing import Any, Dict, Optional, Sequence
+
+import numpy as np
+import torch
+from omegaconf import OmegaConf
+from otx.core.config import register_configs
+from otx.core.config.data import SamplerConfig, SubsetConfig, TileConfig, VisualPromptingConfig
+from otx.core.data.entity.base import ImageInfo
+from otx.core.data.entity.detection import DetDataEntity
+from otx.core.data.module import OTXDataModule
+from otx.core.data.transform_libs.torchvision import TorchVisionTransformLib
+from otx.core.types.image import ImageColorChannel
+from otx.core.types.task import OTXTaskType
+from torchvision import tv_tensors
+from torchvision.transforms.v2 import Compose
+
+SUBSETS = ("train_subset", "val_subset", "test_subset")
+
+
+def load_config(config_file: str) -> Dict[str, Any]:
+    """
+    Loads an OTX experiment config, resolving its interpolations such as
+    ``${as_torch_dtype:torch.float32}``.
+
+    Args:
+        config_file (str): The experiment YAML file.
+
+    Returns:
+        Dict[str, Any]: The config.
+    """
+    register_configs()
+    return OmegaConf.to_container(OmegaConf.load(config_file), resolve=True)
+
+
+def input_size(config: Dict[str, Any], subset: Optional[str] = None) -> Optional[tuple]:
+    """
+    Returns the input size of a subset, or of the data config.
+
+    Args:
+        config (Dict[str, Any]): The experiment config from `load_config`.
+        subset (str, optional): The subset. Defaults to None (the data config).
+
+    Returns:
+        Optional[tuple]: The height and width, or None if the config has none.
+    """
+    data = config["data"]
+    size = (data.get(subset) or {}).get("input_size") if subset else None
+    size = size or data.get("input_size")
+    return tuple(size) if size is not None else None
+
+
+def subset_config(config: Dict[str, Any], subset: str = "train_subset") -> SubsetConfig:
+    """
+    Builds the `SubsetConfig` of a subset, with the input size of the data config as
+    `OTXDataModule` sets it.
+
+    Args:
+        config (Dict[str, Any]): The experiment config from `load_config`.
+        subset (str, optional): The subset, one of `SUBSETS`. Defaults to "train_subset".
+
+    Returns:
+        SubsetConfig: The subset config.
+    """
+    subset_cfg = config["data"][subset]
+    return SubsetConfig(
+        batch_size=subset_cfg["batch_size"],
+        subset_name=subset_cfg["subset_name"],
+        # The transform lib fills in the input size in place
+        transforms=copy.deepcopy(subset_cfg["transforms"]),
+        num_workers=subset_cfg.get("num_workers", 2),
+        sampler=SamplerConfig(**subset_cfg.get("sampler", {})),
+        to_tv_image=subset_cfg.get("to_tv_image", True),
+        input_size=input_size(config, subset),
+    )
+
+
+def build_transforms(config: Dict[str, Any], subset: str = "train_subset") -> Compose:
+    """
+    Builds the transform pipeline of a subset without building the model or the datamodule.
+
+    Args:
+        config (Dict[str, Any]): The experiment config from `load_config`.
+        subset (str, optional): The subset, one of `SUBSETS`. Defaults to "train_subset".
+
+    Returns:
+        Compose: The enabled transforms, in config order.
+    """
+    return TorchVisionTransformLib.generate(subset_config(config, subset))
+
+
+def build_datamodule(config: Dict[str, Any], **overrides) -> OTXDataModule:
+    """
+    Builds the datamodule of an experiment config without building the model.
+
+    Args:
+        config (Dict[str, Any]): The experiment config from `load_config`.
+        **overrides: Values of the data config to replace, e.g. mem_cache_size="0GB".
+
+    Returns:
+        OTXDataModule: The datamodule with its datasets loaded.
+    """
+    data = {**config["data"], **overrides}
+    return OTXDataModule(
+        task=OTXTaskType(data["task"]),
+        data_format=data["data_format"],
+        data_root=config["data_root"],
+        train_subset=subset_config(config, "train_subset"),
+        val_subset=subset_config(config, "val_subset"),
+        test_subset=subset_config(config, "test_subset"),
+        tile_config=TileConfig(**data.get("tile_config", {})),
+        vpm_config=VisualPromptingConfig(**data.get("vpm_config", {})),
+        mem_cache_size=data.get("mem_cache_size", "1GB"),
+        mem_cache_img_max_size=data.get("mem_cache_img_max_size"),
+        image_color_channel=ImageColorChannel(data.get("image_color_channel", "RGB")),
+        stack_images=data.get("stack_images", True),
+        include_polygons=data.get("include_polygons", False),
+        ignore_index=data.get("ignore_index", 255),
+        unannotated_items_ratio=data.get("unannotated_items_ratio", 0.0),
+        auto_num_workers=data.get("auto_num_workers", False),
+        input_size=input_size(config),
+        input_size_multiplier=data.get("input_size_multiplier", 1),
+    )
+
+
+def make_det_entity(
+    image: np.ndarray,
+    bboxes: np.ndarray,
+    labels: Sequence[int],
+    index: int = 0,
+    image_color_channel: str = "BGR",
+    to_tv_image: bool = False,
+) -> DetDataEntity:
+    """
+    Builds a detection sample the way the OTX detection dataset does before its transforms.
+
+    Args:
+        image (np.ndarray): The H x W x 3 uint8 image.
+        bboxes (np.ndarray): The N x 4 boxes in absolute x_min, y_min, x_max, y_max.
+        labels (Sequence[int]): The N label indices.
+        index (int, optional): The index of the sample. Defaults to 0.
+        image_color_channel (str, optional): "RGB" or "BGR". Defaults to "BGR".
+        to_tv_image (bool, optional): Whether to convert the image to a TorchVision image, as the
+            ``to_tv_image`` subset option does. Defaults to False.
+
+    Returns:
+        DetDataEntity: The sample.
+    """
+    img_shape = image.shape[:2]
+    entity = DetDataEntity(
+        image=image,
+        img_info=ImageInfo(
+            img_idx=index,
+            img_shape=img_shape,
+            ori_shape=img_shape,
+            image_color_channel=ImageColorChannel(image_color_channel),
+        ),
+        bboxes=tv_tensors.BoundingBoxes(
+            np.asarray(bboxes, dtype=np.float32).reshape(-1, 4),
+            format=tv_tensors.BoundingBoxFormat.XYXY,
+            canvas_size=img_shape,
+            dtype=torch.float32,
+        ),
+        labels=torch.as_tensor(labels, dtype=torch.long),
+    )
+    return entity.to_tv_image() if to_tv_image else entity
@@ -0,0 +1,314 @@
+import hashlib
+import json
+import os
+import subprocess
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+BLOCK_SIZE = 1024 * 1024  # Bytes read per hash update
+FINGERPRINT_MODES = ("mtime", "content")
+
+
+def _file_entry(path, mode):
+    """Describes one file by its size and modification time, or by its content hash."""
+    st = os.stat(path)
+    if mode == "mtime":
+        return f"{st.st_size}:{st.st_mtime_ns}"
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(BLOCK_SIZE):
+            digest.update(block)
+    return f"{st.st_size}:{digest.hexdigest()}"
+
+
+def fingerprint(paths: Sequence[str], mode: str = "mtime") -> str:
+    """
+    Computes a fingerprint of files and directory trees.
+
+    Args:
+        paths (Sequence[str]): The files and directories. Missing paths are part of the
+            fingerprint, so creating them changes it.
+        mode (str, optional): "mtime" describes every file by its size and modification time,
+            "content" by its size and SHA-256. Defaults to "mtime".
+
+    Returns:
+        str: The hex digest of the fingerprint.
+    """
+    if mode not in FINGERPRINT_MODES:
+        raise ValueError(
+            f"Unknown fingerprint mode {mode!r}, expected one of {FINGERPRINT_MODES}"
+        )
+    digest = hashlib.sha256()
+    for path in sorted(set(map(str, paths))):
+        digest.update(f"{path}\n".encode())
+        if os.path.isfile(path):
+            digest.update(f"={_file_entry(path, mode)}\n".encode())
+        elif os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    file = os.path.join(root, name)
+                    entry = _file_entry(file, mode)
+                    digest.update(f"{os.path.relpath(file, path)}={entry}\n".encode())
+        else:
+            digest.update(b"missing\n")
+    return digest.hexdigest()
+
+
+@dataclass
+class Step:
+    """
+    A step of a `Pipeline`.
+
+    Args:
+        name (str): The unique name of the step.
+        run (Callable[[], Any]): Does the work of the step, raising on failure.
+        inputs (List[str], optional): Files and directories the step reads, besides the outputs
+            of its dependencies. Defaults to [].
+        outputs (List[str], optional): Files and directories the step writes. A step may rewrite
+            the outputs of a dependency in place. Defaults to [].
+        deps (List[str], optional): The names of the steps that must run first. Defaults to [].
+        params (Dict[str, Any], optional): JSON values that also decide what the step does, e.g.
+            its command line. Defaults to {}.
+    """
+
+    name: str
+    run: Callable[[], Any]
+    inputs: List[str] = field(default_factory=list)
+    outputs: List[str] = field(default_factory=list)
+    deps: List[str] = field(default_factory=list)
+    params: Dict[str, Any] = field(default_factory=dict)
+
+
+def command_step(name: str, argv: List[str], **kwargs) -> Step:
+    """
+    Creates a step that runs a command, with the command line as its parameters.
+
+    Args:
+        name (str): The unique name of the step.
+        argv (List[str]): The command and its arguments.
+        **kwargs: Passed to `Step`, e.g. inputs, outputs and deps.
+
+    Returns:
+        Step: The step.
+    """
+    argv = [str(arg) for arg in argv]
+    params = {"argv": argv, **kwargs.pop("params", {})}
+    return Step(name, lambda: subprocess.run(argv, check=True), params=params, **kwargs)
+
+
+@dataclass
+class StepResult:
+    """
+    The outcome of a `Step` in a `Pipeline.run`.
+
+    Args:
+        name (str): The name of the step.
+        status (str): "ran", "skipped" (up to date), "failed" or "blocked" (a dependency failed).
+        seconds (float): The wall time of the step, or of its up to date check when skipped.
+        error (str, optional): The error if the step failed.
+    """
+
+    name: str
+    status: str
+    seconds: float
+    error: Optional[str] = None
+
+
+class Pipeline:
+    """
+    Runs a DAG of steps, skipping the steps whose inputs and outputs have not changed.
+
+    After a step succeeds, the fingerprint of its parameters and of its inputs and outputs is
+    recorded in a JSON state file. A later run skips the step while the fingerprint still matches,
+    and runs it again, together with every step downstream of it, when anything changed or an
+    output is missing. When a step rewrites the outputs of an earlier step in place, the records of
+    the earlier steps are updated as well, so a chain of in-place transforms settles instead of
+    running again. Independent steps run in parallel. The state is saved after every step, so a
+    run that fails halfway resumes from the failed step.
+
+    Args:
+        state_file (str): The JSON file the fingerprints and timings are recorded in.
+        workers (int, optional): The number of steps run at once. Defaults to 4.
+        mode (str, optional): The fingerprint mode, "mtime" or "content". Defaults to "mtime".
+
+    Example:
+        >>> pipeline = Pipeline("dataset/.pipeline_state.json")
+        >>> pipeline.add(command_step("download", [...], outputs=["dataset/annotations"]))
+        >>> pipeline.add(
+        ...     command_step("fuse", [...], outputs=["dataset/annotations"], deps=["download"])
+        ... )
+        >>> pipeline.run()
+    """
+
+    def __init__(self, state_file: str, workers: int = 4, mode: str = "mtime"):
+        if mode not in FINGERPRINT_MODES:
+            raise ValueError(
+                f"Unknown fingerprint mode {mode!r}, expected one of {FINGERPRINT_MODES}"
+            )
+        self.state_file = Path(state_file)
+        self.workers = workers
+        self.mode = mode
+        self.steps: Dict[str, Step] = {}
+        self._lock = threading.Lock()
+        try:
+            with open(self.state_file, "r") as f:
+                self.state = json.load(f)
+        except (OSError, ValueError):
+            self.state = {}
+
+    def add(self, step: Step) -> Step:
+        """
+        Adds a step after its dependencies.
+
+        Args:
+            step (Step): The step to add.
+
+        Returns:
+            Step: The step.
+        """
+        if step.name in self.steps:
+            raise ValueError(f"Duplicate step {step.name!r}")
+        missing = [dep for dep in step.deps if dep not in self.steps]
+        if missing:
+            raise ValueError(f"Step {step.name!r} depends on unknown steps {missing}")
+        self.steps[step.name] = step
+        return step
+
+    def _paths(self, step):
+        """Returns every path whose state decides whether a step is up to date."""
+        paths = list(step.inputs) + list(step.outputs)
+        for dep in step.deps:
+            paths.extend(self.steps[dep].outputs)
+        return paths
+
+    def _params(self, step):
+        """Returns the fingerprint of the parameters of a step."""
+        return hashlib.sha256(json.dumps(step.params, sort_keys=True).encode()).hexdigest()
+
+    def _save(self):
+        """Atomically writes the state file."""
+        self.state_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.state_file.with_name(self.state_file.name + ".tmp")
+        with open(tmp_file, "w") as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp_file, self.state_file)
+
+    def _is_up_to_date(self, step):
+        """Checks whether a step's parameters, inputs and outputs match its last successful run."""
+        record = self.state.get(step.name)
+        return (
+            record is not None
+            and record["params"] == self._params(step)
+            and record["fingerprint"] == fingerprint(self._paths(step), self.mode)
+        )
+
+    def _overlaps(self, a, b):
+        """Checks whether two paths are the same or one contains the other."""
+        a, b = Path(a).resolve(), Path(b).resolve()
+        return a == b or a in b.parents or b in a.parents
+
+    def _ancestors(self, step):
+        """Returns the names of the steps a step depends on, directly or indirectly."""
+        names, stack = set(), list(step.deps)
+        while stack:
+            name = stack.pop()
+            if name not in names:
+                names.add(name)
+                stack.extend(self.steps[name].deps)
+        return names
+
+    def _record(self, step, seconds):
+        """Records a successful step and settles the records of earlier steps it rewrote."""
+        with self._lock:
+            self.state[step.name] = {
+                "params": self._params(step),
+                "fingerprint": fingerprint(self._paths(step), self.mode),
+                "seconds": round(seconds, 3),
+                "finished": time.time(),
+            }
+            for name in self._ancestors(step):
+                other = self.steps[name]
+                if name not in self.state:
+                    continue
+                if any(self._overlaps(p, o) for p in self._paths(other) for o in step.outputs):
+                    self.state[other.name]["fingerprint"] = fingerprint(
+                        self._paths(other), self.mode
+                    )
+            self._save()
+
+    def _run_step(self, step, force):
+        """Runs a step unless it is up to date."""
+        start = time.perf_counter()
+        if not force and self._is_up_to_date(step):
+            return StepResult(step.name, "skipped", time.perf_counter() - start)
+        print(f"Running step {step.name}")
+        # A step that fails or is interrupted must not look up to date next time
+        with self._lock:
+            if self.state.pop(step.name, None) is not None:
+                self._save()
+        step.run()
+        seconds = time.perf_counter() - start
+        self._record(step, seconds)
+        return StepResult(step.name, "ran", seconds)
+
+    def run(self, force: bool = False) -> Dict[str, StepResult]:
+        """
+        Runs the steps that are not up to date, in dependency order.
+
+        Args:
+            force (bool, optional): Whether to run every step even if it is up to date. Defaults
+                to False.
+
+        Returns:
+            Dict[str, StepResult]: The result of every step, in the order they were added.
+
+        Raises:
+            RuntimeError: If a step failed, after the independent steps have finished.
+        """
+        results: Dict[str, StepResult] = {}
+        ran = set()
+        pending = dict(self.steps)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(self.workers) as executor:
+            running = {}
+            while pending or running:
+                for name, step in list(pending.items()):
+                    if any(dep in pending or dep in running.values() for dep in step.deps):
+                        continue
+                    del pending[name]
+                    blocked = [
+                        dep for dep in step.deps if results[dep].status in ("failed", "blocked")
+                    ]
+                    if blocked:
+                        results[name] = StepResult(name, "blocked", 0.0, f"{blocked} failed")
+                        continue
+                    # A step runs again whenever a dependency ran
+                    step_force = force or any(dep in ran for dep in step.deps)
+                    running[executor.submit(self._run_step, step, step_force)] = name
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        results[name] = future.result()
+                    except Exception as e:
+                        error = f"{type(e).__name__}: {e}"
+                        results[name] = StepResult(name, "failed", 0.0, error)
+                        print(f"Step {name} failed: {results[name].error}")
+                    if results[name].status == "ran":
+                        ran.add(name)
+
+        results = {name: results[name] for name in self.steps}
+        for result in results.values():
+            print(f"{result.name:<30} {result.status:<8} {result.seconds:8.1f}s")
+        print(f"Pipeline finished in {time.perf_counter() - start:.1f}s")
+        failed = [r.name for r in results.values() if r.status == "failed"]
+        if failed:
+            raise RuntimeError(f"Pipeline steps failed: {', '.join(failed)}")
+        return results
@@ -0,0 +1,165 @@
+import os
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from od_engine.utils.coco_stream import iter_coco_array
+
+FORMAT_VERSION = 1
+SIDECAR_SUFFIX = ".sampler.npz"
+
+
+def sidecar_path(anno_file: str) -> str:
+    """Returns the sampler weights file next to an annotation file."""
+    return os.path.splitext(anno_file)[0] + SIDECAR_SUFFIX
+
+
+def coco_anno_file(data_root: str, subset: str) -> str:
+    """Returns the annotation file of a subset of a COCO dataset, as OTX's importer reads it."""
+    return os.path.join(data_root, "annotations", f"instances_{subset}.json")
+
+
+def file_fingerprint(path: str) -> str:
+    """Describes a file by its size and modification time."""
+    st = os.stat(path)
+    return f"{st.st_size}:{st.st_mtime_ns}"
+
+
+def class_counts(anno_file: str):
+    """
+    Counts the boxes of every class in every image of a COCO annotation file.
+
+    Images are named by their file name without the extension and classes are ordered by category
+    id, as the Datumaro COCO importer names its items and labels. Boxes without area are skipped,
+    as the OTX pre-filtering drops them.
+
+    Args:
+        anno_file (str): The COCO annotation file.
+
+    Returns:
+        Tuple[List[str], List[str], np.ndarray]: The item ids, the label names and the
+            num_images x num_labels int32 box counts.
+    """
+    categories = sorted(iter_coco_array(anno_file, "categories"), key=lambda c: c["id"])
+    label_index = {c["id"]: i for i, c in enumerate(categories)}
+    image_index = {}
+    item_ids = []
+    for image in iter_coco_array(anno_file, "images"):
+        image_index[image["id"]] = len(item_ids)
+        item_ids.append(os.path.splitext(image["file_name"])[0])
+
+    rows, cols = [], []
+    for anno in iter_coco_array(anno_file, "annotations"):
+        _, _, w, h = anno["bbox"]
+        if w > 0 and h > 0 and anno["image_id"] in image_index:
+            rows.append(image_index[anno["image_id"]])
+            cols.append(label_index[anno["category_id"]])
+    flat = np.asarray(rows, dtype=np.int64) * len(categories) + np.asarray(cols, dtype=np.int64)
+    counts = np.bincount(flat, minlength=len(item_ids) * len(categories))
+    counts = counts.astype(np.int32).reshape(len(item_ids), len(categories))
+    return item_ids, [c["name"] for c in categories], counts
+
+
+def balanced_weights(counts: np.ndarray) -> np.ndarray:
+    """
+    Computes the probability that `BalancedSampler` draws each image, which picks a class
+    uniformly and then an image containing it uniformly.
+
+    Args:
+        counts (np.ndarray): The num_images x num_labels box counts.
+
+    Returns:
+        np.ndarray: The float64 weights of the images, summing to 1 unless no image has a box.
+    """
+    present = counts > 0
+    images_per_class = present.sum(axis=0)
+    used = images_per_class > 0
+    if not used.any():
+        return np.zeros(len(counts))
+    return (present[:, used] / images_per_class[used]).sum(axis=1) / used.sum()
+
+
+def write_sampler_weights(anno_file: str, path: Optional[str] = None) -> str:
+    """
+    Precomputes the class counts and sampler weights of an annotation file into a sidecar file.
+
+    The file is an ``.npz`` with the item ids, the label names, the box counts, the weights of
+    `balanced_weights` and the fingerprint of the annotation file, so a reader can tell whether
+    the file still describes the annotations.
+
+    Args:
+        anno_file (str): The COCO annotation file.
+        path (str, optional): The sidecar file. Defaults to `sidecar_path` of the annotation file.
+
+    Returns:
+        str: The sidecar file.
+    """
+    path = path or sidecar_path(anno_file)
+    fingerprint = file_fingerprint(anno_file)
+    item_ids, label_names, counts = class_counts(anno_file)
+    tmp_path = path + ".tmp.npz"
+    np.savez(
+        tmp_path,
+        version=np.int64(FORMAT_VERSION),
+        anno_file=np.str_(os.path.basename(anno_file)),
+        fingerprint=np.str_(fingerprint),
+        item_ids=np.array(item_ids, dtype=np.str_),
+        label_names=np.array(label_names, dtype=np.str_),
+        counts=counts,
+        weights=balanced_weights(counts),
+    )
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_sampler_weights(path: str, anno_file: Optional[str] = None) -> Optional[Dict]:
+    """
+    Loads a sidecar file if it still matches its annotation file.
+
+    Args:
+        path (str): The sidecar file.
+        anno_file (str, optional): The annotation file. Defaults to the file the sidecar was
+            computed from, in the same directory.
+
+    Returns:
+        Optional[Dict]: The arrays of the file, or None if it is missing, of another format
+            version, or the annotation file changed since.
+    """
+    if not os.path.isfile(path):
+        return None
+    with np.load(path) as data:
+        sidecar = {key: data[key] for key in data.files}
+    if int(sidecar["version"]) != FORMAT_VERSION:
+        return None
+    anno_file = anno_file or os.path.join(os.path.dirname(path), str(sidecar["anno_file"]))
+    if not os.path.isfile(anno_file) or file_fingerprint(anno_file) != str(sidecar["fingerprint"]):
+        return None
+    return sidecar
+
+
+def indices_per_class(
+    sidecar: Dict, item_ids: Sequence[str], label_names: Sequence[str]
+) -> Optional[Dict[int, List[int]]]:
+    """
+    Maps the counts of a sidecar file onto the items of a dataset, in the form of
+    `otx.core.utils.utils.get_idx_list_per_classes`.
+
+    Args:
+        sidecar (Dict): The arrays of `load_sampler_weights`.
+        item_ids (Sequence[str]): The item ids of the dataset, in dataset order.
+        label_names (Sequence[str]): The label names of the dataset, in label order.
+
+    Returns:
+        Optional[Dict[int, List[int]]]: The dataset indices of the items containing each label,
+            or None if the dataset has items or labels the file does not know.
+    """
+    rows = {item_id: i for i, item_id in enumerate(sidecar["item_ids"].tolist())}
+    cols = {name: i for i, name in enumerate(sidecar["label_names"].tolist())}
+    if any(item_id not in rows for item_id in item_ids) or any(
+        name not in cols for name in label_names
+    ):
+        return None
+    present = sidecar["counts"] > 0
+    present = present[np.array([rows[i] for i in item_ids], dtype=np.int64).reshape(-1)]
+    present = present[:, [cols[name] for name in label_names]]
+    return {label: np.flatnonzero(present[:, label]).tolist() for label in range(len(label_names))}
@@ -0,0 +1,233 @@
+import asyncio
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional
+
+from tqdm import tqdm
+
+from od_engine.utils.download import DownloadCache, _probe, download_file
+
+
+@dataclass
+class DownloadTask:
+    """
+    A file in a download manifest.
+
+    Args:
+        url (str): The URL to download from.
+        dir (str): The directory to save the file in.
+        unzip (bool, optional): Whether to unzip the file if it is a zip. Defaults to True.
+        delete (bool, optional): Whether to delete the zip file after unzipping. Defaults to True.
+    """
+
+    url: str
+    dir: str
+    unzip: bool = True
+    delete: bool = True
+
+
+@dataclass
+class DownloadResult:
+    """
+    The outcome of a `DownloadTask`.
+
+    Args:
+        url (str): The URL of the task.
+        path (str): The path the file was downloaded to.
+        ok (bool): Whether the download succeeded.
+        cached (bool): Whether the file was served from the download cache.
+        attempts (int): The number of attempts made.
+        bytes (int): The number of bytes transferred over the network.
+        seconds (float): The wall time spent on the task, including retries.
+        error (str, optional): The last error if the download failed.
+    """
+
+    url: str
+    path: str
+    ok: bool
+    cached: bool
+    attempts: int
+    bytes: int
+    seconds: float
+    error: Optional[str] = None
+
+
+class _RateLimiter:
+    """
+    Caps the combined throughput of all download threads.
+
+    Every received block reserves a slot on a shared virtual clock that advances at the given rate,
+    and the receiving thread sleeps until its slot has passed.
+
+    Args:
+        max_bytes_per_sec (float): The bandwidth cap in bytes per second.
+    """
+
+    def __init__(self, max_bytes_per_sec):
+        self.max_bytes_per_sec = max_bytes_per_sec
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def consume(self, nbytes):
+        """Blocks until ``nbytes`` more bytes fit in the bandwidth cap."""
+        if nbytes <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._next = max(self._next, now) + nbytes / self.max_bytes_per_sec
+            delay = self._next - now
+        time.sleep(delay)
+
+
+async def run_downloads(
+    tasks: List[DownloadTask],
+    max_concurrency: int = 4,
+    max_bytes_per_sec: Optional[float] = None,
+    retries: int = 3,
+    backoff: float = 2.0,
+    connections: int = 8,
+    workers: Optional[int] = None,
+    cache_dir: Optional[str] = None,
+    cache_max_bytes: Optional[int] = None,
+    progress: bool = True,
+) -> List[DownloadResult]:
+    """
+    Downloads a manifest of files with a global concurrency limit, retries and one progress bar.
+
+    Each file is downloaded with `download_file` in a worker thread, so a failed attempt resumes
+    from its finished chunks when it is retried after an exponential backoff of
+    ``backoff * 2 ** (attempt - 1)`` seconds, the failed attempt counting from 1. Failures are
+    reported in the results rather than raised.
+
+    Args:
+        tasks (List[DownloadTask]): The files to download.
+        max_concurrency (int, optional): The number of files downloaded at once. Defaults to 4.
+        max_bytes_per_sec (float, optional): The bandwidth cap across all files. Defaults to None.
+        retries (int, optional): The number of attempts per file. Defaults to 3.
+        backoff (float, optional): The delay before the first retry in seconds. Defaults to 2.0.
+        connections (int, optional): The number of Range connections per file. Defaults to 8.
+        workers (int, optional): The number of unzip processes per file. Defaults to the CPU count.
+        cache_dir (str, optional): The download cache directory. Defaults to None (no cache).
+        cache_max_bytes (int, optional): The size cap of the download cache. Defaults to None.
+        progress (bool, optional): Whether to show the aggregated progress bar. Defaults to True.
+
+    Returns:
+        List[DownloadResult]: One result per task, in the order of the tasks.
+    """
+    cache = DownloadCache(cache_dir, cache_max_bytes) if cache_dir is not None else None
+    limiter = _RateLimiter(max_bytes_per_sec) if max_bytes_per_sec else None
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def _size(task):
+        """Probes the size of a task's file, returning 0 if it is unknown."""
+        try:
+            size, _, _, _ = await asyncio.to_thread(_probe, task.url)
+            return size or 0
+        except OSError:
+            return 0
+
+    sizes = await asyncio.gather(*(_size(task) for task in tasks))
+    bar = tqdm(
+        total=sum(sizes),
+        unit="B",
+        unit_scale=True,
+        unit_divisor=1024,
+        desc=f"Downloading {len(tasks)} files",
+        disable=not progress,
+    )
+    bar_lock = threading.Lock()
+
+    async def _run(task, size):
+        """Downloads one task, retrying with exponential backoff."""
+        received = 0
+        start = time.perf_counter()
+
+        def _on_bytes(nbytes):
+            """Throttles and counts the bytes received for the task."""
+            nonlocal received
+            if limiter is not None:
+                limiter.consume(nbytes)
+            with bar_lock:
+                received += nbytes
+                bar.update(nbytes)
+
+        async with semaphore:
+            error = None
+            for attempt in range(1, retries + 1):
+                try:
+                    path, cached = await asyncio.to_thread(
+                        download_file,
+                        task.url,
+                        task.dir,
+                        task.unzip,
+                        task.delete,
+                        connections=connections,
+                        workers=workers,
+                        cache=cache,
+                        progress=False,
+                        on_bytes=_on_bytes,
+                    )
+                except Exception as e:
+                    error = f"{type(e).__name__}: {e}"
+                    if attempt < retries:
+                        delay = backoff * 2 ** (attempt - 1)
+                        print(f"Retrying {task.url} in {delay:.0f}s after {error}")
+                        await asyncio.sleep(delay)
+                    continue
+
+                # Account for cache hits and chunks resumed from an earlier run
+                with bar_lock:
+                    bar.update(max(size - received, 0))
+                return DownloadResult(
+                    task.url,
+                    str(path),
+                    True,
+                    cached,
+                    attempt,
+                    received,
+                    time.perf_counter() - start,
+                )
+
+        path = Path(task.dir) / Path(task.url).name
+        return DownloadResult(
+            task.url,
+            str(path),
+            False,
+            False,
+            retries,
+            received,
+            time.perf_counter() - start,
+            error,
+        )
+
+    start = time.perf_counter()
+    try:
+        results = await asyncio.gather(*(_run(t, s) for t, s in zip(tasks, sizes)))
+    finally:
+        bar.close()
+
+    seconds = time.perf_counter() - start
+    received = sum(r.bytes for r in results)
+    failed = sum(not r.ok for r in results)
+    print(
+        f"Downloaded {len(results) - failed}/{len(results)} files, "
+        f"{received / 1e6:.1f} MB in {seconds:.1f}s "
+        f"({received / 1e6 / max(seconds, 1e-9):.1f} MB/s)"
+    )
+    return list(results)
+
+
+def schedule_downloads(tasks: List[DownloadTask], **kwargs) -> List[DownloadResult]:
+    """
+    Runs `run_downloads` to completion from synchronous code.
+
+    Args:
+        tasks (List[DownloadTask]): The files to download.
+        **kwargs: Passed to `run_downloads`.
+
+    Returns:
+        List[DownloadResult]: One result per task, in the order of the tasks.
+    """
+    return asyncio.run(run_downloads(tasks, **kwargs))
@@ -0,0 +1,512 @@
+import json
+import queue
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from od_engine.utils.boxes import clip_boxes
+from od_engine.utils.imcache import PAD_VAL, letterbox
+
+LETTERBOX = "fit_to_window_letterbox"  # The resize_type of models exported with keep_ratio
+DEFAULT_CONFIDENCE = 0.5  # The threshold of OTX models without a best_confidence_threshold
+LATENCY_PERCENTILES = (50, 90, 99)
+
+
+class ExportedModel(ABC):
+    """
+    A detector exported by OTX, with the preprocessing of its ``model_info`` metadata.
+
+    The exported graph takes N x 3 x H x W float images normalised with the ``mean_values`` and
+    ``scale_values`` of the metadata. Images are resized as the val transforms of the configs:
+    letterboxed into the input size and padded at the bottom and right with ``pad_value`` for a
+    ``fit_to_window_letterbox`` resize type, as YOLOX is, or stretched to it, as D-FINE is.
+    Input images are BGR, as OpenCV decodes them, and reversed to RGB when
+    ``reverse_input_channels`` is set, as model_api does.
+
+    Subclasses load the model and implement `infer`.
+
+    Args:
+        metadata (Dict[str, str]): The ``model_info`` values by key.
+        input_shape (Sequence[Optional[int]]): The N, C, H, W input shape, None for dynamic
+            dimensions.
+        input_size (Sequence[int], optional): The height and width of models with a dynamic
+            input size. Defaults to None.
+    """
+
+    def __init__(
+        self,
+        metadata: Dict[str, str],
+        input_shape: Sequence[Optional[int]],
+        input_size: Optional[Sequence[int]] = None,
+    ):
+        self.metadata = metadata
+        height, width = input_shape[2:] if input_size is None else input_size
+        if height is None or width is None:
+            raise ValueError(
+                "The model has a dynamic input size, pass its input_size (--input_size)"
+            )
+        self.input_size = (int(height), int(width))
+        self.max_batch_size = input_shape[0]
+        self.mean = self._floats("mean_values", 0.0)
+        self.scale = self._floats("scale_values", 1.0)
+        self.reverse_input_channels = metadata.get("reverse_input_channels", "False") == "True"
+        self.letterbox = metadata.get("resize_type", LETTERBOX) == LETTERBOX
+        self.pad_value = int(float(metadata.get("pad_value", PAD_VAL)))
+        self.labels = metadata.get("labels", "").split()
+        threshold = metadata.get("confidence_threshold", "None")
+        self.confidence_threshold = DEFAULT_CONFIDENCE if threshold == "None" else float(threshold)
+
+    def _floats(self, key: str, default: float) -> np.ndarray:
+        """Returns the three per channel values of a metadata key as a 3 x 1 x 1 array."""
+        values = [float(v) for v in self.metadata.get(key, "").split()] or [default]
+        return np.broadcast_to(np.float32(values), (3,)).reshape(3, 1, 1).copy()
+
+    def preprocess(
+        self, image: np.ndarray, out: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, Tuple[float, float]]:
+        """
+        Resizes and normalises an image for the model.
+
+        Args:
+            image (np.ndarray): The H x W x 3 uint8 BGR image, which may be a view with strided
+                rows such as a crop.
+            out (np.ndarray, optional): The 3 x H x W float32 result array, e.g. a slot of a
+                batch. Defaults to None.
+
+        Returns:
+            Tuple[np.ndarray, Tuple[float, float]]: The 3 x H x W float32 input, `out` if given,
+                and the x and y scales from the image to the input.
+        """
+        height, width = image.shape[:2]
+        if self.letterbox:
+            resized, (resized_h, resized_w) = letterbox(image, self.input_size, self.pad_value)
+        else:
+            resized_h, resized_w = self.input_size
+            resized = cv2.resize(image, (resized_w, resized_h), interpolation=cv2.INTER_LINEAR)
+        if self.reverse_input_channels:
+            resized = resized[..., ::-1]
+        if out is None:
+            out = np.empty((3, *self.input_size), dtype=np.float32)
+        np.subtract(resized.transpose(2, 0, 1), self.mean, out=out)
+        out /= self.scale
+        return out, (resized_w / width, resized_h / height)
+
+    def batch_rows(self, count: int) -> int:
+        """Returns the rows of a batch holding count images: the static batch size of the model,
+        which partial batches are padded to, or count."""
+        return self.max_batch_size or count
+
+    @abstractmethod
+    def infer(self, batch: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        Runs the model.
+
+        Args:
+            batch (np.ndarray): The N x 3 x H x W float32 inputs.
+
+        Returns:
+            Dict[str, np.ndarray]: The outputs by name.
+        """
+
+    def postprocess(
+        self,
+        outputs: Dict[str, np.ndarray],
+        scales: Sequence[Tuple[float, float]],
+        image_sizes: Sequence[Tuple[int, int]],
+        confidence_threshold: Optional[float] = None,
+    ) -> List[Dict[str, np.ndarray]]:
+        """
+        Splits the outputs of a batch into the detections of every image, in image pixels.
+
+        YOLOX models output N x K x 5 "boxes" with the score last and N x K "labels", D-FINE
+        models N x K x 4 "bboxes", "labels" and "scores". The boxes are in input pixels.
+
+        Args:
+            outputs (Dict[str, np.ndarray]): The outputs of `infer`.
+            scales (Sequence[Tuple[float, float]]): The scales of `preprocess`.
+            image_sizes (Sequence[Tuple[int, int]]): The height and width of every image.
+            confidence_threshold (float, optional): The smallest score kept. Defaults to None,
+                the threshold of the model.
+
+        Returns:
+            List[Dict[str, np.ndarray]]: Per image, the x_min, y_min, x_max, y_max "boxes", the
+                "scores" and the "labels".
+        """
+        threshold = self.confidence_threshold if confidence_threshold is None else (
+            confidence_threshold
+        )
+        if "scores" in outputs:
+            boxes = outputs["bboxes"] if "bboxes" in outputs else outputs["boxes"]
+            scores = outputs["scores"]
+        else:
+            boxes = outputs["boxes"] if "boxes" in outputs else outputs["bboxes"]
+            boxes, scores = boxes[..., :4], boxes[..., 4]
+        labels = outputs["labels"]
+
+        detections = []
+        for i, ((scale_x, scale_y), (height, width)) in enumerate(zip(scales, image_sizes)):
+            keep = (scores[i] > threshold) & (labels[i] >= 0)
+            image_boxes = boxes[i][keep] / np.float32([scale_x, scale_y, scale_x, scale_y])
+            detections.append(
+                {
+                    "boxes": clip_boxes(image_boxes, width, height, out=image_boxes),
+                    "scores": scores[i][keep],
+                    "labels": labels[i][keep].astype(np.int64),
+                }
+            )
+        return detections
+
+
+class OpenVINOModel(ExportedModel):
+    """
+    An OpenVINO IR detector on CPU.
+
+    Args:
+        path (str): The .xml file.
+        num_threads (int, optional): The inference threads. Defaults to None, all cores.
+        performance_hint (str, optional): "THROUGHPUT" or "LATENCY". Defaults to "THROUGHPUT".
+        input_size (Sequence[int], optional): See `ExportedModel`. Defaults to None.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        num_threads: Optional[int] = None,
+        performance_hint: str = "THROUGHPUT",
+        input_size: Optional[Sequence[int]] = None,
+    ):
+        import openvino as ov
+
+        core = ov.Core()
+        model = core.read_model(path)
+        metadata = {}
+        if model.has_rt_info("model_info"):
+            model_info = model.get_rt_info("model_info").astype(dict)
+            metadata = {key: value.astype(str) for key, value in model_info.items()}
+        shape = model.inputs[0].get_partial_shape()
+        input_shape = [None if d.is_dynamic else d.get_length() for d in shape]
+        super().__init__(metadata, input_shape, input_size)
+
+        config = {"PERFORMANCE_HINT": performance_hint}
+        if num_threads:
+            config["INFERENCE_NUM_THREADS"] = num_threads
+        self.compiled = core.compile_model(model, "CPU", config)
+        self.request = self.compiled.create_infer_request()
+
+    def infer(self, batch: np.ndarray) -> Dict[str, np.ndarray]:
+        result = self.request.infer({0: batch})
+        return {port.get_any_name(): value for port, value in result.items()}
+
+
+class OnnxModel(ExportedModel):
+    """
+    An ONNX detector on the CPU execution provider of ONNX Runtime.
+
+    Args:
+        path (str): The .onnx file.
+        num_threads (int, optional): The intra-op threads. Defaults to None, all cores.
+        input_size (Sequence[int], optional): See `ExportedModel`. Defaults to None.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        num_threads: Optional[int] = None,
+        input_size: Optional[Sequence[int]] = None,
+    ):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(
+            path, options, providers=["CPUExecutionProvider"]
+        )
+        # OTX embeds the model_info values as "model_info <key>" metadata properties
+        metadata = {
+            key.split(" ", 1)[1]: value
+            for key, value in self.session.get_modelmeta().custom_metadata_map.items()
+            if key.startswith("model_info ")
+        }
+        shape = self.session.get_inputs()[0].shape
+        input_shape = [d if isinstance(d, int) else None for d in shape]
+        super().__init__(metadata, input_shape, input_size)
+        self.input_name = self.session.get_inputs()[0].name
+        self.output_names = [output.name for output in self.session.get_outputs()]
+
+    def infer(self, batch: np.ndarray) -> Dict[str, np.ndarray]:
+        values = self.session.run(self.output_names, {self.input_name: batch})
+        return dict(zip(self.output_names, values))
+
+
+def load_model(
+    path: str, num_threads: Optional[int] = None, input_size: Optional[Sequence[int]] = None
+) -> ExportedModel:
+    """
+    Loads an exported detector for CPU inference, by the extension of its file.
+
+    Args:
+        path (str): An OpenVINO .xml or an .onnx file.
+        num_threads (int, optional): The inference threads. Defaults to None, all cores.
+        input_size (Sequence[int], optional): See `ExportedModel`. Defaults to None.
+
+    Returns:
+        ExportedModel: The model.
+    """
+    suffix = Path(path).suffix.lower()
+    if suffix == ".xml":
+        return OpenVINOModel(path, num_threads, input_size=input_size)
+    if suffix == ".onnx":
+        return OnnxModel(path, num_threads, input_size=input_size)
+    raise ValueError(f"Unsupported model file {path}, expected an OpenVINO .xml or .onnx file")
+
+
+class _Request:
+    """A queued image with its preprocessing and result futures."""
+
+    __slots__ = ("future", "inputs", "image_size", "submitted")
+
+    def __init__(self, future: Future, inputs: Future, image_size: Tuple[int, int]):
+        self.future = future
+        self.inputs = inputs
+        self.image_size = image_size
+        self.submitted = time.perf_counter()
+
+
+class InferenceServer:
+    """
+    Serves a detector with dynamic micro-batching.
+
+    `submit` starts the preprocessing of an image in a thread pool, where OpenCV and NumPy
+    release the GIL, and queues it. A batching thread takes the oldest request, then waits for
+    more until the batch holds ``max_batch_size`` requests or the oldest one has waited
+    ``max_wait_ms``, and runs the model on the batch while the next requests are preprocessed.
+    Every request gets its detections through its future.
+
+    Args:
+        model (ExportedModel): The model.
+        max_batch_size (int, optional): The largest batch, capped at the static batch size of
+            the model, which partial batches are padded to. Defaults to 8.
+        max_wait_ms (float, optional): How long the oldest request waits for a batch to fill.
+            Defaults to 5.0.
+        preprocess_workers (int, optional): The preprocessing threads. Defaults to 4.
+        confidence_threshold (float, optional): The smallest score kept. Defaults to None, the
+            threshold of the model.
+
+    Example:
+        >>> with InferenceServer(load_model("model.xml"), max_batch_size=8) as server:
+        ...     detections = server.submit(cv2.imread("image.jpg")).result()
+    """
+
+    def __init__(
+        self,
+        model: ExportedModel,
+        max_batch_size: int = 8,
+        max_wait_ms: float = 5.0,
+        preprocess_workers: int = 4,
+        confidence_threshold: Optional[float] = None,
+    ):
+        self.model = model
+        self.max_batch_size = min(max_batch_size, model.max_batch_size or max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self.confidence_threshold = confidence_threshold
+        rows = model.batch_rows(self.max_batch_size)
+        self._batch = np.zeros((rows, 3, *model.input_size), dtype=np.float32)
+        self._queue: "queue.Queue[Optional[_Request]]" = queue.Queue()
+        self._pool = ThreadPoolExecutor(preprocess_workers, thread_name_prefix="preprocess")
+        self._lock = threading.Lock()
+        self.reset_stats()
+        self._thread = threading.Thread(target=self._run, name="batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, image: np.ndarray) -> Future:
+        """
+        Queues an image.
+
+        Args:
+            image (np.ndarray): The H x W x 3 uint8 BGR image.
+
+        Returns:
+            Future: The detections of `ExportedModel.postprocess`.
+        """
+        future = Future()
+        inputs = self._pool.submit(self.model.preprocess, image)
+        self._queue.put(_Request(future, inputs, image.shape[:2]))
+        return future
+
+    def detect(self, image: np.ndarray) -> Dict[str, np.ndarray]:
+        """Queues an image and waits for its detections."""
+        return self.submit(image).result()
+
+    def _next_batch(self, first: _Request) -> Tuple[List[_Request], bool]:
+        """Collects requests after the first until the batch is full or its wait is over."""
+        batch = [first]
+        deadline = first.submitted + self.max_wait
+        while len(batch) < self.max_batch_size:
+            try:
+                request = self._queue.get(timeout=max(deadline - time.perf_counter(), 0))
+            except queue.Empty:
+                break
+            if request is None:
+                return batch, True
+            batch.append(request)
+        return batch, False
+
+    def _run(self) -> None:
+        """Forms the batches and runs them until `close`."""
+        stop = False
+        while not stop:
+            first = self._queue.get()
+            if first is None:
+                break
+            batch, stop = self._next_batch(first)
+            ready, scales = [], []
+            for request in batch:
+                try:
+                    tensor, scale = request.inputs.result()
+                except Exception as e:  # The error belongs to the request
+                    request.future.set_exception(e)
+                    continue
+                self._batch[len(ready)] = tensor
+                ready.append(request)
+                scales.append(scale)
+            if not ready:
+                continue
+            started = time.perf_counter()
+            try:
+                outputs = self.model.infer(self._batch[: self.model.batch_rows(len(ready))])
+                detections = self.model.postprocess(
+                    outputs,
+                    scales,
+                    [request.image_size for request in ready],
+                    self.confidence_threshold,
+                )
+            except Exception as e:  # The error belongs to every request
+                for request in ready:
+                    request.future.set_exception(e)
+                continue
+            done = time.perf_counter()
+            for request, result in zip(ready, detections):
+                request.future.set_result(result)
+            with self._lock:
+                self._latencies.extend(done - request.submitted for request in ready)
+                self._batch_sizes.append(len(ready))
+                self._infer_seconds += done - started
+                self._last_done = done
+
+    def reset_stats(self) -> None:
+        """Starts a new measurement window for `stats`."""
+        with self._lock:
+            self._latencies: List[float] = []
+            self._batch_sizes: List[int] = []
+            self._infer_seconds = 0.0
+            self._started = time.perf_counter()
+            self._last_done = self._started
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Measures the requests served since the last `reset_stats`.
+
+        Returns:
+            Dict[str, Any]: The number of requests and batches, the mean batch size, the
+                throughput in images per second, the latency percentiles p50, p90 and p99 in
+                milliseconds from `submit` to the result, and the share of the time spent in
+                the model.
+        """
+        with self._lock:
+            latencies = np.array(self._latencies) * 1000
+            batch_sizes = np.array(self._batch_sizes)
+            seconds = max(self._last_done - self._started, 1e-9)
+            infer_seconds = self._infer_seconds
+        stats = {
+            "requests": int(latencies.size),
+            "batches": int(batch_sizes.size),
+            "mean_batch_size": float(batch_sizes.mean()) if batch_sizes.size else 0.0,
+            "throughput": latencies.size / seconds,
+            "model_busy": infer_seconds / seconds,
+        }
+        for p in LATENCY_PERCENTILES:
+            stats[f"p{p}_ms"] = float(np.percentile(latencies, p)) if latencies.size else None
+        return stats
+
+    def close(self) -> None:
+        """Serves the queued requests, then stops the batching thread and the pool."""
+        self._queue.put(None)
+        self._thread.join()
+        self._pool.shutdown()
+
+    def __enter__(self) -> "InferenceServer":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def make_http_server(server: InferenceServer, host: str, port: int) -> ThreadingHTTPServer:
+    """
+    Builds an HTTP front end of a server, with a thread per connection so concurrent requests
+    share batches.
+
+    ``POST /detect`` takes an encoded image as the body and returns its detections as JSON, with
+    the label names of the model when it has them. ``GET /stats`` returns `InferenceServer.stats`.
+
+    Args:
+        server (InferenceServer): The server.
+        host (str): The address to listen on.
+        port (int): The port.
+
+    Returns:
+        ThreadingHTTPServer: The HTTP server, to run with ``serve_forever``.
+    """
+    labels = server.model.labels
+
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, code: int, body: Dict[str, Any]) -> None:
+            data = json.dumps(body).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/stats":
+                self._reply(200, server.stats())
+            else:
+                self._reply(404, {"error": f"Unknown path {self.path}"})
+
+        def do_POST(self):
+            if self.path != "/detect":
+                self._reply(404, {"error": f"Unknown path {self.path}"})
+                return
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            try:
+                image = cv2.imdecode(np.frombuffer(body, dtype=np.uint8), cv2.IMREAD_COLOR)
+            except cv2.error:  # Raised rather than None for an empty body
+                image = None
+            if image is None:
+                self._reply(400, {"error": "Cannot decode the image"})
+                return
+            try:
+                detections = {k: v.tolist() for k, v in server.detect(image).items()}
+            except Exception as e:  # Reported to the client
+                self._reply(500, {"error": f"{type(e).__name__}: {e}"})
+                return
+            if labels:
+                # Labels beyond the names of the model keep their index
+                detections["label_names"] = [
+                    labels[i] if 0 <= i < len(labels) else i for i in detections["labels"]
+                ]
+            self._reply(200, detections)
+
+        def log_message(self, format, *args):
+            pass
+
+    return ThreadingHTTPServer((host, port), Handler)
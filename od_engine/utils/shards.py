@@ -0,0 +1,252 @@
+import io
+import json
+import os
+import random
+import tarfile
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from od_engine.utils.coco_stream import iter_coco_array, load_coco_header
+
+SHARD_SIZE = 1024 * 1024 * 1024  # Bytes of samples per shard
+INDEX_FILE = "index.json"
+READ_SIZE = 8 * 1024 * 1024  # Bytes read at a time when a shard is read sequentially
+
+# Key, encoded image and a dict with the COCO image entry and its annotations
+Sample = Tuple[str, bytes, Dict[str, Any]]
+
+
+def iter_coco_samples(coco_file: str, images_dir: str) -> Iterator[Sample]:
+    """
+    Iterates over the samples of a COCO dataset in the directory layout, in the order of ``images``.
+
+    Args:
+        coco_file (str): Path to the COCO JSON file.
+        images_dir (str): Directory containing the image files.
+
+    Yields:
+        Sample: The key (the file name without its extension), the encoded image and a dict with
+            the COCO "image" entry and its "annotations".
+    """
+    annotations = defaultdict(list)
+    for anno in iter_coco_array(coco_file, "annotations"):
+        annotations[anno["image_id"]].append(anno)
+    for image in iter_coco_array(coco_file, "images"):
+        with open(os.path.join(images_dir, image["file_name"]), "rb") as f:
+            data = f.read()
+        key = os.path.splitext(image["file_name"])[0]
+        yield key, data, {"image": image, "annotations": annotations.pop(image["id"], [])}
+
+
+def _add_member(tar, name, data):
+    """Appends one file to a tar archive."""
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    tar.addfile(info, io.BytesIO(data))
+
+
+def _index_shard(path):
+    """Lists the samples of a shard with the offset and size of their image and metadata."""
+    samples = {}
+    with tarfile.open(path, "r:") as tar:
+        for info in tar:
+            key, ext = info.name.rsplit(".", 1)
+            entry = samples.setdefault(key, {"key": key})
+            if ext == "json":
+                entry["meta"] = [info.offset_data, info.size]
+            else:
+                entry["image"] = [info.offset_data, info.size]
+                entry["ext"] = ext
+    return list(samples.values())
+
+
+def pack_coco_shards(
+    coco_file: str, images_dir: str, out_dir: str, shard_size: int = SHARD_SIZE
+) -> Dict[str, Any]:
+    """
+    Packs a COCO dataset into large tar shards with a random-access offset index.
+
+    Every sample is stored as two consecutive tar members, ``<key>.<ext>`` with the encoded image
+    and ``<key>.json`` with its COCO image entry and annotations, so the shards can also be read
+    with any tar tool. ``index.json`` lists the shards, the offset and size of every member and the
+    top level values of the COCO file, e.g. categories.
+
+    Args:
+        coco_file (str): Path to the COCO JSON file.
+        images_dir (str): Directory containing the image files.
+        out_dir (str): The shard directory, whose shards and index are replaced.
+        shard_size (int, optional): The bytes of samples after which a new shard is started.
+            Defaults to 1 GiB.
+
+    Returns:
+        Dict[str, Any]: The index.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    for old in out_dir.glob("shard-*.tar"):
+        old.unlink()
+
+    shards, tar, written = [], None, 0
+    try:
+        for key, data, meta in iter_coco_samples(coco_file, images_dir):
+            if tar is None or written >= shard_size:
+                if tar is not None:
+                    tar.close()
+                shards.append(f"shard-{len(shards):05d}.tar")
+                tar = tarfile.open(out_dir / shards[-1], "w:", format=tarfile.USTAR_FORMAT)
+                written = 0
+            ext = os.path.splitext(meta["image"]["file_name"])[1].lstrip(".") or "bin"
+            meta_data = json.dumps(meta).encode()
+            _add_member(tar, f"{key}.{ext}", data)
+            _add_member(tar, f"{key}.json", meta_data)
+            written += len(data) + len(meta_data)
+    finally:
+        if tar is not None:
+            tar.close()
+
+    index = {
+        "header": load_coco_header(coco_file),
+        "shards": [{"file": name, "samples": _index_shard(out_dir / name)} for name in shards],
+    }
+    tmp_file = out_dir / (INDEX_FILE + ".tmp")
+    with open(tmp_file, "w") as f:
+        json.dump(index, f)
+    os.replace(tmp_file, out_dir / INDEX_FILE)
+    return index
+
+
+class ShardReader:
+    """
+    Reads samples packed by `pack_coco_shards`, by key or in order.
+
+    Random access reads the two members of a sample with `os.pread` at the offsets of the index,
+    so one reader can be shared by threads, and a forked dataloader worker can keep using it.
+    Iteration reads every shard sequentially in large blocks and can shuffle at the shard level and
+    then at the sample level with a shuffle buffer.
+
+    Args:
+        path (str): The shard directory.
+
+    Example:
+        >>> reader = ShardReader("cocohumanparts_shards/train")
+        >>> key, image, meta = reader["000000000139"]
+        >>> for key, image, meta in reader.iter_samples(shuffle=True, seed=0):
+        ...     pass
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        with open(self.path / INDEX_FILE, "r") as f:
+            index = json.load(f)
+        self.header = index["header"]
+        self.shards = [shard["file"] for shard in index["shards"]]
+        self.shard_samples = [shard["samples"] for shard in index["shards"]]
+        self.samples: List[Tuple[int, Dict[str, Any]]] = [
+            (i, sample) for i, samples in enumerate(self.shard_samples) for sample in samples
+        ]
+        self._by_key = {sample["key"]: n for n, (_, sample) in enumerate(self.samples)}
+        self._fds: Dict[int, int] = {}
+        self._pid = os.getpid()
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+    def keys(self) -> List[str]:
+        """Returns the keys of the samples in packing order."""
+        return [sample["key"] for _, sample in self.samples]
+
+    def _fd(self, shard):
+        """Returns an open descriptor of a shard, reopening the shards in a forked process."""
+        if self._pid != os.getpid():
+            self._fds, self._pid = {}, os.getpid()
+        if shard not in self._fds:
+            self._fds[shard] = os.open(self.path / self.shards[shard], os.O_RDONLY)
+        return self._fds[shard]
+
+    def _read(self, shard, sample):
+        """Reads the image and metadata of a sample."""
+        fd = self._fd(shard)
+        offset, size = sample["image"]
+        data = os.pread(fd, size, offset)
+        offset, size = sample["meta"]
+        meta = json.loads(os.pread(fd, size, offset))
+        return sample["key"], data, meta
+
+    def get(self, index: int) -> Sample:
+        """
+        Reads a sample by its position in packing order.
+
+        Args:
+            index (int): The position of the sample.
+
+        Returns:
+            Sample: The key, the encoded image and the image entry with its annotations.
+        """
+        shard, sample = self.samples[index]
+        return self._read(shard, sample)
+
+    def __getitem__(self, key: str) -> Sample:
+        """Reads a sample by its key."""
+        return self.get(self._by_key[key])
+
+    def _iter_shard(self, shard):
+        """Reads the samples of a shard in order with large sequential reads."""
+        with open(self.path / self.shards[shard], "rb", buffering=READ_SIZE) as f:
+            for sample in self.shard_samples[shard]:
+                offset, size = sample["image"]
+                f.seek(offset)
+                data = f.read(size)
+                offset, size = sample["meta"]
+                f.seek(offset)
+                meta = json.loads(f.read(size))
+                yield sample["key"], data, meta
+
+    def iter_samples(
+        self, shuffle: bool = False, buffer_size: int = 1000, seed: Optional[int] = None
+    ) -> Iterator[Sample]:
+        """
+        Iterates over all samples, reading every shard sequentially.
+
+        Args:
+            shuffle (bool, optional): Whether to shuffle the shard order and then the samples with
+                a shuffle buffer. Defaults to False (packing order, like `iter_coco_samples`).
+            buffer_size (int, optional): The number of samples in the shuffle buffer. Defaults to
+                1000.
+            seed (int, optional): The random seed. Defaults to None.
+
+        Yields:
+            Sample: The key, the encoded image and the image entry with its annotations.
+        """
+        order = list(range(len(self.shards)))
+        if not shuffle:
+            for shard in order:
+                yield from self._iter_shard(shard)
+            return
+
+        rng = random.Random(seed)
+        rng.shuffle(order)
+        buffer = []
+        for shard in order:
+            for sample in self._iter_shard(shard):
+                if len(buffer) < buffer_size:
+                    buffer.append(sample)
+                    continue
+                i = rng.randrange(buffer_size)
+                yield buffer[i]
+                buffer[i] = sample
+        rng.shuffle(buffer)
+        yield from buffer
+
+    def close(self) -> None:
+        """Closes the open shards."""
+        if self._pid == os.getpid():
+            for fd in self._fds.values():
+                os.close(fd)
+        self._fds = {}
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
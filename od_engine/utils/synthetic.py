@@ -0,0 +1,241 @@
+import io
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+import yaml
+from PIL import Image
+
+from od_engine.utils.link import FileStager
+
+NUM_PARTS = 6  # head, face, left hand, right hand, left foot, right foot
+IMAGE_SIZES = ((96, 64), (64, 96), (80, 80))  # Width and height of the tiny images
+CATEGORIES = [
+    {"id": 1, "supercategory": "person", "name": "person"},
+    {"id": 2, "supercategory": "head", "name": "head"},
+    {"id": 3, "supercategory": "face", "name": "face"},
+    {"id": 4, "supercategory": "lefthand", "name": "lefthand"},
+    {"id": 5, "supercategory": "righthand", "name": "righthand"},
+    {"id": 6, "supercategory": "leftfoot", "name": "leftfoot"},
+    {"id": 7, "supercategory": "rightfoot", "name": "rightfoot"},
+]
+
+
+def tiny_jpegs(sizes: Sequence[Tuple[int, int]] = IMAGE_SIZES, seed: int = 0) -> List[bytes]:
+    """
+    Encodes one small noise JPEG per size.
+
+    Args:
+        sizes (Sequence[Tuple[int, int]], optional): The width and height of every image.
+            Defaults to `IMAGE_SIZES`.
+        seed (int, optional): The random seed. Defaults to 0.
+
+    Returns:
+        List[bytes]: The encoded images.
+    """
+    rng = np.random.default_rng(seed)
+    blobs = []
+    for width, height in sizes:
+        buffer = io.BytesIO()
+        pixels = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+        Image.fromarray(pixels).save(buffer, format="JPEG")
+        blobs.append(buffer.getvalue())
+    return blobs
+
+
+def humanparts_coco(
+    num_annotations: int,
+    persons_per_image: int = 4,
+    part_prob: float = 0.7,
+    sizes: Sequence[Tuple[int, int]] = IMAGE_SIZES,
+    seed: int = 0,
+) -> Dict[str, Any]:
+    """
+    Generates a COCO Human Parts style annotation file, with a person annotation per box and the
+    boxes of its six parts in a 30 value "hier" vector of [x_min, y_min, x_max, y_max, visible].
+
+    Args:
+        num_annotations (int): The number of person annotations.
+        persons_per_image (int, optional): The number of persons per image. Defaults to 4.
+        part_prob (float, optional): The probability that a part is visible. Defaults to 0.7.
+        sizes (Sequence[Tuple[int, int]], optional): The image sizes, cycled over the images.
+            Defaults to `IMAGE_SIZES`.
+        seed (int, optional): The random seed. Defaults to 0.
+
+    Returns:
+        Dict[str, Any]: The COCO dict with "images", "annotations" and "categories".
+    """
+    rng = np.random.default_rng(seed)
+    num_images = max(1, -(-num_annotations // persons_per_image))
+    size_index = np.arange(num_images) % len(sizes)
+    images = [
+        {
+            "id": i + 1,
+            "file_name": f"{i + 1:012d}.jpg",
+            "width": sizes[s][0],
+            "height": sizes[s][1],
+        }
+        for i, s in enumerate(size_index.tolist())
+    ]
+
+    image_index = np.arange(num_annotations) // persons_per_image
+    wh = np.array(sizes, dtype=np.float64)[size_index[image_index]]
+    # Person boxes cover 30 to 90 percent of the image, parts lie within their person
+    box_wh = wh * rng.uniform(0.3, 0.9, (num_annotations, 2))
+    box_xy = (wh - box_wh) * rng.random((num_annotations, 2))
+    part_wh = box_wh[:, None] * rng.uniform(0.1, 0.4, (num_annotations, NUM_PARTS, 2))
+    part_xy = box_xy[:, None] + (box_wh[:, None] - part_wh) * rng.random(
+        (num_annotations, NUM_PARTS, 2)
+    )
+    visible = rng.random((num_annotations, NUM_PARTS)) < part_prob
+    hier = np.concatenate([part_xy, part_xy + part_wh, visible[..., None]], axis=2)
+    hier[~visible] = 0
+    hier = hier.round(2).reshape(num_annotations, -1)
+    bbox = np.concatenate([box_xy, box_wh], axis=1).round(2)
+
+    annotations = [
+        {
+            "id": i + 1,
+            "image_id": image_id + 1,
+            "category_id": 1,
+            "bbox": box,
+            "area": round(box[2] * box[3], 2),
+            "iscrowd": 0,
+            "hier": h,
+        }
+        for i, (image_id, box, h) in enumerate(
+            zip(image_index.tolist(), bbox.tolist(), hier.tolist())
+        )
+    ]
+    return {"images": images, "annotations": annotations, "categories": CATEGORIES[:1]}
+
+
+def parts_coco(coco: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Converts a `humanparts_coco` dict to the seven category layout of the prepared COCO dataset,
+    with every person followed by its visible parts.
+
+    Args:
+        coco (Dict[str, Any]): The COCO Human Parts dict.
+
+    Returns:
+        Dict[str, Any]: The COCO dict with person and part annotations.
+    """
+    annotations = []
+    for anno in coco["annotations"]:
+        person = {k: v for k, v in anno.items() if k != "hier"}
+        person["id"] = len(annotations) + 1
+        annotations.append(person)
+        for part in range(NUM_PARTS):
+            x1, y1, x2, y2, visible = anno["hier"][part * 5 : part * 5 + 5]
+            if visible:
+                annotations.append(
+                    dict(
+                        person,
+                        id=len(annotations) + 1,
+                        category_id=part + 2,
+                        bbox=[x1, y1, round(x2 - x1, 2), round(y2 - y1, 2)],
+                        area=round((x2 - x1) * (y2 - y1), 2),
+                    )
+                )
+    return {"images": coco["images"], "annotations": annotations, "categories": CATEGORIES}
+
+
+def yolo_label_texts(coco: Dict[str, Any]) -> Dict[str, str]:
+    """
+    Builds the YOLO label file contents of every image of a `parts_coco` dict.
+
+    Args:
+        coco (Dict[str, Any]): The COCO dict with person and part annotations.
+
+    Returns:
+        Dict[str, str]: The label text by image file name.
+    """
+    images = {image["id"]: image for image in coco["images"]}
+    texts = {image["file_name"]: [] for image in coco["images"]}
+    for anno in coco["annotations"]:
+        image = images[anno["image_id"]]
+        x, y, w, h = anno["bbox"]
+        texts[image["file_name"]].append(
+            f"{anno['category_id'] - 1} {(x + w / 2) / image['width']:.6f} "
+            f"{(y + h / 2) / image['height']:.6f} {w / image['width']:.6f} "
+            f"{h / image['height']:.6f}\n"
+        )
+    return {name: "".join(lines) for name, lines in texts.items()}
+
+
+def write_images(images_dir: str, images: List[Dict[str, Any]], blobs: List[bytes]) -> None:
+    """
+    Writes the image files of a COCO dict, using the blob of the matching size for every image.
+
+    Args:
+        images_dir (str): The images directory.
+        images (List[Dict[str, Any]]): The COCO image entries.
+        blobs (List[bytes]): The encoded images, one per size of `IMAGE_SIZES`.
+    """
+    os.makedirs(images_dir, exist_ok=True)
+    by_size = dict(zip(IMAGE_SIZES, blobs))
+    for image in images:
+        with open(os.path.join(images_dir, image["file_name"]), "wb") as f:
+            f.write(by_size[(image["width"], image["height"])])
+
+
+def make_humanparts_dataset(
+    root: str, num_annotations: int, splits: Sequence[str] = ("train", "val"), seed: int = 0
+) -> Dict[str, str]:
+    """
+    Writes synthetic COCO Human Parts datasets in the layouts the data tools read.
+
+    The annotations are split evenly between the splits. Under ``root`` it writes:
+        raw/: person_humanparts_<split>.json with "hier" vectors and images/<split>/, the input
+            of the COCO and YOLO converters.
+        coco/: annotations/instances_<split>.json with the seven categories, the COCO dataset
+            the label transforms rewrite.
+        yolo/: images/<split>/, labels/<split>/ and data.yaml, the YOLO dataset the label
+            transforms and the RF-DETR converter read. Its images are hardlinks of raw/.
+
+    Args:
+        root (str): The output directory.
+        num_annotations (int): The number of person annotations over all splits.
+        splits (Sequence[str], optional): The splits. Defaults to ("train", "val").
+        seed (int, optional): The random seed. Defaults to 0.
+
+    Returns:
+        Dict[str, str]: The "raw", "coco" and "yolo" directories.
+    """
+    root = Path(root)
+    dirs = {name: str(root / name) for name in ("raw", "coco", "yolo")}
+    blobs = tiny_jpegs(seed=seed)
+    stager = FileStager("hardlink")
+    for i, split in enumerate(splits):
+        count = num_annotations // len(splits) + (i < num_annotations % len(splits))
+        coco = humanparts_coco(count, seed=seed + i)
+        raw_images_dir = root / "raw" / "images" / split
+        write_images(raw_images_dir, coco["images"], blobs)
+        with open(root / "raw" / f"person_humanparts_{split}.json", "w") as f:
+            json.dump(coco, f)
+
+        parts = parts_coco(coco)
+        (root / "coco" / "annotations").mkdir(parents=True, exist_ok=True)
+        with open(root / "coco" / "annotations" / f"instances_{split}.json", "w") as f:
+            json.dump(parts, f)
+
+        images_dir = root / "yolo" / "images" / split
+        labels_dir = root / "yolo" / "labels" / split
+        images_dir.mkdir(parents=True, exist_ok=True)
+        labels_dir.mkdir(parents=True, exist_ok=True)
+        for name, text in yolo_label_texts(parts).items():
+            stager.stage(raw_images_dir / name, images_dir / name)
+            with open(labels_dir / (os.path.splitext(name)[0] + ".txt"), "w") as f:
+                f.write(text)
+
+    data = {
+        "path": str(root / "yolo"),
+        **{split: f"images/{split}" for split in splits},
+        "names": {c["id"] - 1: c["name"] for c in CATEGORIES},
+    }
+    with open(root / "yolo" / "data.yaml", "w") as f:
+        yaml.dump(data, f)
+    return dirs
@@ -0,0 +1,220 @@
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from od_engine.utils.boxes import nms
+from od_engine.utils.serving import ExportedModel
+
+MAX_OVERLAP = 0.9  # OTX clips the overlap so the stride stays at least a tenth of a tile
+STAGES = ("tiling", "preprocess", "infer", "postprocess", "merge")
+
+
+def tile_rois(
+    height: int,
+    width: int,
+    tile_size: Sequence[int] = (400, 400),
+    overlap: float = 0.2,
+    with_full_img: bool = False,
+) -> np.ndarray:
+    """
+    Computes the tiles of an image with the rules of `OTXTileTransform`: tiles start every
+    ``tile_size * (1 - overlap)`` pixels and the last ones of a row or column are cut at the
+    image border.
+
+    Args:
+        height (int): The image height.
+        width (int): The image width.
+        tile_size (Sequence[int], optional): The tile height and width. Defaults to (400, 400).
+        overlap (float, optional): The overlap ratio of neighbouring tiles, clipped to
+            [0, 0.9]. Defaults to 0.2.
+        with_full_img (bool, optional): Whether the whole image is a tile too, first. Defaults
+            to False.
+
+    Returns:
+        np.ndarray: The T x 4 int64 xyxy tiles, row by row.
+    """
+    tile_h, tile_w = tile_size
+    overlap = min(max(overlap, 0.0), MAX_OVERLAP)
+    rows = np.arange(0, height, max(int(tile_h * (1 - overlap)), 1))
+    cols = np.arange(0, width, max(int(tile_w * (1 - overlap)), 1))
+    y1, x1 = (a.ravel() for a in np.meshgrid(rows, cols, indexing="ij"))
+    rois = np.stack(
+        [x1, y1, np.minimum(x1 + tile_w, width), np.minimum(y1 + tile_h, height)], axis=1
+    )
+    if with_full_img and not (len(rois) == 1 and rois[0].tolist() == [0, 0, width, height]):
+        rois = np.concatenate([np.int64([[0, 0, width, height]]), rois])
+    return rois.astype(np.int64)
+
+
+def tile_views(image: np.ndarray, rois: np.ndarray) -> List[np.ndarray]:
+    """Returns the tiles of an image as views sharing its memory, without copying pixels."""
+    return [image[y1:y2, x1:x2] for x1, y1, x2, y2 in rois.tolist()]
+
+
+class TiledDetector:
+    """
+    Detects on the overlapping tiles of high resolution images, as OTX models trained with
+    ``tile_config.enable_tiler`` do, so small objects keep their resolution.
+
+    The tiles are views of the image. Every batch of tiles is preprocessed by a thread pool
+    straight into one of two batch buffers while the model runs on the other one, so the
+    preprocessing of the next batch overlaps the inference of the current one. The detections
+    of the tiles are moved to image coordinates and merged with class-aware NMS, as
+    `DetectionTileMerge` does.
+
+    Args:
+        model (ExportedModel): The model, from `serving.load_model`.
+        tile_size (Sequence[int], optional): The tile height and width. Defaults to (400, 400).
+        overlap (float, optional): The overlap ratio of neighbouring tiles. Defaults to 0.2.
+        iou_threshold (float, optional): The IoU of the merging NMS. Defaults to 0.45.
+        max_num_instances (int, optional): The largest number of detections per image.
+            Defaults to 1500.
+        with_full_img (bool, optional): Whether the whole image is a tile too. Defaults to False.
+        batch_size (int, optional): The tiles per inference, capped at the static batch size of
+            the model, which partial batches are padded to. Defaults to 8.
+        workers (int, optional): The preprocessing threads. Defaults to 4.
+        confidence_threshold (float, optional): The smallest score kept. Defaults to None, the
+            threshold of the model.
+    """
+
+    def __init__(
+        self,
+        model: ExportedModel,
+        tile_size: Sequence[int] = (400, 400),
+        overlap: float = 0.2,
+        iou_threshold: float = 0.45,
+        max_num_instances: int = 1500,
+        with_full_img: bool = False,
+        batch_size: int = 8,
+        workers: int = 4,
+        confidence_threshold: Optional[float] = None,
+    ):
+        self.model = model
+        self.tile_size = tuple(tile_size)
+        self.overlap = overlap
+        self.iou_threshold = iou_threshold
+        self.max_num_instances = max_num_instances
+        self.with_full_img = with_full_img
+        self.batch_size = min(batch_size, model.max_batch_size or batch_size)
+        self.confidence_threshold = confidence_threshold
+        rows = model.batch_rows(self.batch_size)
+        self._buffers = np.zeros((2, rows, 3, *model.input_size), dtype=np.float32)
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix="tile")
+        self.reset_timings()
+
+    @classmethod
+    def from_tile_config(
+        cls, model: ExportedModel, tile_config: Dict[str, Any], **kwargs
+    ) -> "TiledDetector":
+        """
+        Builds a tiled detector with the tile size, overlap, NMS threshold, instance limit and
+        full image tile of the ``tile_config`` of an experiment config.
+
+        Args:
+            model (ExportedModel): The model.
+            tile_config (Dict[str, Any]): The ``data.tile_config`` of the config.
+            **kwargs: The other arguments of `TiledDetector`.
+
+        Returns:
+            TiledDetector: The detector.
+        """
+        keys = ("tile_size", "overlap", "iou_threshold", "max_num_instances", "with_full_img")
+        return cls(model, **{k: tile_config[k] for k in keys if k in tile_config}, **kwargs)
+
+    def reset_timings(self) -> None:
+        """Zeroes `timings` and the image and tile counts."""
+        self.timings = dict.fromkeys(STAGES, 0.0)
+        self.timings["preprocess_workers"] = 0.0
+        self.num_images = 0
+        self.num_tiles = 0
+
+    def _preprocess_tile(
+        self, tile: np.ndarray, out: np.ndarray
+    ) -> Tuple[Tuple[float, float], float]:
+        """Preprocesses a tile into a batch slot, returns its scales and seconds."""
+        started = time.perf_counter()
+        _, scale = self.model.preprocess(tile, out)
+        return scale, time.perf_counter() - started
+
+    def _submit(self, tiles: List[np.ndarray], buffer: np.ndarray) -> List[Future]:
+        """Starts the preprocessing of a batch of tiles into a buffer."""
+        return [
+            self._pool.submit(self._preprocess_tile, tile, buffer[i])
+            for i, tile in enumerate(tiles)
+        ]
+
+    def detect(self, image: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        Detects on the tiles of an image and merges their detections.
+
+        The wall seconds of every stage are added to `timings`: tiling, preprocessing not
+        hidden behind inference, inference, decoding of the tile detections, and the merging
+        NMS, with the seconds of the preprocessing threads as ``preprocess_workers``.
+
+        Args:
+            image (np.ndarray): The H x W x 3 uint8 BGR image.
+
+        Returns:
+            Dict[str, np.ndarray]: The x_min, y_min, x_max, y_max "boxes", the "scores" and the
+                "labels" in image pixels, by descending score.
+        """
+        clock = time.perf_counter()
+        rois = tile_rois(*image.shape[:2], self.tile_size, self.overlap, self.with_full_img)
+        tiles = tile_views(image, rois)
+        batches = [
+            (start, tiles[start : start + self.batch_size])
+            for start in range(0, len(tiles), self.batch_size)
+        ]
+        now = time.perf_counter()
+        self.timings["tiling"] += now - clock
+        self.num_images += 1
+        self.num_tiles += len(tiles)
+
+        # Batch b is preprocessed into buffer b % 2 while batch b - 1 runs on the other one
+        boxes, scores, labels = [], [], []
+        pending = self._submit(batches[0][1], self._buffers[0])
+        for b, (start, batch) in enumerate(batches):
+            current = pending
+            if b + 1 < len(batches):
+                pending = self._submit(batches[b + 1][1], self._buffers[(b + 1) % 2])
+            clock = time.perf_counter()
+            scales, seconds = zip(*(future.result() for future in current))
+            now = time.perf_counter()
+            self.timings["preprocess"] += now - clock
+            self.timings["preprocess_workers"] += sum(seconds)
+
+            outputs = self.model.infer(self._buffers[b % 2][: self.model.batch_rows(len(batch))])
+            clock, now = now, time.perf_counter()
+            self.timings["infer"] += now - clock
+
+            batch_rois = rois[start : start + len(batch)]
+            detections = self.model.postprocess(
+                outputs,
+                scales,
+                [(y2 - y1, x2 - x1) for x1, y1, x2, y2 in batch_rois.tolist()],
+                self.confidence_threshold,
+            )
+            for (x1, y1, _, _), tile_detections in zip(batch_rois.tolist(), detections):
+                boxes.append(tile_detections["boxes"] + np.float32([x1, y1, x1, y1]))
+                scores.append(tile_detections["scores"])
+                labels.append(tile_detections["labels"])
+            clock, now = now, time.perf_counter()
+            self.timings["postprocess"] += now - clock
+
+        boxes, scores = np.concatenate(boxes), np.concatenate(scores)
+        labels = np.concatenate(labels)
+        keep = nms(boxes, scores, self.iou_threshold, labels, self.max_num_instances)
+        self.timings["merge"] += time.perf_counter() - now
+        return {"boxes": boxes[keep], "scores": scores[keep], "labels": labels[keep]}
+
+    def close(self) -> None:
+        """Stops the preprocessing threads."""
+        self._pool.shutdown()
+
+    def __enter__(self) -> "TiledDetector":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()